@@ -2,6 +2,7 @@
 from dotenv import load_dotenv
 import os, re
 import redis
+import redis.asyncio
 load_dotenv()
 
 
@@ -17,6 +18,19 @@ class Settings():
     REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
     REDIS_DB = int(os.getenv("REDIS_DB", "0"))
 
+    CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", "64"))  # in-process extractor cache budget
+    CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "/tmp/multsaver/cache_snapshot.json.z")
+    CACHE_SNAPSHOT_INTERVAL = int(os.getenv("CACHE_SNAPSHOT_INTERVAL", "300"))  # seconds, 0 disables
+
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # per subsystem, e.g. "cache=WARNING,plagiarism=DEBUG"
+    LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")  # INFO/DEBUG keep-rate per subsystem, e.g. "request=0.1"
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+    LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))  # records buffered before dropping
+
+    DOWNLOAD_SLOTS_DISTRIBUTED = os.getenv("DOWNLOAD_SLOTS_DISTRIBUTED", "0") == "1"  # share pool limits across workers via Redis
+    EXECUTOR_THREADS = os.getenv("EXECUTOR_THREADS", "")  # per pool overrides, e.g. "extraction=32,ffmpeg=2"
+
     # Integrations 
     IP2WORLD_PROXY: str = os.getenv('IP2WORLD_PROXY')
     IP2WORLD_STICKY_PROXY: str = os.getenv('IP2WORLD_STICKY_PROXY')    
@@ -48,6 +62,9 @@ settings = Settings()
 
 redis_client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
 
+# Same server for code running on the event loop — never blocks it
+async_redis_client = redis.asyncio.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+
 
 DOWNLOAD_DIR='downloads'
 MAX_SIZE_LIMIT=50
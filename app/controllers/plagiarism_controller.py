@@ -12,9 +12,11 @@ from docx import Document
 from typing import List
 
 import traceback, requests, json
+from app.utils import log, executors
 
 
 router = APIRouter()
+_log = log.get_logger("plagiarism")
 
 CHUNK_SIZE = 300 
 
@@ -62,10 +64,10 @@ def google_search(query):
         
         # Log filtered results
         # print('Filtered results: ', [r.get('link', '') for r in filtered_results])s
-        print('Search API called ')
+        _log.debug('Search API called')
         return filtered_results
     except requests.RequestException as e:
-        print(f"Error fetching Google Search results: {e}")
+        _log.warning("Error fetching Google Search results: %s", e)
         return []
 
 
@@ -80,60 +82,39 @@ async def check_plagiarism_and_ai(file: UploadFile):
         file.file.seek(0)
 
         text = await preprocess.extract_file_text(file)
-        print('START REQUEST FILE NAME:  ', file_name, file_size)
+        _log.info('Checking file', extra={'file_name': file_name, 'file_size': file_size})
 
         text = plagiarism_service.clean_text(text) 
         if len(text) > 8000:       
             text = plagiarism_service.sample_text(text, strategy="smart", max_chars=8000)
 
 
-        all_results = []
         redis_urls_key = f'urls-{file_name}-{file_size}'
         redis_crawled_pages_key = f'crawled_pages-{file_name}-{file_size}'
         # Chunks for Google search
-        chunks_for_search = preprocess.smart_tfidf_chunks(text, 40, 5)
+        chunks_for_search = await executors.run("cpu_text", preprocess.smart_tfidf_chunks, text, 40, 5)
         # Chunks for comparison with crawled data
-        chunks_for_comparison = preprocess.simple_split_into_chunks(text)
+        chunks_for_comparison = await executors.run("cpu_text", preprocess.simple_split_into_chunks, text)
         # return chunks_for_comparison
 
         all_urls = json.loads(redis_client.get(redis_urls_key)) if redis_client.get(redis_urls_key) else  []
         if not all_urls:
             for chunk in chunks_for_search:
-                search_results = google_search(chunk)
+                search_results = await executors.run("blocking_io", google_search, chunk)
                 urls = [r['link'] for r in search_results[:3] if r.get('link')]
                 all_urls.extend(urls)
 
         # Remove duplicates while preserving order
         all_urls = list(dict.fromkeys(all_urls))
-        print('Urls: '  , all_urls)
+        _log.debug('Urls: %s', all_urls)
         redis_client.setex(redis_urls_key, 770, json.dumps(all_urls))
 
         crawled_pages = json.loads(redis_client.get(redis_crawled_pages_key)) if redis_client.get(redis_crawled_pages_key) else await crawler.crawl_urls(all_urls)
         redis_client.setex(redis_crawled_pages_key, 770, json.dumps(crawled_pages))
 
 
-        for page in iterate_crawled_pages(crawled_pages):
-            if not page.get('content'):
-                print('no content found! for URL: ', page['url'])
-                continue
-            
-            # print('preprocessed page content: ', page_content[:300])
-
-            for compare_chunk in chunks_for_comparison:
-                page_content = plagiarism_service.clean_text(page['content'])
-                similarity = similarity_calculation.find_matched_text(compare_chunk, page_content)
-                print(similarity)
-                if similarity > 0.67:
-                    all_results.append({
-                        "chunk": compare_chunk,
-                        "url": page['url'],
-                        "similarity": float(similarity),
-                        "title": page['title'],
-                        # "page_content": page_content
-                    })
-            
-            if len(all_results) >= 15:
-                break
+        # TF-IDF over every page is seconds of CPU — keep it off the event loop
+        all_results = await executors.run("cpu_text", compare_pages, crawled_pages, chunks_for_comparison)
 
         res = {
             'results': all_results,
@@ -162,7 +143,7 @@ async def ai_content_detection(file: UploadFile):
             text = plagiarism_service.sample_text(text, strategy="smart", max_chars=8000)
 
         # Detect AI content
-        ai_detection_result = ai_detection.detect(text)
+        ai_detection_result = await executors.run("blocking_io", ai_detection.detect, text)
         return JSONResponse(status_code=200, content=ai_detection_result)
     except Exception as e:
         tb = traceback.extract_tb(e.__traceback__)[0]
@@ -183,7 +164,34 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE) -> List[str]:
 
 def iterate_crawled_pages(crawled_pages):
     for page in crawled_pages:
-        yield page 
+        yield page
+
+
+def compare_pages(crawled_pages, chunks_for_comparison):
+    all_results = []
+    for page in iterate_crawled_pages(crawled_pages):
+        if not page.get('content'):
+            _log.debug('no content found! for URL: %s', page['url'])
+            continue
+        
+        # print('preprocessed page content: ', page_content[:300])
+
+        for compare_chunk in chunks_for_comparison:
+            page_content = plagiarism_service.clean_text(page['content'])
+            similarity = similarity_calculation.find_matched_text(compare_chunk, page_content)
+            _log.debug('similarity %s', similarity)
+            if similarity > 0.67:
+                all_results.append({
+                    "chunk": compare_chunk,
+                    "url": page['url'],
+                    "similarity": float(similarity),
+                    "title": page['title'],
+                    # "page_content": page_content
+                })
+        
+        if len(all_results) >= 15:
+            break
+    return all_results 
 
 
 
@@ -2,10 +2,15 @@ from fastapi import APIRouter, Request, Depends
 from app.services.tools.socials import instagram_service, youtube_service, facebook_service, x_service, yt_dlp_service, vk_service, tiktok_service
 from fastapi import HTTPException
 from app.utils.auth import authorize_user
+from app.utils import hot_urls
+from app.utils.request_body import json_payload
+from app.utils import log
 import traceback
 from app import config as  app_config
 from pydantic import BaseModel, field_validator
 
+_log = log.get_logger("social")
+
 class YoutubeURLRequest(BaseModel):
     url: str
     region: str
@@ -32,43 +37,59 @@ class TikTokVideoRequest(BaseModel):
 
 router = APIRouter()
 
+# Proactive cache refresh for the most requested URLs (see app/utils/hot_urls.py)
+hot_urls.register("instagram", instagram_service.refresh_video)
+hot_urls.register("youtube", youtube_service.refresh_video_info)
+hot_urls.register("youtube_audio", youtube_service.refresh_audio_url)
+hot_urls.register("facebook", facebook_service.refresh_video)
+hot_urls.register("x", x_service.refresh_video)
+hot_urls.register("tiktok", tiktok_service.refresh_video_info)
+
 # Instagram video download
 @router.post("/tools/social/instagram/video-download")
 async def instagram_download(request: Request, auth_data: dict = Depends(authorize_user)):
     
-    payload = await request.json()
+    payload = await json_payload(request)
     url = payload.get("url")
     if not url or not url.startswith("https://www.instagram.com"):
         raise HTTPException(status_code=400, detail="Invalid or missing Instagram URL.")
     
+    hot_urls.record("instagram", url)
     try:
     
         return await instagram_service.download_video(url, request)
+    except HTTPException:
+        raise
     except Exception as e:
             tb = traceback.format_exc()
-            print('Error:[instagram] ' , (e) , '\n ' , tb)
+            _log.error('instagram download failed: %s', e, exc_info=True)
             raise HTTPException(status_code=400, detail={"message": str(e), 'traceback': str(tb)})
 
 
 # Youtube videos download
 @router.post("/tools/social/youtube/video-download")
 async def youtube_download(request: YoutubeURLRequest, auth_data: dict = Depends(authorize_user)):
+    hot_urls.record("youtube", request.url, request.region)
     try:
         return await youtube_service.download_video(request.url, request.region)
+    except HTTPException:
+        raise
     except Exception as e:
         tb = traceback.format_exc()
-        print('Error:[youtube] ' , (e) , '\n ' , tb)
+        _log.error('youtube download failed: %s', e, exc_info=True)
         raise HTTPException(status_code=400, detail={"message": str(e), 'traceback': str(tb)})
 
 # Youtube videos download
 @router.post("/tools/social/youtube/audio-download")
 async def youtube_audio_download( request: YoutubeURLRequest,  auth_data: dict = Depends(authorize_user)):
-    
+    hot_urls.record("youtube_audio", request.url, request.region)
     try:
         return await youtube_service.get_audio_url(request.url, request.region)
+    except HTTPException:
+        raise
     except Exception as e:
         tb = traceback.format_exc()
-        print('Error:[youtube_audio] ' , (e) , '\n\n\n TRACEBACK ' , tb)
+        _log.error('youtube audio download failed: %s', e, exc_info=True)
         raise HTTPException(status_code=400, detail={"message": str(e), 'traceback': str(tb)})
 
 
@@ -76,17 +97,20 @@ async def youtube_audio_download( request: YoutubeURLRequest,  auth_data: dict =
 @router.post("/tools/social/facebook/video-download")
 async def facebook_dowbload(request: Request, auth_data: dict = Depends(authorize_user)):
     
-    payload = await request.json()
+    payload = await json_payload(request)
     url = payload.get("url")
     if not url or 'facebook.com' not in url:
         raise HTTPException(status_code=400, detail="Invalid or missing Facebook URL.")
     
     region = payload.get("region", 'us')
+    hot_urls.record("facebook", url, region)
     try:
         return await facebook_service.download_video(url, region, app_config.DOWNLOAD_DIR)
+    except HTTPException:
+        raise
     except Exception as e:
         tb = traceback.format_exc()
-        print('Error:[facebook] ' , (e) , '\n ' , tb)
+        _log.error('facebook download failed: %s', e, exc_info=True)
         raise HTTPException(status_code=400, detail={"message": str(e), 'traceback': str(tb)})
 
 
@@ -95,14 +119,17 @@ async def facebook_dowbload(request: Request, auth_data: dict = Depends(authoriz
 @router.post("/tools/social/x-twitter/video-download")
 async def facebook_dowbload(request: Request, auth_data: dict = Depends(authorize_user)):
     
-    payload = await request.json()
+    payload = await json_payload(request)
     url = payload.get("url")
+    hot_urls.record("x", url)
     try:
     
         return await x_service.download_video(url, request, app_config.DOWNLOAD_DIR)
+    except HTTPException:
+        raise
     except Exception as e:
         tb = traceback.format_exc()
-        print('Error:[X(twitter)] ' , (e) , '\n ' , tb)
+        _log.error('x download failed: %s', e, exc_info=True)
         raise HTTPException(status_code=400, detail={"message": str(e), 'traceback': str(tb)})
 
 
@@ -110,14 +137,16 @@ async def facebook_dowbload(request: Request, auth_data: dict = Depends(authoriz
 @router.post("/tools/social/vk/video-download")
 async def vk_dowbload(request: Request, auth_data: dict = Depends(authorize_user)):
     
-    payload = await request.json()
+    payload = await json_payload(request)
     url = payload.get("url")
     try:
     
         return await vk_service.download_video(url, request, app_config.DOWNLOAD_DIR)
+    except HTTPException:
+        raise
     except Exception as e:
         tb = traceback.format_exc()
-        print('Error:[VK platform] ' , (e) , '\n ' , tb)
+        _log.error('vk download failed: %s', e, exc_info=True)
         raise HTTPException(status_code=400, detail={"message": str(e), 'traceback': str(tb)})
 
 
@@ -126,7 +155,7 @@ async def vk_dowbload(request: Request, auth_data: dict = Depends(authorize_user
 @router.post("/download-video")
 async def get_user(request: Request, auth_data: dict = Depends(authorize_user)):
     try:
-        payload = await request.json()
+        payload = await json_payload(request)
         url = payload.get("url")
     
         return await yt_dlp_service.download_video(url, request)
@@ -138,7 +167,7 @@ async def get_user(request: Request, auth_data: dict = Depends(authorize_user)):
 @router.post("/get-video-info")
 async def get_user(request: Request, auth_data: dict = Depends(authorize_user)):
 
-    payload = await request.json()
+    payload = await json_payload(request)
     url = payload.get("url")
     try:
         return await yt_dlp_service.video_info(url)
@@ -165,9 +194,12 @@ async def instagram_account_stats(auth_data: dict = Depends(authorize_user)):
 async def tiktok_download(request: TikTokVideoRequest, http_request: Request, auth_data: dict = Depends(authorize_user)):
     try:
         base_url = str(http_request.base_url).rstrip('/')
+        hot_urls.record("tiktok", request.url, request.region, base_url)
         return await tiktok_service.video_info(request.url, request.region, base_url)
+    except HTTPException:
+        raise
     except Exception as e:
         tb = traceback.format_exc()
-        print('Error:[tiktok] ' , (e) , '\n ' , tb)
+        _log.error('tiktok download failed: %s', e, exc_info=True)
         raise HTTPException(status_code=400, detail={"message": str(e), 'traceback': str(tb)})
 
@@ -2,6 +2,9 @@
 import requests, random, re, httpx, subprocess, json
 from app.config import settings
 from bs4 import BeautifulSoup
+from app.utils import log
+
+_log = log.get_logger("plagiarism")
 
 
 
@@ -25,7 +28,7 @@ async def ai_content_detect(text: str):
 
     async with httpx.AsyncClient() as client:
         response = await client.post(url, json=payload, headers=headers)
-        print(response)
+        _log.debug('AI detection response: %s', response)
 
     if response.status_code != 200:
         raise Exception(f"Error: {response.status_code} - {response.text}")
@@ -122,7 +125,7 @@ def run_spider(urls, app):
             capture_output=True,
             text=True
         )
-        print(result.stdout)
+        _log.debug('Spider output: %s', result.stdout)
         if result.returncode != 0:
             raise Exception("Spider failed: " + result.stderr)
     
@@ -10,13 +10,16 @@ from nltk.corpus import stopwords
 import string, re
 # import faiss  # disabled
 import numpy as np
+from app.utils import log
+
+_log = log.get_logger("plagiarism")
 
 
 
 def find_matched_text(chunk, page_content):
     
     if chunk in page_content:
-        print('exact exists: ', chunk)
+        _log.debug('exact exists: %s', chunk)
         return 1.0
 
     sentences = preprocess.simple_split_into_chunks(page_content)
@@ -103,15 +106,14 @@ def compare_similarity(given_text, source_text):
             
             # Boost similarity based on containment ratio
             cosine_sim = min(1.0, cosine_sim + (containment_ratio * 0.5))
-            print(f"Chunk match in Content. Ratio: {containment_ratio:.2f}, Cosine Similarity: {cosine_sim:.4f}")
+            _log.debug("Chunk match in Content. Ratio: %.2f, Cosine Similarity: %.4f", containment_ratio, cosine_sim)
         
         # else:
             # print(f"Chunk is NOT fully contained in page_text. Cosine Similarity: {cosine_sim:.4f}")
 
         return cosine_sim
     except ValueError as e:
-        print(f"Vectorization error: {e}")
-        print('Given: ', given_text, ' source: ', source_text)
+        _log.warning("Vectorization error: %s", e, extra={"given": given_text, "source": source_text})
         return 0.0
 
 
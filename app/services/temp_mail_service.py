@@ -1,6 +1,7 @@
 import random, string, os, redis, imapclient
 from email import message_from_bytes
 from email.header import decode_header
+from app.utils import log
 
 
 TEMP_MAIL_DOMAIN = os.getenv("TEMP_MAIL_DOMAIN")
@@ -13,6 +14,7 @@ EMAIL_EXPIRY = int(os.getenv("EMAIL_EXPIRY", "600"))  # 10 minutes in seconds
 
 
 redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
+_log = log.get_logger("temp_mail")
 
 def generate_random_email(length: int = 7):
     prefix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
@@ -46,11 +48,11 @@ def fetch_emails(email: str):
 
         # Select the inbox folder
         select_info = imap_server.select_folder('INBOX')
-        print('%d messages in INBOX' % select_info[b'EXISTS'])
+        _log.debug('%d messages in INBOX', select_info[b'EXISTS'])
         
         # Search for all emails
         messages = imap_server.search(['TO', email])
-        print("%d messages from our best friend" % len(messages))
+        _log.debug("%d messages for %s", len(messages), email)
         emails = []
         
         for msgid, data in imap_server.fetch(messages, ['ENVELOPE', 'BODY[]']).items():
@@ -86,5 +88,5 @@ def fetch_emails(email: str):
         imap_server.logout()
         return emails
     except Exception as e:
-        print(f"Error fetching emails: {str(e)}")
+        _log.warning("Error fetching emails: %s", e)
         return []
\ No newline at end of file
@@ -1,6 +1,7 @@
 import asyncio
 import os
 import subprocess
+import time
 import uuid
 from dataclasses import dataclass
 from typing import Dict, List, Optional
@@ -9,6 +10,7 @@ import aiofiles
 import ffmpeg
 
 from app import config as app_config
+from app.utils import metrics, log, executors
 
 TEMP_DIR = "/tmp/multsaver"
 MAX_FILE_SIZE_BYTES = 200 * 1024 * 1024
@@ -52,6 +54,7 @@ class AudioJob:
 
 jobs: Dict[str, AudioJob] = {}
 _queue: asyncio.Queue = asyncio.Queue()
+_log = log.get_logger("audio")
 
 
 def cleanup(*paths: str) -> None:
@@ -84,18 +87,20 @@ async def _worker() -> None:
     while True:
         job: AudioJob = await _queue.get()
         job.status = JobStatus.PROCESSING
+        started = time.monotonic()
         try:
-            await asyncio.get_event_loop().run_in_executor(
-                None, _run_extraction, job.input_path, job.output_path, job.format, job.quality
+            await executors.run(
+                "ffmpeg", _run_extraction, job.input_path, job.output_path, job.format, job.quality
             )
             job.status = JobStatus.DONE
             cleanup(job.input_path)
         except Exception as e:
             job.status = JobStatus.ERROR
             job.error = str(e)
-            print(f"[audio] Error for job {job.job_id}:\n{e}")
+            _log.error("Error for job %s: %s", job.job_id, e)
             cleanup(job.input_path, job.output_path)
         finally:
+            metrics.media_job_duration.observe(time.monotonic() - started, "audio", job.status)
             _queue.task_done()
 
 
@@ -104,6 +109,9 @@ def start_workers() -> None:
         asyncio.create_task(_worker())
 
 
+metrics.media_queue_depth.set_collector(lambda: {("audio",): _queue.qsize()})
+
+
 async def enqueue(content: bytes, fmt: str, quality: str, base_url: str) -> AudioJob:
     os.makedirs(TEMP_DIR, exist_ok=True)
     os.makedirs(app_config.DOWNLOAD_DIR, exist_ok=True)
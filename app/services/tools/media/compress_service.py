@@ -2,6 +2,7 @@ import asyncio
 import os
 import shutil
 import subprocess
+import time
 import uuid
 from dataclasses import dataclass
 from typing import Dict, List, Optional
@@ -10,6 +11,7 @@ import aiofiles
 import ffmpeg
 
 from app import config as app_config
+from app.utils import metrics, log, executors
 
 TEMP_DIR = "/tmp/multsaver"
 MAX_FILE_SIZE_BYTES = 200 * 1024 * 1024
@@ -44,6 +46,7 @@ class Job:
 
 jobs: Dict[str, Job] = {}
 _queue: asyncio.Queue = asyncio.Queue()
+_log = log.get_logger("compress")
 
 
 def cleanup(*paths: str) -> None:
@@ -110,18 +113,20 @@ async def _worker() -> None:
     while True:
         job: Job = await _queue.get()
         job.status = JobStatus.PROCESSING
+        started = time.monotonic()
         try:
-            await asyncio.get_event_loop().run_in_executor(
-                None, _run_ffmpeg, job.input_path, job.output_path, job.preset, job.target_mb
+            await executors.run(
+                "ffmpeg", _run_ffmpeg, job.input_path, job.output_path, job.preset, job.target_mb
             )
             job.status = JobStatus.DONE
             cleanup(job.input_path)  # input no longer needed after compression
         except Exception as e:
             job.status = JobStatus.ERROR
             job.error = str(e)
-            print(f"[compress] Error for job {job.job_id}:\n{e}")
+            _log.error("Error for job %s: %s", job.job_id, e)
             cleanup(job.input_path, job.output_path)
         finally:
+            metrics.media_job_duration.observe(time.monotonic() - started, "compress", job.status)
             _queue.task_done()
 
 
@@ -130,6 +135,9 @@ def start_workers() -> None:
         asyncio.create_task(_worker())
 
 
+metrics.media_queue_depth.set_collector(lambda: {("compress",): _queue.qsize()})
+
+
 async def enqueue(content: bytes, preset: str, target_mb: Optional[int], base_url: str) -> Job:
     os.makedirs(TEMP_DIR, exist_ok=True)
     os.makedirs(app_config.DOWNLOAD_DIR, exist_ok=True)
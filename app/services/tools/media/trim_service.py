@@ -2,6 +2,7 @@ import asyncio
 import os
 import re
 import subprocess
+import time
 import uuid
 from dataclasses import dataclass
 from typing import Dict, List, Optional
@@ -9,6 +10,7 @@ from typing import Dict, List, Optional
 import aiofiles
 
 from app import config as app_config
+from app.utils import metrics, log, executors
 
 TEMP_DIR             = "/tmp/multsaver"
 MAX_FILE_SIZE_BYTES  = 500 * 1024 * 1024   # 500 MB
@@ -41,6 +43,7 @@ class TrimJob:
 
 jobs:   Dict[str, TrimJob] = {}
 _queue: asyncio.Queue      = asyncio.Queue()
+_log   = log.get_logger("trim")
 
 
 def validate_time(value: str) -> bool:
@@ -113,9 +116,10 @@ async def _worker() -> None:
     while True:
         job: TrimJob = await _queue.get()
         job.status = JobStatus.PROCESSING
+        started = time.monotonic()
         try:
-            await asyncio.get_event_loop().run_in_executor(
-                None, _run_trim,
+            await executors.run(
+                "ffmpeg", _run_trim,
                 job.input_path, job.output_path, job.start, job.end, job.mode,
             )
             job.status = JobStatus.DONE
@@ -123,9 +127,10 @@ async def _worker() -> None:
         except Exception as e:
             job.status = JobStatus.ERROR
             job.error  = str(e)
-            print(f"[trim] Error for job {job.job_id}:\n{e}")
+            _log.error("Error for job %s: %s", job.job_id, e)
             cleanup(job.input_path, job.output_path)
         finally:
+            metrics.media_job_duration.observe(time.monotonic() - started, "trim", job.status)
             _queue.task_done()
 
 
@@ -134,6 +139,9 @@ def start_workers() -> None:
         asyncio.create_task(_worker())
 
 
+metrics.media_queue_depth.set_collector(lambda: {("trim",): _queue.qsize()})
+
+
 async def enqueue(content: bytes, start: str, end: str, mode: str, base_url: str) -> TrimJob:
     os.makedirs(TEMP_DIR, exist_ok=True)
     os.makedirs(app_config.DOWNLOAD_DIR, exist_ok=True)
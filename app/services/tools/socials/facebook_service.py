@@ -1,9 +1,9 @@
 
-import instaloader, requests, os, math, yt_dlp, asyncio, json
+import instaloader, requests, os, math
 from urllib.parse import urlparse, parse_qs
 from fastapi import Request, HTTPException
 from app import config as app_config
-from app.utils import helper, monitor
+from app.utils import helper, singleflight, media_key, spans, proxy_meter, executors
 from app.utils.cache import cache
 from app.utils.concurrency import download_slot
 
@@ -12,19 +12,35 @@ from app.utils.concurrency import download_slot
 async def download_video(video_url, region, save_dir="downloads"):
 
     try:
-        cache_key = cache.make_key("facebook_video", video_url, region)
-        result = cache.get(cache_key)
+        cache_key = await media_key.make_key("facebook_video", video_url, region)
+        _fetch = lambda: _fetch_and_cache(video_url, region, cache_key)
+
+        with spans.span("cache"):
+            result = await cache.aget(cache_key)
         if result:
+            singleflight.refresh_ahead(cache_key, _fetch)
             return result
 
-        result = await video_info(video_url, region)
-        cache.set(cache_key, result)
-        return result
+        return await singleflight.run(cache_key, _fetch, distributed=True)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error {str(e)}")
 
 
+async def _fetch_and_cache(video_url, region: str, cache_key: str):
+    result = await video_info(video_url, region)
+    await cache.aset(cache_key, result)
+    return result
+
+
+async def refresh_video(video_url, region: str, window: float) -> bool:
+    """Hot-URL refresher: re-extract if the cached video expires within `window` seconds."""
+    cache_key = await media_key.make_key("facebook_video", video_url, region)
+    return await singleflight.refresh_if_expiring(cache_key, lambda: _fetch_and_cache(video_url, region, cache_key), window)
+
+
 async def video_info(url, region: str):
     try:
         ydl_opts = {
@@ -46,18 +62,15 @@ async def video_info(url, region: str):
             
 
         def _extract(url, opts):
-            with yt_dlp.YoutubeDL(opts) as ydl:
+            with proxy_meter.YoutubeDL(opts, region=region) as ydl:
                 return ydl.extract_info(url, download=False)
             
-        async with download_slot():
-            info = await asyncio.to_thread(_extract, url, ydl_opts)
-
-        try:
-            monitor.add_request_proxy_bytes(len(json.dumps(info, default=str).encode()))
-        except Exception:
-            pass
+        async with download_slot("facebook"):
+            with spans.span("extract_info"):
+                info = await executors.run("extraction", _extract, url, ydl_opts)
 
-        selected_format = next((f for f in info.get("formats", []) if f.get("format_id") == info.get("format_id")), None)
+        with spans.span("format_selection"):
+            selected_format = next((f for f in info.get("formats", []) if f.get("format_id") == info.get("format_id")), None)
         file_size = selected_format.get("filesize", 0) if selected_format else 0
         file_size_mb = round(file_size / (1024 * 1024), 2) if file_size else 0
 
@@ -71,6 +84,8 @@ async def video_info(url, region: str):
             'download_url':info['url'],
         }
         return video_details
+    except HTTPException:
+        raise
     except Exception as e:
         raise ValueError(f"[video_info]: {str(e)}")
 
@@ -18,6 +18,9 @@ except ImportError:
     Client = None
 
 from app import config as app_config
+from app.utils import log
+
+_log = log.get_logger("instagram")
 
 
 class AccountStatus:
@@ -67,17 +70,17 @@ class InstagramAccountManager:
                     username = os.getenv("INSTAGRAM_USERNAME")
                     password = os.getenv("INSTAGRAM_PASSWORD")
                     if username and password:
-                        print(f"[instagram] Loaded account: {username}")
+                        _log.info("Loaded account: %s", username)
                         self.accounts[username] = AccountStatus(username)
                 break
 
-            print(f"[instagram] Loaded account {account_num}: {username}")
+            _log.info("Loaded account %s: %s", account_num, username)
             self.accounts[username] = AccountStatus(username)
             account_num += 1
 
         if not self.accounts:
-            print("[instagram] No Instagram accounts configured in .env")
-            print("[instagram] Add INSTAGRAM_USERNAME and INSTAGRAM_PASSWORD to enable authenticated access")
+            _log.info("No Instagram accounts configured in .env")
+            _log.info("Add INSTAGRAM_USERNAME and INSTAGRAM_PASSWORD to enable authenticated access")
 
     def _get_session_file(self, username: str) -> str:
         """Get session file path for a username"""
@@ -118,7 +121,7 @@ class InstagramAccountManager:
     def _login_account(self, username: str, password: str) -> Optional[Client]:
         """Login to Instagram account with session management"""
         if not INSTAGRAPI_AVAILABLE:
-            print("[instagram] instagrapi not available")
+            _log.warning("instagrapi not available")
             return None
 
         try:
@@ -137,19 +140,19 @@ class InstagramAccountManager:
                     cl.load_settings(session_file)
                     # Verify session is still valid
                     cl.get_timeline_feed()
-                    print(f"[instagram] Loaded session for: {username}")
+                    _log.info("Loaded session for: %s", username)
                     return cl
                 except Exception as e:
-                    print(f"[instagram] Session invalid for {username}: {e}")
+                    _log.warning("Session invalid for %s: %s", username, e)
                     # Session expired, will login fresh
 
             # Fresh login
-            print(f"[instagram] Logging in: {username}")
+            _log.info("Logging in: %s", username)
             cl.login(username, password)
 
             # Save session for future use
             cl.dump_settings(session_file)
-            print(f"[instagram] Session saved for: {username}")
+            _log.info("Session saved for: %s", username)
 
             # Add small delay after login
             time.sleep(random.uniform(2, 4))
@@ -157,19 +160,19 @@ class InstagramAccountManager:
             return cl
 
         except ChallengeRequired as e:
-            print(f"[instagram] Challenge required for {username}: {e}")
+            _log.warning("Challenge required for %s: %s", username, e)
             self.accounts[username].is_healthy = False
             self.accounts[username].last_error = "Challenge required"
             return None
 
         except PleaseWaitFewMinutes as e:
-            print(f"[instagram] Rate limited for {username}: {e}")
+            _log.warning("Rate limited for %s: %s", username, e)
             self.accounts[username].requests_count = self.MAX_REQUESTS_PER_HOUR  # Max out quota
             self.accounts[username].last_error = "Rate limited"
             return None
 
         except Exception as e:
-            print(f"[instagram] Login failed for {username}: {e}")
+            _log.error("Login failed for %s: %s", username, e)
             self.accounts[username].ban_count += 1
             self.accounts[username].last_error = str(e)
 
@@ -187,7 +190,7 @@ class InstagramAccountManager:
         # Get healthy account
         username = self._get_healthy_account()
         if not username:
-            print("[instagram] No healthy accounts available")
+            _log.warning("No healthy accounts available")
             return None
 
         # Check if we already have a client for this account
@@ -210,7 +213,7 @@ class InstagramAccountManager:
 
         password = os.getenv(password_key)
         if not password:
-            print(f"[instagram] Password not found for {username}")
+            _log.warning("Password not found for %s", username)
             return None
 
         # Login
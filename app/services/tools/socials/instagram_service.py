@@ -1,12 +1,15 @@
 
-import instaloader, requests, os, math, yt_dlp
+import instaloader, requests, os, math, time
 from urllib.parse import urlparse, parse_qs
 from fastapi import Request, HTTPException
 from app import config as app_config
 from app.utils import helper
 from app.utils.concurrency import download_slot
 import asyncio
-from app.utils.cache import cache
+from app.utils.cache import cache, negative_cache, NEGATIVE_TTLS
+from app.utils import singleflight, media_key, spans, proxy_meter, log, executors
+
+_log = log.get_logger("instagram")
 
 try:
     from instagrapi import Client
@@ -15,17 +18,40 @@ try:
 except ImportError:
     INSTAGRAPI_AVAILABLE = False
     account_manager = None
-    print("[instagram] Warning: instagrapi not installed. Run: pip install instagrapi")
+    _log.warning("instagrapi not installed. Run: pip install instagrapi")
 
 os.environ['https_proxy'] = app_config.IP2WORLD_STICKY_PROXY
 
 
+# yt-dlp failures that will not change on retry, by NEGATIVE_TTLS class
+_NEGATIVE_PATTERNS = [
+    ("Age-restricted content", "age_restricted"),
+    ("Requested content is not available", "unavailable"),
+    ("This content isn't available", "unavailable"),
+]
+
+
+def _remember_failure(cache_key: str, message: str) -> None:
+    for pattern, error_class in _NEGATIVE_PATTERNS:
+        if pattern in message:
+            negative_cache.set(cache_key, message, ttl=NEGATIVE_TTLS[error_class])
+            return
+
+
 async def download_video(post_url, request: Request, save_dir="downloads"):
     """Download Instagram video - Optimized for speed"""
-    cache_key = cache.make_key("instagram_video", post_url)
-    result = cache.get(cache_key)
+    cache_key = await media_key.make_key("instagram_video", post_url)
+    _fetch = lambda: _fetch_and_cache(post_url, cache_key)
+
+    with spans.span("cache"):
+        result = await cache.aget(cache_key)
     if result:
+        singleflight.refresh_ahead(cache_key, _fetch)
         return result
+
+    failure = negative_cache.get(cache_key)
+    if failure:
+        raise ValueError(failure)
     # try:
     #     result = await asyncio.to_thread(instaloader_download_video, post_url)
     #     cache.set(cache_key, result)
@@ -34,22 +60,33 @@ async def download_video(post_url, request: Request, save_dir="downloads"):
     #     print(f"[instagram] Instaloader failed: {str(ex)}. Trying yt-dlp fallback...")
 
     try:
-        async with download_slot():
-            result = await asyncio.to_thread(download_video_with_ytdlp, post_url)
-        cache.set(cache_key, result)
-        return result
+        return await singleflight.run(cache_key, _fetch, distributed=True)
+    except HTTPException:
+        raise
     except Exception as ex:
-        print(f"[instagram] yt-dlp failed: {str(ex)}.")
+        _log.warning("yt-dlp failed: %s", ex)
 
-        
-        raise ValueError(
-            f"[instagram] Failed to download video from Instagram. " + str(ex) + ' '
-        )
+        message = f"[instagram] Failed to download video from Instagram. " + str(ex) + ' '
+        _remember_failure(cache_key, message)
+        raise ValueError(message)
 
    
 
 
 
+async def _fetch_and_cache(post_url, cache_key: str):
+    async with download_slot("instagram"):
+        result = await executors.run("extraction", download_video_with_ytdlp, post_url)
+    await cache.aset(cache_key, result)
+    return result
+
+
+async def refresh_video(post_url, window: float) -> bool:
+    """Hot-URL refresher: re-extract if the cached video expires within `window` seconds."""
+    cache_key = await media_key.make_key("instagram_video", post_url)
+    return await singleflight.refresh_if_expiring(cache_key, lambda: _fetch_and_cache(post_url, cache_key), window)
+
+
 def instaloader_download_video(post_url):
     """Download Instagram video using Instaloader (slow)"""
     L = instaloader.Instaloader()
@@ -90,7 +127,7 @@ def download_video_with_instagrapi(post_url):
 
         if not cl:
             # Try without authentication as fallback
-            print("[instagram] No authenticated accounts available, trying without login")
+            _log.info("No authenticated accounts available, trying without login")
             cl = Client()
             cl.delay_range = [0.5, 1]  # Reduced delay for speed
             if app_config.IP2WORLD_STICKY_PROXY:
@@ -131,7 +168,7 @@ def download_video_with_instagrapi(post_url):
         }
 
         auth_status = f"authenticated as {cl.username}" if hasattr(cl, 'username') and cl.username else "without authentication"
-        print(f"[instagram] Successfully extracted with instagrapi ({auth_status})")
+        _log.info("Successfully extracted with instagrapi (%s)", auth_status)
         return video_details
 
     except Exception as e:
@@ -147,13 +184,15 @@ def download_video_with_ytdlp(post_url):
             'skip_download': True,
         }
 
-        print(f"[instagram] Trying yt-dlp without authentication")
+        _log.info("Trying yt-dlp without authentication")
         if app_config.settings.prepare_proxy():
             ydl_opts['proxy'] = app_config.settings.prepare_proxy()
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        # Runs in a worker thread; executors.run copied the request context, so spans still apply
+        with spans.span("extract_info"), proxy_meter.YoutubeDL(ydl_opts, region="us") as ydl:
             info = ydl.extract_info(post_url, download=False)
 
+        format_started = time.perf_counter()
         video_url = None
         if 'formats' in info:
             # Combined formats: ext=mp4, protocol=https, format_note has no "DASH" or "only"
@@ -167,11 +206,12 @@ def download_video_with_ytdlp(post_url):
                 # Pick highest filesize (best quality combined)
                 best = max(combined, key=lambda x: x.get('filesize') or x.get('filesize_approx') or 0)
                 video_url = best.get('url')
-                print(f"[instagram] Selected combined format: {best.get('format_id')} ({best.get('ext')})")
+                _log.debug("Selected combined format: %s (%s)", best.get('format_id'), best.get('ext'))
 
         # Fallback: top-level url (yt-dlp selected a single format)
         if not video_url and 'url' in info:
             video_url = info['url']
+        spans.add("format_selection", (time.perf_counter() - format_started) * 1000)
 
         if not video_url:
             raise ValueError("Could not extract video URL from Instagram")
@@ -188,7 +228,7 @@ def download_video_with_ytdlp(post_url):
             "profile": info.get("uploader") or info.get("channel") or "Unknown",
         }
 
-        print(f"[instagram] Successfully extracted with yt-dlp")
+        _log.info("Successfully extracted with yt-dlp")
         return video_details
 
     except Exception as e:
@@ -207,7 +247,7 @@ def extract_reel_id(post_url):
     parsed_url = urlparse(post_url)
     path = parsed_url.path
     parts = path.strip("/").split("/")
-    if len(parts) >= 2 and parts[0] == "reel":
+    if len(parts) >= 2 and parts[0] in ("reel", "reels", "p", "tv"):
         return parts[1]
 
     return None
@@ -4,10 +4,13 @@ import os
 import glob
 import time
 import httpx
+from fastapi import HTTPException
 from app import config as app_config
-from app.utils.cache import cache
+from app.utils.cache import cache, negative_cache, NEGATIVE_TTLS
 from app.utils.concurrency import download_slot
-from app.utils import monitor
+from app.utils import singleflight, media_key, spans, proxy_meter, log
+
+_log = log.get_logger("tiktok")
 
 TIKTOK_MAX_DURATION = 120
 TIKTOK_FILE_TTL = 86400   # 24 hours on disk
@@ -29,6 +32,22 @@ BROWSER_HEADERS = {
 }
 
 
+# Failures that will not change on retry, by NEGATIVE_TTLS class.
+# Bot-check pages and proxy errors are transient and deliberately absent.
+_NEGATIVE_PATTERNS = [
+    ("Video too long", "too_long"),
+    ("Could not extract TikTok video ID", "invalid_url"),
+    ("itemStruct missing", "unavailable"),
+]
+
+
+def _remember_failure(cache_key: str, message: str) -> None:
+    for pattern, error_class in _NEGATIVE_PATTERNS:
+        if pattern in message:
+            negative_cache.set(cache_key, message, ttl=NEGATIVE_TTLS[error_class])
+            return
+
+
 def _extract_video_id(url: str):
     match = re.search(r'/video/(\d+)', url)
     return match.group(1) if match else None
@@ -37,12 +56,8 @@ def _extract_video_id(url: str):
 async def _get_video_id(url: str, proxy: str = None) -> str:
     vid = _extract_video_id(url)
     if not vid:
-        kwargs = {"follow_redirects": True, "timeout": 15, "headers": BROWSER_HEADERS}
-        if proxy:
-            kwargs["proxy"] = proxy
-        async with httpx.AsyncClient(**kwargs) as client:
-            r = await client.head(url)
-        vid = _extract_video_id(str(r.url))
+        resolved = await media_key.resolve_short_link(url, proxy=proxy, headers=BROWSER_HEADERS)
+        vid = _extract_video_id(resolved)
     if not vid:
         raise ValueError(f"Could not extract TikTok video ID from: {url}")
     return vid
@@ -103,127 +118,160 @@ def _proxies_to_try(region: str):
             continue
         seen.add(key)
         try:
-            yield f"proxy-{key}", app_config.settings.prepare_proxy(r)
+            yield f"proxy-{key}", r, app_config.settings.prepare_proxy(r)
         except ValueError:
             pass
-    yield "no-proxy", None
+    yield "no-proxy", None, None
 
 
 async def video_info(url: str, region: str, base_url: str = None):
     try:
-        cache_key = cache.make_key("tiktok_video", url, region)
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-
         proxy_for_id = None
         try:
             proxy_for_id = app_config.settings.prepare_proxy(region)
         except ValueError:
             pass
 
-        video_id = await _get_video_id(url, proxy=proxy_for_id)
-        canonical_url = f"https://www.tiktok.com/@i/video/{video_id}"
-        download_path = os.path.join(app_config.DOWNLOAD_DIR, f"tiktok_{video_id}.mp4")
+        cache_key = await media_key.make_key("tiktok_video", url, region, proxy=proxy_for_id, headers=BROWSER_HEADERS)
+        fetch = lambda: _fetch_video_info(url, region, base_url, cache_key)
 
-        # File already on disk — build result without re-scraping
-        if os.path.exists(download_path):
-            actual_size = os.path.getsize(download_path)
-            server_url = f"{base_url}/downloads/tiktok_{video_id}.mp4" if base_url else None
-            result = {
-                "message": "Video downloaded successfully",
-                "region": region,
-                "video_info": {
-                    "video_id": video_id,
-                    "size": actual_size,
-                    "size_in_mb": round(actual_size / (1024 * 1024), 2),
-                    "webpage_url": url,
-                    "video_url": server_url,
-                    "download_url": server_url,
-                }
+        with spans.span("cache"):
+            cached = await cache.aget(cache_key)
+        if cached:
+            singleflight.refresh_ahead(cache_key, fetch)
+            return cached
+
+        failure = negative_cache.get(cache_key)
+        if failure:
+            raise ValueError(failure)
+
+        try:
+            return await singleflight.run(cache_key, fetch, distributed=True)
+        except ValueError as e:
+            _remember_failure(cache_key, str(e))
+            raise
+
+    except (ValueError, HTTPException):
+        raise
+    except Exception as e:
+        raise ValueError(f"[tiktok] {str(e)}")
+
+
+async def refresh_video_info(url: str, region: str, base_url: str, window: float) -> bool:
+    """Hot-URL refresher: re-extract if the cached video info expires within `window` seconds."""
+    proxy_for_id = None
+    try:
+        proxy_for_id = app_config.settings.prepare_proxy(region)
+    except ValueError:
+        pass
+    cache_key = await media_key.make_key("tiktok_video", url, region, proxy=proxy_for_id, headers=BROWSER_HEADERS)
+    return await singleflight.refresh_if_expiring(
+        cache_key, lambda: _fetch_video_info(url, region, base_url, cache_key), window
+    )
+
+
+async def _fetch_video_info(url: str, region: str, base_url: str, cache_key: str):
+    proxy_for_id = None
+    try:
+        proxy_for_id = app_config.settings.prepare_proxy(region)
+    except ValueError:
+        pass
+
+    video_id = await _get_video_id(url, proxy=proxy_for_id)
+    canonical_url = f"https://www.tiktok.com/@i/video/{video_id}"
+    download_path = os.path.join(app_config.DOWNLOAD_DIR, f"tiktok_{video_id}.mp4")
+
+    # File already on disk — build result without re-scraping
+    if os.path.exists(download_path):
+        actual_size = os.path.getsize(download_path)
+        server_url = f"{base_url}/downloads/tiktok_{video_id}.mp4" if base_url else None
+        result = {
+            "message": "Video downloaded successfully",
+            "region": region,
+            "video_info": {
+                "video_id": video_id,
+                "size": actual_size,
+                "size_in_mb": round(actual_size / (1024 * 1024), 2),
+                "webpage_url": url,
+                "video_url": server_url,
+                "download_url": server_url,
             }
-            cache.set(cache_key, result, ttl=TIKTOK_CACHE_TTL)
-            return result
+        }
+        await cache.aset(cache_key, result, ttl=TIKTOK_CACHE_TTL)
+        return result
 
-        _cleanup_old_files()
+    _cleanup_old_files()
 
-        last_error = None
-        for label, proxy in _proxies_to_try(region):
-            try:
-                kwargs = {
-                    "timeout": httpx.Timeout(20, read=60),
-                    "headers": BROWSER_HEADERS,
-                    "follow_redirects": True,
-                }
-                if proxy:
-                    kwargs["proxy"] = proxy
+    last_error = None
+    for label, proxy_region, proxy in _proxies_to_try(region):
+        try:
+            kwargs = {
+                "timeout": httpx.Timeout(20, read=60),
+                "headers": BROWSER_HEADERS,
+                "follow_redirects": True,
+            }
 
-                async with download_slot():
-                    async with httpx.AsyncClient(**kwargs) as client:
-                        # Step 1: load page — sets tt_chain_token cookie
+            async with download_slot("tiktok"):
+                async with proxy_meter.async_client(region=proxy_region, proxy=proxy, **kwargs) as client:
+                    # Step 1: load page — sets tt_chain_token cookie
+                    with spans.span("extract_info"):
                         r = await client.get(canonical_url)
                         r.raise_for_status()
                         item = _parse_item(r.text)
 
-                        cdn_url = _extract_cdn_url(item)
-                        if not cdn_url:
-                            raise ValueError("No video URL found in page data")
+                    cdn_url = _extract_cdn_url(item)
+                    if not cdn_url:
+                        raise ValueError("No video URL found in page data")
 
-                        duration = item.get("video", {}).get("duration") or item.get("duration") or 0
-                        if duration > TIKTOK_MAX_DURATION:
-                            raise ValueError(f"Video too long ({duration}s). Max is {TIKTOK_MAX_DURATION}s.")
+                    duration = item.get("video", {}).get("duration") or item.get("duration") or 0
+                    if duration > TIKTOK_MAX_DURATION:
+                        raise ValueError(f"Video too long ({duration}s). Max is {TIKTOK_MAX_DURATION}s.")
 
-                        # Step 2: download with SAME client (cookies active)
+                    # Step 2: download with SAME client (cookies active)
+                    with spans.span("download"):
                         async with client.stream("GET", cdn_url) as dr:
                             dr.raise_for_status()
                             with open(download_path, "wb") as f:
                                 async for chunk in dr.aiter_bytes(chunk_size=1024 * 64):
                                     f.write(chunk)
 
-                print(f"[tiktok] Success with {label}")
-                actual_size = os.path.getsize(download_path) if os.path.exists(download_path) else 0
-                if actual_size:
-                    monitor.add_request_proxy_bytes(actual_size)
-
-                author = item.get("author") or {}
-                video = item.get("video", {})
-                cover = video.get("cover") or video.get("originCover") or ""
-                stats = item.get("stats") or {}
-                server_url = f"{base_url}/downloads/tiktok_{video_id}.mp4" if base_url else None
-
-                result = {
-                    "message": "Video downloaded successfully",
-                    "region": region,
-                    "video_info": {
-                        "title": item.get("desc") or "TikTok Video",
-                        "duration": duration,
-                        "video_id": video_id,
-                        "thumbnail": cover,
-                        "size": actual_size,
-                        "size_in_mb": round(actual_size / (1024 * 1024), 2) if actual_size else None,
-                        "webpage_url": url,
-                        "video_url": server_url,
-                        "download_url": server_url,
-                        "author": author.get("nickname") or author.get("uniqueId"),
-                        "play_count": stats.get("playCount"),
-                        "like_count": stats.get("diggCount"),
-                    }
-                }
-                cache.set(cache_key, result, ttl=TIKTOK_CACHE_TTL)
-                return result
+            _log.info("Success with %s", label)
+            actual_size = os.path.getsize(download_path) if os.path.exists(download_path) else 0
 
-            except ValueError:
-                raise
-            except Exception as e:
-                print(f"[tiktok] {label} failed: {e}")
-                last_error = e
-                if os.path.exists(download_path):
-                    os.remove(download_path)
-                continue
+            author = item.get("author") or {}
+            video = item.get("video", {})
+            cover = video.get("cover") or video.get("originCover") or ""
+            stats = item.get("stats") or {}
+            server_url = f"{base_url}/downloads/tiktok_{video_id}.mp4" if base_url else None
 
-        raise ValueError(f"All TikTok attempts failed: {last_error}")
+            result = {
+                "message": "Video downloaded successfully",
+                "region": region,
+                "video_info": {
+                    "title": item.get("desc") or "TikTok Video",
+                    "duration": duration,
+                    "video_id": video_id,
+                    "thumbnail": cover,
+                    "size": actual_size,
+                    "size_in_mb": round(actual_size / (1024 * 1024), 2) if actual_size else None,
+                    "webpage_url": url,
+                    "video_url": server_url,
+                    "download_url": server_url,
+                    "author": author.get("nickname") or author.get("uniqueId"),
+                    "play_count": stats.get("playCount"),
+                    "like_count": stats.get("diggCount"),
+                }
+            }
+            await cache.aset(cache_key, result, ttl=TIKTOK_CACHE_TTL)
+            return result
 
-    except ValueError:
-        raise
-    except Exception as e:
-        raise ValueError(f"[tiktok] {str(e)}")
\ No newline at end of file
+        except (ValueError, HTTPException):
+            raise
+        except Exception as e:
+            _log.warning("%s failed: %s", label, e)
+            last_error = e
+            if os.path.exists(download_path):
+                os.remove(download_path)
+            continue
+
+    raise ValueError(f"All TikTok attempts failed: {last_error}")
\ No newline at end of file
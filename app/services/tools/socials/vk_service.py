@@ -1,7 +1,10 @@
-import requests, os, yt_dlp, re, asyncio
+import requests, os, re, asyncio
 from fastapi import Request, HTTPException
 from app import config as app_config
 from app.utils.concurrency import download_slot
+from app.utils import singleflight, media_key, proxy_meter, log, executors
+
+_log = log.get_logger("vk")
 
 
 
@@ -15,11 +18,15 @@ async def download_video(video_url, request: Request, save_dir="downloads"):
         if not is_valid_vk_url(video_url):
             raise ValueError('Invalid VK video URL!')
 
-        print({'video_url': video_url})
+        _log.info("Video request", extra={"video_url": video_url})
 
-        v_info = await video_info(video_url)
+        # VK results are not cached, so only coalesce callers within this worker
+        key = await media_key.make_key("vk_video", video_url)
+        v_info = await singleflight.run(key, lambda: video_info(video_url))
         return v_info
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error: {str(e)}")
 
@@ -38,13 +45,13 @@ async def video_info(url):
         }
 
         def extract_info_async(url, ydl_opts):
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                print("[video_info] Starting scraping ⌛⌛")
+            with proxy_meter.YoutubeDL(ydl_opts) as ydl:
+                _log.debug("Starting scraping")
                 return ydl.extract_info(url, download=False)
 
-        async with download_slot():
-            info = await asyncio.wait_for(asyncio.to_thread(extract_info_async, url, ydl_opts), timeout=60)
-        print("[video_info] Scraping Completed ✅")
+        async with download_slot("vk"):
+            info = await asyncio.wait_for(executors.run("extraction", extract_info_async, url, ydl_opts), timeout=60)
+        _log.debug("Scraping completed")
 
         selected_format = next((f for f in info.get("formats", []) if f.get("format_id") == info.get("format_id")), None)
         file_size = selected_format.get("filesize", 0) if selected_format else 0
@@ -60,5 +67,7 @@ async def video_info(url):
         }
         return video_details
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise ValueError(f"[video_info]: {str(e)}")
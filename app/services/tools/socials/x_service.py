@@ -1,11 +1,12 @@
 
-import yt_dlp, re, asyncio
+import re, asyncio
 from urllib.parse import urlparse, parse_qs
 from fastapi import Request, HTTPException
 from app import config as app_config
 from app.utils.concurrency import download_slot
 import asyncio
 from app.utils.cache import cache
+from app.utils import singleflight, media_key, spans, proxy_meter, executors
 
 def is_valid_twitter_url(url: str) -> bool:
     pattern = r'^(https?:\/\/)?(www\.)?(twitter|x)\.com\/[A-Za-z0-9_]+\/status\/[0-9]+(\?.*)?$'
@@ -15,24 +16,39 @@ def is_valid_twitter_url(url: str) -> bool:
 async def download_video(video_url, request: Request, save_dir="downloads"):
 
     try:    
-        cache_key = cache.make_key("x_video", video_url)
-        cached_data = cache.get(cache_key)
+        cache_key = await media_key.make_key("x_video", video_url)
+        _fetch = lambda: _fetch_and_cache(video_url, cache_key)
+
+        with spans.span("cache"):
+            cached_data = await cache.aget(cache_key)
         if cached_data:
+            singleflight.refresh_ahead(cache_key, _fetch)
             return cached_data
 
         if not is_valid_twitter_url(video_url):
             raise ValueError('Invalid X (twitter) video URL!')
 
-        v_info = await video_info(video_url)
-
-        cache.set(cache_key, v_info)
-        return v_info
+        return await singleflight.run(cache_key, _fetch, distributed=True)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error {str(e)}")
 
 
 
+async def _fetch_and_cache(video_url, cache_key: str):
+    v_info = await video_info(video_url)
+    await cache.aset(cache_key, v_info)
+    return v_info
+
+
+async def refresh_video(video_url, window: float) -> bool:
+    """Hot-URL refresher: re-extract if the cached video expires within `window` seconds."""
+    cache_key = await media_key.make_key("x_video", video_url)
+    return await singleflight.refresh_if_expiring(cache_key, lambda: _fetch_and_cache(video_url, cache_key), window)
+
+
 def _normalize_url(url: str) -> str:
     """Normalize to twitter.com — yt-dlp's Twitter extractor is more stable with it."""
     return re.sub(r'https?://(www\.)?x\.com/', 'https://twitter.com/', url)
@@ -90,7 +106,7 @@ async def video_info(url, region: str = 'us'):
     ydl_opts = _build_ydl_opts(region)
 
     def _extract(u, opts):
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with proxy_meter.YoutubeDL(opts, region=region) as ydl:
             return ydl.extract_info(u, download=False)
 
     last_error = None
@@ -98,10 +114,12 @@ async def video_info(url, region: str = 'us'):
         if not attempt_url:
             continue
         try:
-            async with download_slot():
-                info = await asyncio.to_thread(_extract, attempt_url, ydl_opts)
+            async with download_slot("x"):
+                with spans.span("extract_info"):
+                    info = await executors.run("extraction", _extract, attempt_url, ydl_opts)
 
-            video_url, file_size = _pick_format(info)
+            with spans.span("format_selection"):
+                video_url, file_size = _pick_format(info)
             if not video_url:
                 last_error = "No video found in this tweet."
                 continue
@@ -118,6 +136,8 @@ async def video_info(url, region: str = 'us'):
         except asyncio.TimeoutError:
             last_error = "Request timed out."
             continue
+        except HTTPException:
+            raise
         except Exception as e:
             last_error = str(e)
             continue
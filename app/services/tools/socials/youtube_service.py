@@ -1,13 +1,11 @@
 import re
-import json
-import asyncio
-import httpx
 from fastapi import HTTPException
 from app import config as app_config
-from app.utils.cache import cache
+from app.utils.cache import cache, negative_cache, NEGATIVE_TTLS
 from app.utils.concurrency import download_slot
-from app.utils import monitor
-import yt_dlp
+from app.utils import singleflight, media_key, spans, proxy_meter, log, executors
+
+_log = log.get_logger("youtube")
 
 
 def _friendly_error(raw: str) -> str:
@@ -35,10 +33,47 @@ def _friendly_error(raw: str) -> str:
     return "Failed to retrieve video information. The video may be unavailable or restricted."
 
 
+# Friendly errors that are permanent enough to negative-cache, by NEGATIVE_TTLS class
+_NEGATIVE_CLASSES = {
+    "This video is age-restricted and cannot be downloaded without authentication.": "age_restricted",
+    "This video is members-only and cannot be downloaded.": "members_only",
+    "This video is unavailable — the YouTube account has been terminated.": "terminated",
+    "This video is no longer available.": "unavailable",
+    "This video is blocked in your region and cannot be downloaded.": "region_blocked",
+    "This video is unavailable or region-restricted.": "unavailable",
+    "This video is private and cannot be downloaded.": "private",
+}
+
+# oEmbed pre-check failures, keyed by their HTTPException detail
+_PRE_CHECK_CLASSES = {
+    "Video requires authentication": "private",
+    "Video not found": "not_found",
+}
+
+
+def _remember_failure(cache_key: str, raw: str, exc: Exception) -> None:
+    """Negative-cache a classified failure so retries fail fast with the same error."""
+    if isinstance(exc, HTTPException):
+        # Pre-check failures keep their detail dict, so a retry gets the same 400
+        error_class = _PRE_CHECK_CLASSES.get(exc.detail.get("detail")) if isinstance(exc.detail, dict) else None
+        if error_class:
+            negative_cache.set(cache_key, exc.detail, ttl=NEGATIVE_TTLS[error_class])
+        return
+    error_class = _NEGATIVE_CLASSES.get(_friendly_error(raw))
+    if error_class:
+        negative_cache.set(cache_key, raw, ttl=NEGATIVE_TTLS[error_class])
+
+
+def _raise_remembered(failure) -> None:
+    if isinstance(failure, dict):
+        raise HTTPException(status_code=400, detail=failure)
+    raise ValueError(failure)
+
+
 async def _pre_check_video(video_id: str) -> None:
     """Fast oEmbed pre-check — catches age-restricted, members-only, private, deleted before running yt-dlp."""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
+        async with proxy_meter.async_client(timeout=5.0) as client:
             resp = await client.get(
                 f"https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json"
             )
@@ -77,51 +112,69 @@ async def download_video(video_url: str, region: str):
 async def video_info(url, region: str):
     """Get video information using yt-dlp command line tool"""
     try:
-        cache_key = cache.make_key("youtube_video", url, region)
+        cache_key = await media_key.make_key("youtube_video", url, region)
+
+        fetch = lambda: _fetch_video_info(url, region, cache_key)
 
-        cached_data = cache.get(cache_key)
+        with spans.span("cache"):
+            cached_data = await cache.aget(cache_key)
         if cached_data:
+            singleflight.refresh_ahead(cache_key, fetch)
             return cached_data
 
-        video_id = extract_youtube_video_id(url)
-        if video_id:
-            await _pre_check_video(video_id)
-
-        options = {
-            "listformats": True,
-            "noplaylist": True,
-            "quiet": True,
-            'skip_download': True,
-            'legacy_server_connect': True,
-            'socket_timeout': 30,
-            'extractor_args': {'youtube': {'player_client': ['tv_embedded']}},
-            'js_runtimes': {'deno': {}},
-            'remote_components': ['ejs:npm'],
-        }
+        failure = negative_cache.get(cache_key)
+        if failure:
+            _raise_remembered(failure)
 
         try:
-            options['proxy'] = app_config.settings.prepare_proxy(region)
-            print(f"[youtube] Using proxy region={region}")
-        except ValueError:
-            pass
+            return await singleflight.run(cache_key, fetch, distributed=True)
+        except Exception as e:
+            _remember_failure(cache_key, str(e).split('\nTraceback')[0].strip(), e)
+            raise
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise ValueError(str(e).split('\nTraceback')[0].strip())
 
-        def _extract(url, opts):
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                return ydl.extract_info(url, download=False)
 
-        async with download_slot():
-            info = await asyncio.to_thread(_extract, url, options)
+async def _fetch_video_info(url, region: str, cache_key: str):
+    video_id = extract_youtube_video_id(url)
+    if video_id:
+        with spans.span("oembed"):
+            await _pre_check_video(video_id)
 
-        try:
-            monitor.add_request_proxy_bytes(len(json.dumps(info, default=str).encode()))
-        except Exception:
-            pass
+    options = {
+        "listformats": True,
+        "noplaylist": True,
+        "quiet": True,
+        'skip_download': True,
+        'legacy_server_connect': True,
+        'socket_timeout': 30,
+        'extractor_args': {'youtube': {'player_client': ['tv_embedded']}},
+        'js_runtimes': {'deno': {}},
+        'remote_components': ['ejs:npm'],
+    }
+
+    try:
+        options['proxy'] = app_config.settings.prepare_proxy(region)
+        _log.debug("Using proxy region=%s", region)
+    except ValueError:
+        pass
 
+    def _extract(url, opts):
+        with proxy_meter.YoutubeDL(opts, region=region) as ydl:
+            return ydl.extract_info(url, download=False)
+
+    async with download_slot("youtube"):
+        with spans.span("extract_info"):
+            info = await executors.run("extraction", _extract, url, options)
+
+    with spans.span("format_selection"):
         formats = info.get('formats', [])
         available_formats = []
 
         for fmt in formats:
-            
+        
             if not fmt.get('protocol') in ['https', 'http'] or fmt.get('audio_channels') is None or fmt.get('resolution') == 'audio only':
                 continue
 
@@ -143,28 +196,41 @@ async def video_info(url, region: str):
         sorted_formats = sorted(available_formats, key=lambda x: (x['filesize'] is None, x['filesize']))
         selected_format = sorted_formats[-1] if sorted_formats else None
 
-        result = {
-            'message': 'Video info retrieved successfully',
-            'region': region,
-            'video_info': {
-                "title": info.get("title"),
-                "duration": info.get("duration"),
-                "video_id": info.get("id"),
-                "size": selected_format.get('filesize') if selected_format else None,
-                "size_in_mb": round(selected_format.get('filesize') / (1024 * 1024), 2) if selected_format and selected_format.get('filesize') else None,
-                "thumbnail": info.get("thumbnail"),
-                'video_url': info.get('webpage_url'), 
-                'download_url': selected_format.get('url') if selected_format else None, 
-                'url': selected_format.get('url') if selected_format else None, 
-                'available_formats': sorted_formats
-            }
+    result = {
+        'message': 'Video info retrieved successfully',
+        'region': region,
+        'video_info': {
+            "title": info.get("title"),
+            "duration": info.get("duration"),
+            "video_id": info.get("id"),
+            "size": selected_format.get('filesize') if selected_format else None,
+            "size_in_mb": round(selected_format.get('filesize') / (1024 * 1024), 2) if selected_format and selected_format.get('filesize') else None,
+            "thumbnail": info.get("thumbnail"),
+            'video_url': info.get('webpage_url'), 
+            'download_url': selected_format.get('url') if selected_format else None, 
+            'url': selected_format.get('url') if selected_format else None, 
+            'available_formats': sorted_formats
         }
-        
-        cache.set(cache_key, result)
+    }
+    
+    await cache.aset(cache_key, result)
 
-        return result
-    except Exception as e:
-        raise ValueError(str(e).split('\nTraceback')[0].strip())
+    return result
+
+
+async def refresh_video_info(url, region: str, window: float) -> bool:
+    """Hot-URL refresher: re-extract if the cached video info expires within `window` seconds."""
+    video_id = extract_youtube_video_id(url)
+    if video_id:
+        url = f"https://www.youtube.com/watch?v={video_id}"
+    cache_key = await media_key.make_key("youtube_video", url, region)
+    return await singleflight.refresh_if_expiring(cache_key, lambda: _fetch_video_info(url, region, cache_key), window)
+
+
+async def refresh_audio_url(video_url: str, region: str, window: float) -> bool:
+    """Hot-URL refresher: re-extract if the cached audio URL expires within `window` seconds."""
+    cache_key = await media_key.make_key("youtube_audio", video_url, region)
+    return await singleflight.refresh_if_expiring(cache_key, lambda: _fetch_audio_info(video_url, region, cache_key), window)
 
 
 def extract_youtube_video_id(url: str) -> str | None:
@@ -179,65 +245,79 @@ def extract_youtube_video_id(url: str) -> str | None:
 async def get_audio_url(video_url: str, region: str):
     """Get audio URL using yt-dlp Python package"""
     try:
-        cache_key = cache.make_key("youtube_audio", video_url, region)
-        cached_data = cache.get(cache_key)
+        cache_key = await media_key.make_key("youtube_audio", video_url, region)
+        fetch = lambda: _fetch_audio_info(video_url, region, cache_key)
+
+        with spans.span("cache"):
+            cached_data = await cache.aget(cache_key)
         if cached_data:
+            singleflight.refresh_ahead(cache_key, fetch)
             return cached_data
-        
-        options = {
-            "format": "bestaudio/best",
-            "noplaylist": True,
-            "quiet": True,
-            'skip_download': True,
-            'legacy_server_connect': True,
-            'socket_timeout': 30,
-            'geo_bypass': True,
-            'geo_bypass_country': region if region else 'US',
-            'js_runtimes': {'deno': {}},
-            'remote_components': ['ejs:npm'],
-        }
 
-        try:
-            options['proxy'] = app_config.settings.prepare_proxy(region)
-        except ValueError:
-            pass
-
-        def _extract(url, opts):
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                return ydl.extract_info(url, download=False)
-
-        async with download_slot():
-            info = await asyncio.to_thread(_extract, video_url, options)
+        failure = negative_cache.get(cache_key)
+        if failure:
+            _raise_remembered(failure)
 
         try:
-            monitor.add_request_proxy_bytes(len(json.dumps(info, default=str).encode()))
-        except Exception:
-            pass
-
-        audio_url = info.get('url')
-        if not audio_url:
-            raise ValueError("Audio URL not found in the extracted information.")
-
-        http_headers = info.get('http_headers', {})
-
-        audio_details = {
-            "title": info.get("title"),
-            "duration": info.get("duration"),
-            "video_id": info.get("id"),
-            "size": None,
-            "size_in_mb": None,
-            "thumbnail": info.get("thumbnail"),
-            'audio_url': audio_url,
-            'download_url': audio_url,
-            'http_headers': http_headers,
-            'warning': 'Audio URL expires in 5-6 hours. Use http_headers when accessing.',
-            'webpage_url': info.get('webpage_url')
-        }
-        cache.set(cache_key, audio_details)
-        return audio_details
+            return await singleflight.run(cache_key, fetch, distributed=True)
+        except Exception as e:
+            _remember_failure(cache_key, re.sub(r'\x1b\[[0-9;]*m', '', str(e)).split('\nTraceback')[0].strip(), e)
+            raise
 
+    except HTTPException:
+        raise
     except Exception as e:
         msg = re.sub(r'\x1b\[[0-9;]*m', '', str(e)).split('\nTraceback')[0].strip()
         raise Exception(_friendly_error(msg) if _friendly_error(msg) else msg)
 
 
+async def _fetch_audio_info(video_url: str, region: str, cache_key: str):
+    options = {
+        "format": "bestaudio/best",
+        "noplaylist": True,
+        "quiet": True,
+        'skip_download': True,
+        'legacy_server_connect': True,
+        'socket_timeout': 30,
+        'geo_bypass': True,
+        'geo_bypass_country': region if region else 'US',
+        'js_runtimes': {'deno': {}},
+        'remote_components': ['ejs:npm'],
+    }
+
+    try:
+        options['proxy'] = app_config.settings.prepare_proxy(region)
+    except ValueError:
+        pass
+
+    def _extract(url, opts):
+        with proxy_meter.YoutubeDL(opts, region=region) as ydl:
+            return ydl.extract_info(url, download=False)
+
+    async with download_slot("youtube"):
+        with spans.span("extract_info"):
+            info = await executors.run("extraction", _extract, video_url, options)
+
+    audio_url = info.get('url')
+    if not audio_url:
+        raise ValueError("Audio URL not found in the extracted information.")
+
+    http_headers = info.get('http_headers', {})
+
+    audio_details = {
+        "title": info.get("title"),
+        "duration": info.get("duration"),
+        "video_id": info.get("id"),
+        "size": None,
+        "size_in_mb": None,
+        "thumbnail": info.get("thumbnail"),
+        'audio_url': audio_url,
+        'download_url': audio_url,
+        'http_headers': http_headers,
+        'warning': 'Audio URL expires in 5-6 hours. Use http_headers when accessing.',
+        'webpage_url': info.get('webpage_url')
+    }
+    await cache.aset(cache_key, audio_details)
+    return audio_details
+
+
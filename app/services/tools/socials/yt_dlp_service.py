@@ -1,5 +1,6 @@
 from fastapi import Request, HTTPException
-from yt_dlp import YoutubeDL
+from app.utils.proxy_meter import YoutubeDL
+from app.utils import log
 import os, json, re, uuid, math
 from datetime import datetime
 from pydantic import BaseModel
@@ -16,6 +17,8 @@ from app.config import (
     IP2WORLD_PROXY
 )
 
+_log = log.get_logger("yt_dlp")
+
 VALID_VIDEO_DOMAINS = re.compile(r"^(https?:\/\/)?(www\.)?"
                                 r"(facebook\.com|fb\.watch|instagram\.com|instagr\.am|youtube\.com|youtu\.be)", re.IGNORECASE)
 
@@ -49,7 +52,7 @@ async def download_video(video_url, request: Request):
             "format": 'best',
             # "quiet": False,
             "outtmpl": f"{DOWNLOAD_DIR}/{datetime.today().strftime('%Y-%m-%d')}-{str(uuid.uuid4())[:8]}.%(ext)s",
-            'progress_hooks': [lambda d: print(f"Status: {d['status']}, Downloaded: {d.get('downloaded_bytes', 0)} bytes")],
+            'progress_hooks': [lambda d: _log.debug("Status: %s, Downloaded: %s bytes", d['status'], d.get('downloaded_bytes', 0))],
             # "postprocessors": [
             #     {
             #         "key": "FFmpegVideoConvertor",
@@ -60,12 +63,11 @@ async def download_video(video_url, request: Request):
 
         # Download the video
         with YoutubeDL(ydl_opts) as ydl:
-            print('Start Downloader: ⏳⏳')
+            _log.debug('Start downloader')
             info = ydl.extract_info(video_url, download=True)
             file_path = ydl.prepare_filename(info)
-            print('Start Downloader: ⏳⏳')
 
-            print('file_path: ', file_path)
+            _log.debug('file_path: %s', file_path)
             # Process file name
             file_name = os.path.basename(file_path)
  
@@ -98,9 +100,9 @@ def video_info(url):
             "list-formats": True
         }
         with YoutubeDL(ydl_opts) as ydl:
-            print('Starting scraping ⌛⌛')
+            _log.debug('Starting scraping')
             info = ydl.extract_info(url, download=False)
-            print('Scraping Completed ✅')
+            _log.debug('Scraping completed')
 
         
         selected_format = next((f for f in info.get("formats", []) if f.get("format_id") == info.get("format_id")), None)
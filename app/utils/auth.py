@@ -7,6 +7,7 @@ import os
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.user import User
+from app.utils import spans
 
 # Print the value to verify it's being read correctly
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -69,7 +70,8 @@ async def authorize_user(authorization: str = Header(None), db: Session = Depend
                 detail="Invalid token payload"
             )
         # Verify user still exists in database
-        user = db.query(User).filter(User.username == username).first()
+        with spans.span("auth"):
+            user = db.query(User).filter(User.username == username).first()
         if user is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,12 +1,33 @@
+import os
 import time
+import json
+import asyncio
+import zlib
+import heapq
 import hashlib
+from collections import OrderedDict
 from typing import Any, Optional
 from threading import Lock
+from app.config import redis_client as _r, async_redis_client as _ar, settings
+from app.utils import cdn_expiry, metrics, log, executors
+
+_log = log.get_logger("cache")
 
 
 class MemoryCache:
     """
-    Thread-safe in-memory cache with TTL expiration.
+    Thread-safe in-memory LRU cache with TTL expiration and a memory budget.
+
+    Entries live in an OrderedDict kept in recency order (most recently used
+    last), so get/set/delete and LRU eviction are all O(1). Expiry times are
+    tracked in a min-heap that is drained lazily, so expired entries are
+    reclaimed in amortised O(log n) without ever scanning the whole cache.
+
+    Each entry is charged its approximate serialized size. The cache evicts
+    least recently used entries to stay under both max_size entries and
+    max_bytes, and refuses single values larger than max_item_bytes.
+    Hits, misses, evictions, entries and bytes are counted per key namespace
+    (the prefix make_key() puts before the ":").
 
     Usage:
         from app.utils.cache import cache
@@ -24,22 +45,29 @@ class MemoryCache:
         key = cache.make_key("youtube", url, region)
     """
 
-    def __init__(self, default_ttl: int = 900, max_size: int = 1000):
+    def __init__(self, default_ttl: int = 900, max_size: int = 1000, max_bytes: int = None, max_item_bytes: int = None):
         """
         Initialize cache.
 
         Args:
             default_ttl: Default time-to-live in seconds (default: 900 = 15 minutes)
             max_size: Maximum number of items to store (default: 1000)
+            max_bytes: Memory budget across all items in bytes (default: unlimited)
+            max_item_bytes: Largest single value accepted in bytes (default: max_bytes / 10)
         """
-        self._cache: dict[str, tuple[Any, float, int]] = {}  # key -> (value, timestamp, ttl)
+        self._cache: OrderedDict[str, tuple[Any, float, int]] = OrderedDict()  # key -> (value, expires_at, size)
+        self._expiry: list[tuple[float, str]] = []  # min-heap of (expires_at, key), may hold stale pairs
         self._default_ttl = default_ttl
         self._max_size = max_size
+        self._max_bytes = max_bytes
+        self._max_item_bytes = max_item_bytes or (max_bytes // 10 if max_bytes else None)
+        self._bytes = 0
+        self._stats: dict[str, dict[str, int]] = {}
         self._lock = Lock()
 
     def get(self, key: str) -> Optional[Any]:
         """
-        Get value from cache if not expired.
+        Get value from cache if not expired and mark it as recently used.
 
         Args:
             key: Cache key
@@ -48,19 +76,25 @@ class MemoryCache:
             Cached value or None if not found/expired
         """
         with self._lock:
-            if key not in self._cache:
+            stats = self._ns_stats(key)
+            entry = self._cache.get(key)
+            if entry is None:
+                stats["misses"] += 1
                 return None
 
-            value, timestamp, ttl = self._cache[key]
+            value, expires_at, _ = entry
 
-            if time.time() - timestamp >= ttl:
-                # Expired, remove it
-                del self._cache[key]
+            if time.time() >= expires_at:
+                # Expired, remove it (its heap pair is dropped lazily)
+                self._remove(key)
+                stats["misses"] += 1
                 return None
 
+            self._cache.move_to_end(key)
+            stats["hits"] += 1
             return value
 
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+    def set(self, key: str, value: Any, ttl: Optional[int] = None, size: Optional[int] = None) -> bool:
         """
         Set value in cache with TTL.
 
@@ -68,20 +102,43 @@ class MemoryCache:
             key: Cache key
             value: Value to cache
             ttl: Time-to-live in seconds (uses default if not specified)
+            size: Serialized size of value in bytes, if the caller already knows it
+
+        Returns:
+            False if the value was rejected for exceeding max_item_bytes
         """
         if ttl is None:
             ttl = self._default_ttl
+        if size is None:
+            size = approx_size(value)
 
-        with self._lock:
-            # Cleanup if we're at max size
-            if len(self._cache) >= self._max_size:
-                self._cleanup_expired()
-
-                # If still at max size, remove oldest entries
-                if len(self._cache) >= self._max_size:
-                    self._remove_oldest(len(self._cache) - self._max_size + 1)
+        now = time.time()
+        expires_at = now + ttl
 
-            self._cache[key] = (value, time.time(), ttl)
+        with self._lock:
+            if key in self._cache:
+                self._remove(key)
+
+            if self._max_item_bytes and size > self._max_item_bytes:
+                self._ns_stats(key)["rejected"] += 1
+                return False
+
+            if len(self._cache) >= self._max_size or self._over_budget(size):
+                # Reclaim expired entries first, then fall back to LRU eviction
+                self._cleanup_expired(now)
+                while self._cache and (len(self._cache) >= self._max_size or self._over_budget(size)):
+                    oldest = next(iter(self._cache))
+                    self._remove(oldest)
+                    self._ns_stats(oldest)["evictions"] += 1
+
+            self._cache[key] = (value, expires_at, size)
+            self._bytes += size
+            stats = self._ns_stats(key)
+            stats["entries"] += 1
+            stats["bytes"] += size
+            heapq.heappush(self._expiry, (expires_at, key))
+            self._compact_heap()
+            return True
 
     def delete(self, key: str) -> bool:
         """
@@ -95,7 +152,7 @@ class MemoryCache:
         """
         with self._lock:
             if key in self._cache:
-                del self._cache[key]
+                self._remove(key)
                 return True
             return False
 
@@ -103,6 +160,10 @@ class MemoryCache:
         """Clear all cached data."""
         with self._lock:
             self._cache.clear()
+            self._expiry.clear()
+            self._bytes = 0
+            for stats in self._stats.values():
+                stats["entries"] = stats["bytes"] = 0
 
     def exists(self, key: str) -> bool:
         """Check if key exists and is not expired."""
@@ -113,6 +174,43 @@ class MemoryCache:
         with self._lock:
             return len(self._cache)
 
+    def bytes_used(self) -> int:
+        """Return approximate bytes held by cached items."""
+        with self._lock:
+            return self._bytes
+
+    def items(self) -> list[tuple[str, Any, float]]:
+        """Snapshot of live entries as (key, value, expires_at), least recently used first."""
+        with self._lock:
+            entries = list(self._cache.items())  # copied under the lock, filtered outside it
+        now = time.time()
+        return [(k, v, exp) for k, (v, exp, _) in entries if exp > now]
+
+    def ttl_remaining(self, key: str) -> Optional[float]:
+        """Seconds until key expires, or None if not cached. Does not count as a use."""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            remaining = entry[1] - time.time()
+            return remaining if remaining > 0 else None
+
+    def stats(self) -> dict:
+        """
+        Occupancy and counters, overall and per namespace.
+
+        Returns:
+            {"entries", "bytes", "max_entries", "max_bytes", "namespaces": {ns: {...}}}
+        """
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "bytes": self._bytes,
+                "max_entries": self._max_size,
+                "max_bytes": self._max_bytes,
+                "namespaces": {ns: dict(s) for ns, s in self._stats.items()},
+            }
+
     def cleanup(self) -> int:
         """
         Remove all expired entries.
@@ -121,32 +219,47 @@ class MemoryCache:
             Number of entries removed
         """
         with self._lock:
-            return self._cleanup_expired()
-
-    def _cleanup_expired(self) -> int:
-        """Remove expired entries (internal, no lock)."""
-        current_time = time.time()
-        expired_keys = [
-            k for k, (_, ts, ttl) in self._cache.items()
-            if current_time - ts >= ttl
-        ]
-        for k in expired_keys:
-            del self._cache[k]
-        return len(expired_keys)
-
-    def _remove_oldest(self, count: int) -> None:
-        """Remove oldest entries (internal, no lock)."""
-        if count <= 0:
+            return self._cleanup_expired(time.time())
+
+    def _over_budget(self, incoming: int) -> bool:
+        return bool(self._max_bytes) and self._bytes + incoming > self._max_bytes
+
+    def _ns_stats(self, key: str) -> dict[str, int]:
+        """Counters for the key's namespace (internal, no lock)."""
+        namespace = key.split(":", 1)[0] if ":" in key else "default"
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = {
+                "hits": 0, "misses": 0, "evictions": 0, "rejected": 0, "entries": 0, "bytes": 0,
+            }
+        return stats
+
+    def _remove(self, key: str) -> None:
+        """Drop an entry and its accounting (internal, no lock)."""
+        _, _, size = self._cache.pop(key)
+        self._bytes -= size
+        stats = self._ns_stats(key)
+        stats["entries"] -= 1
+        stats["bytes"] -= size
+
+    def _cleanup_expired(self, now: float) -> int:
+        """Pop expired entries off the expiry heap (internal, no lock)."""
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._cache.get(key)
+            # Skip stale heap pairs left behind by overwrites, deletes and evictions
+            if entry is not None and entry[1] == expires_at:
+                self._remove(key)
+                removed += 1
+        return removed
+
+    def _compact_heap(self) -> None:
+        """Rebuild the expiry heap once stale pairs dominate it (internal, no lock)."""
+        if len(self._expiry) <= 2 * max(len(self._cache), self._max_size):
             return
-
-        # Sort by timestamp and remove oldest
-        sorted_items = sorted(
-            self._cache.items(),
-            key=lambda x: x[1][1]  # Sort by timestamp
-        )
-
-        for key, _ in sorted_items[:count]:
-            del self._cache[key]
+        self._expiry = [(expires_at, key) for key, (_, expires_at, _) in self._cache.items()]
+        heapq.heapify(self._expiry)
 
     @staticmethod
     def make_key(*args) -> str:
@@ -157,11 +270,343 @@ class MemoryCache:
             *args: Values to include in the key
 
         Returns:
-            MD5 hash string as cache key
+            "<namespace>:<md5>" string as cache key, where the namespace is the first value
         """
         key_string = ":".join(str(arg) for arg in args)
-        return hashlib.md5(key_string.encode()).hexdigest()
+        return f"{args[0]}:{hashlib.md5(key_string.encode()).hexdigest()}"
+
+
+def approx_size(value: Any) -> int:
+    """Approximate JSON-serialized size of a value in bytes, without serializing it."""
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, dict):
+        return 2 + sum(len(str(k)) + 4 + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 2 + sum(approx_size(v) + 1 for v in value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 8
+
+
+def _encode(value: Any) -> bytes:
+    """A value as stored in L2: zlib-compressed compact JSON."""
+    return zlib.compress(json.dumps(value, separators=(",", ":"), default=str).encode(), 6)
+
+
+# Default TTL (seconds) per key namespace, used when set() is called without ttl
+NAMESPACE_TTLS = {
+    "youtube_video": 900,
+    "youtube_audio": 900,
+    "tiktok_video": 82800,
+    "facebook_video": 900,
+    "x_video": 900,
+    "instagram_video": 900,
+    "short_link": 86400,
+}
+
+L2_PREFIX = "cache:"
+
+
+class TieredCache:
+    """
+    Two-tier cache: per-process MemoryCache (L1) in front of shared Redis (L2).
+
+    Values are stored in Redis as zlib-compressed JSON, so one extraction is
+    shared by every uvicorn worker and survives restarts. An L2 hit fills L1
+    with the remaining Redis TTL. Redis errors are logged and treated as a
+    miss — the cache never fails a request. Values too large for the L1
+    memory budget are kept in L2 only.
 
+    TTLs are capped by the expiry embedded in any signed CDN link inside the
+    value (see cdn_expiry), so an entry never outlives the URLs it hands out.
 
-# Global cache instance with default settings
-cache = MemoryCache(default_ttl=900, max_size=1000)
+    Two APIs over the same data:
+      - get/set/delete: synchronous and thread-safe, for code running inside
+        executor threads (app/utils/executors.py). Uses the blocking Redis client.
+      - aget/aset/adelete/get_or_compute: for coroutines. L2 goes through
+        redis.asyncio, so Redis latency never blocks the event loop. L1 work
+        is O(1) under its lock, so it is done inline; encoding a value for
+        L2 runs on the cpu_text executor.
+
+    Usage:
+        data = await cache.aget(key)
+        await cache.aset(key, data)
+        data = await cache.get_or_compute(key, lambda: extract(url))
+    """
+
+    def __init__(self, l1: MemoryCache, redis_client, async_redis_client=None, default_ttl: int = 900, namespace_ttls: dict[str, int] = None):
+        self.l1 = l1
+        self._r = redis_client
+        self._ar = async_redis_client
+        self._default_ttl = default_ttl
+        self._namespace_ttls = namespace_ttls or {}
+        self._l2_hits: dict[str, int] = {}
+        self.redis_errors = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.l1.get(key)
+        if value is not None:
+            return value
+
+        try:
+            pipe = self._r.pipeline(transaction=False)
+            pipe.get(L2_PREFIX + key)
+            pipe.pttl(L2_PREFIX + key)
+            raw, pttl = pipe.execute()
+        except Exception as e:
+            self.redis_errors += 1
+            _log.warning("Redis error on get: %s", e)
+            return None
+
+        return self._fill_from_l2(key, raw, pttl)
+
+    def _fill_from_l2(self, key: str, raw: Optional[bytes], pttl: Optional[int]) -> Optional[Any]:
+        """Decode an L2 hit and copy it into L1 for its remaining TTL."""
+        if raw is None:
+            return None
+        try:
+            payload = zlib.decompress(raw)
+            value = json.loads(payload)
+        except Exception:
+            return None
+
+        namespace = key.split(":", 1)[0]
+        self._l2_hits[namespace] = self._l2_hits.get(namespace, 0) + 1
+        if pttl and pttl > 0:
+            self.l1.set(key, value, ttl=pttl / 1000, size=len(payload))
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        ttl = self._store_l1(key, value, ttl)
+        if ttl is None:
+            return
+
+        try:
+            self._r.set(L2_PREFIX + key, _encode(value), px=max(1, int(ttl * 1000)))
+        except Exception as e:
+            self.redis_errors += 1
+            _log.warning("Redis error on set: %s", e)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        value = self.l1.get(key)
+        if value is not None:
+            return value
+
+        try:
+            async with self._ar.pipeline(transaction=False) as pipe:
+                pipe.get(L2_PREFIX + key)
+                pipe.pttl(L2_PREFIX + key)
+                raw, pttl = await pipe.execute()
+        except Exception as e:
+            self.redis_errors += 1
+            _log.warning("Redis error on aget: %s", e)
+            return None
+
+        return self._fill_from_l2(key, raw, pttl)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        ttl = self._store_l1(key, value, ttl)
+        if ttl is None:
+            return
+
+        payload = await executors.run("cpu_text", _encode, value)
+        try:
+            await self._ar.set(L2_PREFIX + key, payload, px=max(1, int(ttl * 1000)))
+        except Exception as e:
+            self.redis_errors += 1
+            _log.warning("Redis error on aset: %s", e)
+
+    async def adelete(self, key: str) -> bool:
+        deleted = self.l1.delete(key)
+        try:
+            deleted = bool(await self._ar.delete(L2_PREFIX + key)) or deleted
+        except Exception as e:
+            self.redis_errors += 1
+            _log.warning("Redis error on adelete: %s", e)
+        return deleted
+
+    async def get_or_compute(self, key: str, compute, ttl: Optional[int] = None, distributed: bool = False) -> Any:
+        """
+        Cached value for key, or await compute() once (single-flight) and cache its result.
+
+        Args:
+            key: Cache key (also the single-flight key)
+            compute: Zero-argument callable returning an awaitable of the value
+            ttl: Time-to-live in seconds (namespace default if not specified)
+            distributed: Also coalesce across workers through a Redis lock
+        """
+        from app.utils import singleflight  # singleflight builds on this module
+
+        value = await self.aget(key)
+        if value is not None:
+            return value
+
+        async def _compute_and_store():
+            value = await compute()
+            if value is not None:
+                await self.aset(key, value, ttl=ttl)
+            return value
+
+        return await singleflight.run(key, _compute_and_store, distributed=distributed)
+
+    def delete(self, key: str) -> bool:
+        deleted = self.l1.delete(key)
+        try:
+            deleted = bool(self._r.delete(L2_PREFIX + key)) or deleted
+        except Exception as e:
+            self.redis_errors += 1
+            _log.warning("Redis error on delete: %s", e)
+        return deleted
+
+    def clear(self) -> None:
+        """Clear L1 only — L2 is shared with other workers."""
+        self.l1.clear()
+
+    def exists(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def size(self) -> int:
+        return self.l1.size()
+
+    def cleanup(self) -> int:
+        return self.l1.cleanup()
+
+    def ttl_remaining(self, key: str) -> Optional[float]:
+        return self.l1.ttl_remaining(key)
+
+    async def attl_remaining(self, key: str) -> Optional[float]:
+        """Seconds until the shared (L2) copy expires — reflects refreshes done by other workers."""
+        try:
+            pttl = await self._ar.pttl(L2_PREFIX + key)
+        except Exception as e:
+            self.redis_errors += 1
+            _log.warning("Redis error on attl_remaining: %s", e)
+            return None
+        return pttl / 1000 if pttl and pttl > 0 else None
+
+    def stats(self) -> dict:
+        """L1 occupancy and per-namespace counters, plus L2 hits (L1 misses served by Redis)."""
+        stats = self.l1.stats()
+        for namespace, ns_stats in stats["namespaces"].items():
+            ns_stats["l2_hits"] = self._l2_hits.get(namespace, 0)
+        stats["redis_errors"] = self.redis_errors
+        return stats
+
+    def _store_l1(self, key: str, value: Any, ttl: Optional[int]) -> Optional[float]:
+        """Resolve the TTL and write L1 (sized by approx_size). Returns the TTL for L2 — None if not cacheable."""
+        if ttl is None:
+            ttl = self.ttl_for(key)
+        ttl = cdn_expiry.cap_ttl(value, ttl)
+        if ttl <= 0:
+            return None
+        self.l1.set(key, value, ttl=ttl)
+        return ttl
+
+    def ttl_for(self, key: str) -> int:
+        """Default TTL for a key, based on its make_key() namespace."""
+        namespace = key.split(":", 1)[0]
+        return self._namespace_ttls.get(namespace, self._default_ttl)
+
+    make_key = staticmethod(MemoryCache.make_key)
+
+
+# Global cache instance: in-process L1 backed by shared Redis L2
+cache = TieredCache(
+    MemoryCache(default_ttl=900, max_size=1000, max_bytes=settings.CACHE_MAX_MB * 1024 * 1024),
+    _r, _ar, default_ttl=900, namespace_ttls=NAMESPACE_TTLS,
+)
+
+
+def _cache_metric_samples(field: str) -> dict:
+    namespaces = cache.stats()["namespaces"]
+    if field == "misses":
+        # L1 misses that L2 answered are hits, not misses
+        return {(ns,): s["misses"] - s.get("l2_hits", 0) for ns, s in namespaces.items()}
+    samples = {(ns, "l1"): s["hits"] for ns, s in namespaces.items()}
+    samples.update({(ns, "l2"): s.get("l2_hits", 0) for ns, s in namespaces.items()})
+    return samples
+
+
+def save_snapshot(path: str = None) -> int:
+    """
+    Write live L1 entries to a zlib-compressed JSON file, atomically.
+
+    Returns:
+        Number of entries written
+    """
+    path = path or settings.CACHE_SNAPSHOT_PATH
+    entries = cache.l1.items()
+    payload = json.dumps(
+        {"saved_at": time.time(), "entries": [[k, exp, v] for k, v, exp in entries]},
+        separators=(",", ":"), default=str,
+    ).encode()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(zlib.compress(payload, 6))
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+def load_snapshot(path: str = None) -> int:
+    """
+    Warm L1 from a snapshot file. Entries that expired while the process was
+    down, or whose embedded CDN links have since expired, are skipped.
+
+    Returns:
+        Number of entries loaded
+    """
+    path = path or settings.CACHE_SNAPSHOT_PATH
+    try:
+        with open(path, "rb") as f:
+            data = json.loads(zlib.decompress(f.read()))
+    except FileNotFoundError:
+        return 0
+
+    now = time.time()
+    loaded = 0
+    for key, expires_at, value in data.get("entries", []):
+        ttl = cdn_expiry.cap_ttl(value, expires_at - now)
+        if ttl > 0 and cache.l1.set(key, value, ttl=ttl):
+            loaded += 1
+    return loaded
+
+
+async def _snapshot_loop(interval: int) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await executors.run("blocking_io", save_snapshot)
+        except Exception as e:
+            _log.warning("Snapshot failed: %s", e)
+
+
+def start_snapshots() -> None:
+    if settings.CACHE_SNAPSHOT_INTERVAL > 0:
+        asyncio.create_task(_snapshot_loop(settings.CACHE_SNAPSHOT_INTERVAL))
+
+
+# TTL (seconds) per classified extractor failure. Only failures that will not
+# go away on a retry belong here — bot checks and proxy errors are never cached.
+NEGATIVE_TTLS = {
+    "private": 600,
+    "members_only": 3600,
+    "age_restricted": 3600,
+    "region_blocked": 1800,
+    "terminated": 86400,
+    "unavailable": 600,
+    "not_found": 1800,
+    "too_long": 86400,
+    "invalid_url": 3600,
+}
+
+
+# Negative cache: positive-cache key -> error message (or HTTPException detail) of the classified failure.
+# Kept apart from `cache` so failures never evict results and both can be sized independently.
+negative_cache = MemoryCache(default_ttl=600, max_size=2000, max_bytes=4 * 1024 * 1024)
+
+
+metrics.cache_hits.set_collector(lambda: _cache_metric_samples("hits"))
+metrics.cache_misses.set_collector(lambda: _cache_metric_samples("misses"))
+metrics.redis_errors.set_collector(lambda: {("cache",): cache.redis_errors})
@@ -0,0 +1,71 @@
+import time
+from typing import Any, Optional
+from urllib.parse import urlparse, parse_qs
+
+# Signed CDN links carry their own expiry. Parsing it lets the cache keep an
+# entry for (almost) exactly as long as the links inside it stay valid.
+#
+#   googlevideo.com (YouTube)        expire=<unix seconds>
+#   fbcdn.net / cdninstagram.com     oe=<unix seconds, hex>
+#   TikTok CDN                       x-expires=<unix seconds> (or expire=)
+#   twimg.com (X)                    unsigned — no expiry
+
+EXPIRY_MARGIN = 60  # seconds — cache entries die this long before their links do
+
+
+def _int_param(params: dict, name: str, base: int = 10) -> Optional[int]:
+    values = params.get(name)
+    if not values:
+        return None
+    try:
+        return int(values[0], base)
+    except ValueError:
+        return None
+
+
+def url_expires_at(url: str) -> Optional[float]:
+    """Unix timestamp at which a signed CDN URL stops working, or None if unknown."""
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return None
+    host = (parsed.hostname or "").lower()
+    params = parse_qs(parsed.query)
+
+    if host.endswith("googlevideo.com"):
+        return _int_param(params, "expire")
+    if host.endswith(("fbcdn.net", "cdninstagram.com")):
+        return _int_param(params, "oe", base=16)
+    if "tiktok" in host or "byteoversea" in host or "ibytedtos" in host:
+        return _int_param(params, "x-expires") or _int_param(params, "expire")
+    return _int_param(params, "expire")
+
+
+def _iter_urls(value: Any):
+    if isinstance(value, str):
+        if value.startswith(("http://", "https://")):
+            yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _iter_urls(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _iter_urls(v)
+
+
+def earliest_expiry(value: Any) -> Optional[float]:
+    """Earliest link expiry found anywhere inside a (nested) cached value."""
+    expiries = [e for e in map(url_expires_at, _iter_urls(value)) if e]
+    return min(expiries) if expiries else None
+
+
+def cap_ttl(value: Any, ttl: float, margin: int = EXPIRY_MARGIN) -> float:
+    """
+    Shorten ttl so the entry expires `margin` seconds before its first link does.
+
+    Returns 0 when the links are already (nearly) dead — the caller should not cache.
+    """
+    expires_at = earliest_expiry(value)
+    if expires_at is None:
+        return ttl
+    return max(0, min(ttl, expires_at - time.time() - margin))
@@ -1,36 +1,368 @@
 import asyncio
+import math
+import time
+from collections import deque
 from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from app.config import settings
+from app.utils import metrics, spans, deadline, slot_leases
 
-MAX_CONCURRENT_DOWNLOADS = 7  # I/O-bound (proxy/network) — not CPU-limited
+# Per-platform download pools — I/O-bound (proxy/network), not CPU-limited.
+#
+# Each platform gets its own slots, so a slow one (TikTok streams whole
+# MP4s to disk inside its slot) can't hold every slot and starve the fast
+# metadata-only extractors. A pool that may borrow takes an idle slot from
+# another pool when its own are full, as long as that pool has nobody
+# waiting, up to as many slots as it owns. The slot goes back to its owner
+# on release, and the owner's own waiters are always served before
+# borrowers.
+#
+# MAX_TOTAL caps the slots held across all pools together — every pool goes
+# through the same proxy, and this is the load it is sized for. Borrowing
+# stays within it, and when the cap rather than a pool's own limit frees up,
+# the slot goes to the pool with the most waiters. AIMD only raises a pool's
+# limit while the limits of all pools sum to less than MAX_TOTAL, so the
+# host-wide leases (which use each pool's limit) stay within it too: a pool
+# grows into room another pool's decrease gave up.
+#
+# Each pool's slot count is an AIMD limit. A completed extraction that was
+# much slower than the pool's usual latency (LATENCY_TOLERANCE x its EWMA
+# baseline) while the pool was full or queueing, or a congestion failure
+# (timeout, connection or proxy error, 429/5xx — see _is_congestion) while
+# the recent error rate is above ERROR_RATE_MAX, cuts the limit by
+# DECREASE_FACTOR, at most once per DECREASE_COOLDOWN. Other failures
+# (private, deleted or invalid videos) are the caller's, not the
+# platform's, and are not observed at all. Any other success while the pool
+# is using its whole limit adds 1/limit, i.e. about one slot per limit's
+# worth of completions.
+# The queue a pool may build before requests are shed scales with it.
+#
+# Requests are also shed by deadline: one whose remaining time (see
+# app/utils/deadline.py) is below the pool's usual extraction time gets a
+# 429 straight away, and a waiter is dropped from the queue once waiting any
+# longer would leave it less than that. Slots go only to requests that can
+# still finish before TimeoutMiddleware's 504.
+#
+# With DOWNLOAD_SLOTS_DISTRIBUTED on, slots are leased host-wide from Redis
+# (app/utils/slot_leases.py), so each pool's limit and queue-depth shedding
+# hold for all uvicorn workers together rather than per worker. Borrowing
+# stays local, and AIMD still runs per worker on its own completions, each
+# worker's current limit deciding its own hand-overs. If Redis fails a
+# request falls back to this worker's slots.
 
-_download_semaphore: asyncio.Semaphore | None = None
+MAX_TOTAL = 8  # slots across all pools — the shared proxy's budget; the initial limits below sum to it
+
+# name -> (min slots, initial slots, max slots, may borrow idle slots from other pools)
+POOLS = {
+    "youtube": (1, 2, 6, True),
+    "tiktok": (1, 2, 4, False),  # long-held slots — never takes from the others
+    "instagram": (1, 1, 3, True),
+    "facebook": (1, 1, 3, True),
+    "x": (1, 1, 3, True),
+    "vk": (1, 1, 2, True),
+}
+
+LATENCY_TOLERANCE = 2.0     # x baseline before a completion counts as congestion
+BASELINE_ALPHA = 0.1        # EWMA weight of a new latency sample
+ERROR_ALPHA = 0.2           # EWMA weight of a new success/failure sample
+ERROR_RATE_MAX = 0.3
+DECREASE_FACTOR = 0.7
+DECREASE_COOLDOWN = 5.0     # seconds between cuts, so one burst of slow requests cuts once
+QUEUE_PER_SLOT = 2          # requests a pool may queue per slot of its limit before shedding
+QUEUE_MIN = 2
+HISTORY_STEP = 30           # seconds per point of limit history
+HISTORY_MAX = 60            # points kept (30 minutes)
+
+# Lower-cased fragments of extractor errors that mean the platform or proxy is struggling
+CONGESTION_MARKERS = (
+    "http error 429", "too many requests", "rate limit", "rate-limit", "not a bot",
+    "http error 5", "timed out", "timeout", "connection", "proxy", "temporarily unavailable",
+)
+
+
+class _Pool:
+    def __init__(self, name: str, min_limit: int, limit: int, max_limit: int, borrow: bool):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(limit)
+        self.borrow = borrow
+        self.held = 0       # this pool's slots in use, by its own requests or borrowers
+        self.active = 0     # this pool's requests holding a slot (own or borrowed)
+        self.borrowed = 0   # slots this pool holds from other pools
+        self.queued = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.baseline: float | None = None  # EWMA seconds in slot
+        self.error_rate = 0.0
+        self.decreased_at = 0.0
+        self.history: deque[list] = deque([[time.time(), limit]], maxlen=HISTORY_MAX)
+
+    @property
+    def size(self) -> int:
+        return int(self.limit)
+
+    def idle(self) -> bool:
+        return self.held < self.size and not self.waiters
+
+    def can_borrow(self) -> bool:
+        return self.borrow and self.borrowed < self.size
+
+
+_pools = {name: _Pool(name, *spec) for name, spec in POOLS.items()}
 
 downloads_active: int = 0
 downloads_queued: int = 0
+_distributed = False
+
+
+def _total_held() -> int:
+    return sum(p.held for p in _pools.values())
+
+
+def _take(pool: _Pool) -> _Pool | None:
+    """A slot for `pool` without waiting — its own, else an idle one borrowed. Returns the lender."""
+    if _total_held() >= MAX_TOTAL:
+        return None
+    if pool.idle():
+        pool.held += 1
+        return pool
+    if pool.can_borrow():
+        lenders = [p for p in _pools.values() if p is not pool and p.idle()]
+        if lenders:
+            lender = max(lenders, key=lambda p: p.size - p.held)
+            lender.held += 1
+            pool.borrowed += 1
+            return lender
+    return None
+
+
+def _hand_over(lender: _Pool) -> bool:
+    """Give a free slot of `lender` to the next waiter — its own first, then borrowers."""
+    if lender.held >= lender.size or _total_held() >= MAX_TOTAL:
+        return False
+    candidates = [lender] + [p for p in _pools.values() if p is not lender and p.can_borrow()]
+    for pool in candidates:
+        while pool.waiters:
+            waiter = pool.waiters.popleft()
+            if not waiter.done():  # skip waiters that were cancelled
+                lender.held += 1
+                pool.borrowed += pool is not lender
+                waiter.set_result(lender)
+                return True
+    return False
+
+
+def _is_congestion(exc: BaseException) -> bool:
+    """Whether a failed extraction says the platform/proxy is overloaded, rather than the URL being bad."""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    message = str(exc).lower()
+    return any(marker in message for marker in CONGESTION_MARKERS)
+
+
+def _observe(pool: _Pool, seconds: float, failed: bool) -> None:
+    """Feed one completed extraction into the pool's AIMD limit."""
+    now = time.monotonic()
+    pool.error_rate += ERROR_ALPHA * (failed - pool.error_rate)
+    busy = _full(pool) or pool.queued > 0
+    # A slow extraction on a pool with room to spare is just a long video, not congestion
+    slow = busy and pool.baseline is not None and seconds > pool.baseline * LATENCY_TOLERANCE
+    if not failed:
+        pool.baseline = seconds if pool.baseline is None else pool.baseline + BASELINE_ALPHA * (seconds - pool.baseline)
+
+    if slow or (failed and pool.error_rate > ERROR_RATE_MAX):
+        if now - pool.decreased_at < DECREASE_COOLDOWN:
+            return
+        pool.decreased_at = now
+        limit = max(pool.min_limit, pool.limit * DECREASE_FACTOR)
+    elif not failed and _full(pool):  # only probe upwards when the limit is what's holding it back
+        limit = min(pool.max_limit, pool.limit + 1 / pool.limit)
+        if int(limit) > pool.size and sum(p.size for p in _pools.values()) >= MAX_TOTAL:
+            return  # no room left under MAX_TOTAL for another slot
+    else:
+        return
+    if limit == pool.limit:
+        return
+    pool.limit = limit
+
+    if time.time() - pool.history[-1][0] < HISTORY_STEP:
+        pool.history[-1][1] = round(limit, 2)
+    else:
+        pool.history.append([time.time(), round(limit, 2)])
+    while _hand_over(pool):  # a raised limit may free slots for waiters
+        pass
+
+
+def _full(pool: _Pool) -> bool:
+    if _distributed:
+        host = slot_leases.host_tokens(pool.name)
+        if host is not None:
+            return host >= pool.size
+    return pool.held >= pool.size
 
 
-def get_download_semaphore() -> asyncio.Semaphore:
-    global _download_semaphore
-    if _download_semaphore is None:
-        _download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
-    return _download_semaphore
+def _release(pool: _Pool, lender: _Pool, lease: str | None = None) -> None:
+    if lease is not None:
+        slot_leases.release(lease)
+    lender.held -= 1
+    pool.borrowed -= pool is not lender
+    if not _hand_over(lender):
+        # The lender has no one to hand to — the freed room under MAX_TOTAL may unblock another pool
+        for other in sorted(_pools.values(), key=lambda p: len(p.waiters), reverse=True):
+            if other.waiters and _hand_over(other):
+                break
+
+
+async def _acquire(pool: _Pool, max_wait: float | None) -> _Pool:
+    lender = _take(pool)
+    if lender is not None:
+        return lender
+    waiter = asyncio.get_running_loop().create_future()
+    pool.waiters.append(waiter)
+    try:
+        async with asyncio.timeout(max_wait):
+            return await waiter
+    except BaseException:  # cancelled, or timed out (asyncio.timeout turns the cancel into TimeoutError)
+        if waiter.done() and not waiter.cancelled():
+            _release(pool, waiter.result())  # handed a slot just as we gave up
+        else:
+            try:
+                pool.waiters.remove(waiter)
+            except ValueError:
+                pass
+        raise
+
+
+async def _acquire_slot(pool: _Pool, max_wait: float | None) -> tuple[_Pool, str | None]:
+    """(lender, host lease) — a host-wide lease when distributed slots are on, else a slot of this worker."""
+    if _distributed:
+        try:
+            lease = await slot_leases.acquire(pool.name, max_wait)
+        except slot_leases.LeaseUnavailable:
+            pass  # Redis trouble — this worker's own slots still bound it
+        else:
+            pool.held += 1
+            return pool, lease
+    return await _acquire(pool, max_wait), None
+
+
+def retry_after(pool_name: str | None = None) -> int:
+    """Seconds until a pool (or the busiest pool) has likely worked through its current queue."""
+    pools = [_pools[pool_name]] if pool_name else _pools.values()
+    return max(
+        max(1, math.ceil((queued(p.name) + 1) / max(1, p.size) * (p.baseline or 1.0)))
+        for p in pools
+    )
+
+
+def _shed(pool: _Pool, reason: str) -> HTTPException:
+    metrics.download_slots_shed.inc(pool.name, reason)
+    return HTTPException(
+        status_code=429,
+        detail="Server is busy. Please try again in a moment.",
+        headers={"Retry-After": str(retry_after(pool.name))},
+    )
 
 
 @asynccontextmanager
-async def download_slot():
+async def download_slot(pool_name: str):
     global downloads_active, downloads_queued
+    pool = _pools[pool_name]
+    budget = deadline.remaining()
+    max_wait = None
+    if budget is not None and pool.baseline is not None:
+        max_wait = budget - pool.baseline
+        if max_wait <= 0:
+            raise _shed(pool, "deadline")
+    pool.queued += 1
     downloads_queued += 1
-    acquired = False
+    queued_at = time.monotonic()
     try:
-        async with get_download_semaphore():
-            acquired = True
-            downloads_queued = max(0, downloads_queued - 1)
-            downloads_active += 1
-            try:
-                yield
-            finally:
-                downloads_active = max(0, downloads_active - 1)
-    except BaseException:
-        if not acquired:
-            downloads_queued = max(0, downloads_queued - 1)
-        raise
\ No newline at end of file
+        lender, lease = await _acquire_slot(pool, max_wait)
+    except TimeoutError:
+        raise _shed(pool, "queue_deadline") from None
+    finally:
+        pool.queued -= 1
+        downloads_queued -= 1
+    waited = time.monotonic() - queued_at
+    metrics.download_slot_wait.observe(waited, pool_name)
+    spans.add("slot_wait", waited * 1000)
+    if lender is not pool:
+        metrics.download_slots_borrowed.inc(pool_name, lender.name)
+    pool.active += 1
+    downloads_active += 1
+    started = time.monotonic()
+    failed = None
+    try:
+        yield
+        failed = False
+    except Exception as e:
+        failed = True if _is_congestion(e) else None  # a bad URL says nothing about the platform
+        raise
+    finally:
+        pool.active -= 1
+        downloads_active -= 1
+        if failed is not None:  # nor does a cancelled request
+            _observe(pool, time.monotonic() - started, failed)
+        _release(pool, lender, lease)
+
+
+def pool_for_path(path: str) -> str | None:
+    """Pool serving a /tools/social/<platform>/... path, e.g. x-twitter -> "x"."""
+    parts = path.split("/")
+    if path.startswith("/tools/social/") and len(parts) > 3:
+        name = parts[3].split("-")[0]
+        if name in _pools:
+            return name
+    return None
+
+
+def queued(pool_name: str | None = None) -> int:
+    """Requests waiting for a slot in one pool, or in all of them — across the host when slots are distributed."""
+    if not pool_name:
+        return sum(queued(name) for name in _pools) if _distributed else downloads_queued
+    if _distributed:
+        host = slot_leases.host_queued(pool_name)
+        if host is not None:
+            return host
+    return _pools[pool_name].queued
+
+
+def queue_limit(pool_name: str | None = None) -> int:
+    """Queue length at which new requests for a pool (or any pool) are shed."""
+    pools = [_pools[pool_name]] if pool_name else _pools.values()
+    return sum(max(QUEUE_MIN, round(p.limit * QUEUE_PER_SLOT)) for p in pools)
+
+
+def start() -> None:
+    """Start sharing slots across workers if DOWNLOAD_SLOTS_DISTRIBUTED is set. Call once from lifespan."""
+    global _distributed
+    if settings.DOWNLOAD_SLOTS_DISTRIBUTED:
+        slot_leases.start({p.name: (lambda p=p: p.size) for p in _pools.values()})
+        _distributed = True
+
+
+def snapshot() -> dict:
+    return {
+        "active": downloads_active,
+        "queued": downloads_queued,
+        "max": min(MAX_TOTAL, sum(p.size for p in _pools.values())),
+        "distributed": _distributed,
+        "pools": [
+            {"name": p.name, "size": p.size, "held": p.held, "active": p.active,
+             "borrowed": p.borrowed, "queued": p.queued, "queue_limit": queue_limit(p.name),
+             "host_queued": slot_leases.host_queued(p.name) if _distributed else None,
+             "limit": round(p.limit, 2), "min": p.min_limit, "max": p.max_limit,
+             "latency_ms": round(p.baseline * 1000) if p.baseline is not None else None,
+             "error_rate": round(p.error_rate, 2), "history": list(p.history)}
+            for p in _pools.values()
+        ],
+    }
+
+
+metrics.download_slots_active.set_collector(lambda: {(p.name,): p.active for p in _pools.values()})
+metrics.download_slots_queued.set_collector(lambda: {(p.name,): p.queued for p in _pools.values()})
+metrics.download_pool_limit.set_collector(lambda: {(p.name,): p.limit for p in _pools.values()})
@@ -0,0 +1,28 @@
+import time
+from contextvars import ContextVar
+from fastapi import HTTPException
+
+# Per-request deadline, set by TimeoutMiddleware to when it will give up
+# with a 504. Like spans, it lives in a ContextVar, so tasks and
+# executors.run() calls spawned by the request see it; code running
+# outside a request (hot-URL refreshes) has no deadline.
+
+_deadline_var: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+def start(seconds: float) -> None:
+    _deadline_var.set(time.monotonic() + seconds)
+
+
+def remaining() -> float | None:
+    """Seconds left before the request times out, or None outside a request."""
+    deadline = _deadline_var.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def exceeded() -> HTTPException:
+    """The error for work given up because the request is out of time — the 504 the middleware would send."""
+    return HTTPException(status_code=504, detail={
+        "error": "Request timeout",
+        "message": "The request ran out of time before the result was ready",
+    })
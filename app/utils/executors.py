@@ -0,0 +1,130 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+import anyio.to_thread
+from app.config import settings
+from app.utils import metrics
+
+# Named, bounded thread pools — one per kind of blocking work, so a burst of
+# one kind cannot take every thread from the others (a queue of ffmpeg jobs
+# starving yt-dlp extractions, or the reverse).
+#
+#   extraction   yt-dlp extract_info — mostly waiting on the network/proxy
+#   ffmpeg       threads supervising ffmpeg subprocesses — the encodes are
+#                CPU-bound, so more of them than cores only time-slices them
+#   cpu_text     plagiarism tokenising and TF-IDF comparisons, and encoding
+#                cache values for Redis
+#   blocking_io  sync Redis/HTTP calls and snapshot files
+#
+# Two thread budgets sit outside these pools and are sized on their own, so
+# they cannot eat into them either:
+#
+#   default      the loop's default executor, for asyncio.to_thread() and
+#                run_in_executor(None) in libraries — app code uses run()
+#   anyio        anyio's worker threads, where FastAPI runs sync handlers
+#                (login, signup) and dependencies (get_db) and UploadFile
+#                does its file I/O; start() sets the limiter's token count
+#
+# Sizes scale with the core count; EXECUTOR_THREADS overrides any of them
+# ("extraction=32,ffmpeg=2,anyio=16").
+#
+# run() copies the caller's context like asyncio.to_thread(), so spans,
+# the request deadline and the log request id still apply in the thread.
+
+_CPUS = os.cpu_count() or 1
+
+SIZES = {
+    "extraction": max(8, _CPUS * 4),
+    "ffmpeg": max(2, _CPUS),
+    "cpu_text": max(2, _CPUS),
+    "blocking_io": max(8, _CPUS * 4),
+}
+DEFAULT_THREADS = max(4, _CPUS)
+ANYIO_THREADS = max(4, _CPUS * 2)
+
+
+class _Executor:
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix=name)
+        self.busy = 0
+        self.queued = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, args: tuple, kwargs: dict) -> asyncio.Future:
+        ctx = contextvars.copy_context()
+        with self._lock:
+            self.queued += 1
+        future = self.pool.submit(ctx.run, self._call, time.monotonic(), fn, *args, **kwargs)
+        future.add_done_callback(self._done)
+        return asyncio.wrap_future(future)
+
+    def _call(self, submitted: float, fn: Callable, *args, **kwargs) -> Any:
+        started = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.busy += 1
+        metrics.executor_wait.observe(started - submitted, self.name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.busy -= 1
+                self.busy_seconds += time.monotonic() - started
+
+    def _done(self, future) -> None:
+        if future.cancelled():  # never started, so _call() never took it off the queue
+            with self._lock:
+                self.queued -= 1
+
+
+def _sizes() -> dict[str, int]:
+    overrides = (item.split("=", 1) for item in settings.EXECUTOR_THREADS.split(",") if "=" in item)
+    sizes = {**SIZES, "default": DEFAULT_THREADS, "anyio": ANYIO_THREADS}
+    sizes.update({k.strip(): int(v) for k, v in overrides if k.strip() in sizes})
+    return sizes
+
+
+_size = _sizes()
+_executors = {name: _Executor(name, _size[name]) for name in SIZES}
+_default_pool = ThreadPoolExecutor(max_workers=_size["default"], thread_name_prefix="default")
+_anyio_limiter = None
+
+
+async def run(pool: str, fn: Callable, /, *args, **kwargs) -> Any:
+    """Await fn(*args, **kwargs) on the named executor, in a copy of the caller's context."""
+    return await _executors[pool].submit(fn, args, kwargs)
+
+
+def start() -> None:
+    """Bound the loop's default executor and anyio's thread limiter. Call once from lifespan."""
+    global _anyio_limiter
+    asyncio.get_running_loop().set_default_executor(_default_pool)
+    _anyio_limiter = anyio.to_thread.current_default_thread_limiter()
+    _anyio_limiter.total_tokens = _size["anyio"]
+
+
+def shutdown() -> None:
+    """Drop queued work and let running calls finish in the background."""
+    for executor in _executors.values():
+        executor.pool.shutdown(wait=False, cancel_futures=True)
+    _default_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _anyio_samples(value: Callable) -> dict:
+    return {("anyio",): value(_anyio_limiter)} if _anyio_limiter is not None else {}
+
+
+metrics.executor_threads.set_collector(lambda: {(e.name,): e.size for e in _executors.values()})
+metrics.executor_threads.set_collector(lambda: {("default",): _size["default"], ("anyio",): _size["anyio"]})
+metrics.executor_busy.set_collector(lambda: {(e.name,): e.busy for e in _executors.values()})
+metrics.executor_busy.set_collector(lambda: _anyio_samples(lambda l: l.borrowed_tokens))
+metrics.executor_queued.set_collector(lambda: {(e.name,): e.queued for e in _executors.values()})
+metrics.executor_queued.set_collector(lambda: _anyio_samples(lambda l: l.statistics().tasks_waiting))
+metrics.executor_busy_seconds.set_collector(lambda: {(e.name,): e.busy_seconds for e in _executors.values()})
@@ -7,6 +7,9 @@ import glob, os, hashlib, math, json, requests, random
 from app import config as app_config
 from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+from app.utils import log
+
+_log = log.get_logger("helper")
 
 
 
@@ -29,11 +32,11 @@ def cleanup_old_files(directory: str, days: int):
             if file_mtime < cutoff_time:  # Check if older than allowed days
                 try:
                     os.remove(file_path)
-                    print(f"✅ Deleted old file: {file_path}")
+                    _log.info("Deleted old file: %s", file_path)
                 except Exception as e:
-                    print(f"❌ Failed to delete {file_path}: {e}")
+                    _log.warning("Failed to delete %s: %s", file_path, e)
             else:
-                print(f"⏳ File not old enough: {file_path} (Modified: {file_mtime})")
+                _log.debug("File not old enough: %s (Modified: %s)", file_path, file_mtime)
                 
 
 def generate_filename_from_url(url: str) -> str:
@@ -63,7 +66,7 @@ def get_video_size(video_url, proxies=None):
     """Fetch video size from the Content-Length header."""
     response = requests.head(video_url, proxies=proxies) 
     content_length = response.headers.get('Content-Length')
-    print('content-length: ', content_length)
+    _log.debug('content-length: %s', content_length)
     if content_length:
         return round(int(content_length) / (1024 * 1024), 2)
     return None
@@ -87,10 +90,10 @@ def download_part(url, start, end, filename, proxies=None):
                 f.seek(start)
                 f.write(response.content)
         else:
-            print(f"Failed to download part {start}-{end}. Status code: {response.status_code}")
+            _log.warning("Failed to download part %s-%s. Status code: %s", start, end, response.status_code)
 
     except Exception as e:
-        print(f"Error downloading part {start}-{end}: {e}")
+        _log.warning("Error downloading part %s-%s: %s", start, end, e)
 
 def download_video_parallel(url, video_path, num_threads=4, proxies=None):
     try:
@@ -99,7 +102,7 @@ def download_video_parallel(url, video_path, num_threads=4, proxies=None):
         file_size = int(response.headers.get("content-length", 0))
 
         if file_size == 0:
-            print("Failed to get content length from the server.")
+            _log.warning("Failed to get content length from the server.")
             return
 
         part_size = file_size // num_threads
@@ -120,10 +123,10 @@ def download_video_parallel(url, video_path, num_threads=4, proxies=None):
             for future in futures:
                 future.result()
 
-        print("Parallel download completed successfully.")
+        _log.info("Parallel download completed successfully.")
 
     except Exception as e:
-        print(f"Error during parallel download: {e}")
+        _log.error("Error during parallel download: %s", e)
 
 # def download_video(url, video_path, chunk_size=8192, proxies=None):   
 #     response = requests.get(url, stream=True, proxies=proxies)
@@ -149,7 +152,7 @@ def download_video(url, video_path, chunk_size=8192, proxies=None):
                 f.write(chunk)
                 progress_bar.update(len(chunk))
 
-    print("Download completed!")
+    _log.info("Download completed!")
     
 
 def save_json_to_file(data, file_path):
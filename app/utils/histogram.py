@@ -0,0 +1,49 @@
+import math
+
+# Log-linear latency histograms (HDR-style).
+#
+# Values are integer milliseconds. Below 2 * SUB_BUCKETS every value has its
+# own bucket; above that each power of two is split into SUB_BUCKETS linear
+# buckets, so any recorded value is off by at most 1 / (2 * SUB_BUCKETS)
+# (~6%). Bucket boundaries are fixed, so histograms from different workers
+# and time slots merge by adding counts per bucket index.
+
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+def bucket_index(value_ms: int) -> int:
+    value_ms = max(0, int(value_ms))
+    if value_ms < 2 * SUB_BUCKETS:
+        return value_ms
+    shift = value_ms.bit_length() - SUB_BUCKET_BITS - 1
+    return shift * SUB_BUCKETS + (value_ms >> shift)
+
+
+def bucket_value(index: int) -> int:
+    """Midpoint of the values that land in bucket `index`."""
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+    low = mantissa << shift
+    high = ((mantissa + 1) << shift) - 1
+    return (low + high) // 2
+
+
+def percentiles(counts: dict[int, int], quantiles=(0.5, 0.95, 0.99)) -> dict:
+    """{"count": n, "p50": ms, ...} for a {bucket_index: count} histogram."""
+    total = sum(counts.values())
+    result = {"count": total}
+    if not total:
+        return result
+    buckets = sorted(counts.items())
+    for q in quantiles:
+        rank = max(1, math.ceil(total * q))
+        seen = 0
+        for index, n in buckets:
+            seen += n
+            if seen >= rank:
+                result[f"p{round(q * 100)}"] = bucket_value(index)
+                break
+    return result
@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import itertools
+import time
+from typing import Awaitable, Callable
+from app.utils import monitor, log
+
+_log = log.get_logger("hot_urls")
+
+# Heavy-hitter tracking for social download URLs, plus a proactive refresher.
+#
+# The social controllers call record() on every request. A space-saving
+# sketch keeps approximate counts for the TOP_K most requested
+# (platform, media) items in O(TOP_K) memory, with counts halved every
+# DECAY_INTERVAL so yesterday's viral video stops being "hot".
+#
+# Every REFRESH_INTERVAL the refresher walks the top REFRESH_TOP_N items and
+# asks the platform's registered refresher to re-extract any whose cached
+# entry expires within REFRESH_AHEAD seconds — so the most requested videos
+# never pay a cold extraction. Refreshes stop once REFRESH_BUDGET_MB of
+# proxy traffic has been spent in the current hour.
+
+TOP_K = 200
+DECAY_INTERVAL = 3600       # seconds
+REFRESH_INTERVAL = 30       # seconds between refresher passes
+REFRESH_TOP_N = 20
+REFRESH_AHEAD = 300         # seconds — refresh entries expiring this soon
+REFRESH_BUDGET_MB = 200     # proxy traffic allowed for refreshes per hour
+
+# platform -> async fn(*args, window=...) -> bool (True if it re-extracted)
+_refreshers: dict[str, Callable[..., Awaitable[bool]]] = {}
+
+# identity -> {"count", "error", "platform", "args", "last_seen", "refreshed_at"}
+_counts: dict[tuple, dict] = {}
+_last_decay = time.time()
+
+_budget_hour = 0
+_budget_bytes = 0
+_refreshes = 0
+_refresh_ids = itertools.count(1)
+
+
+def register(platform: str, refresher: Callable[..., Awaitable[bool]]) -> None:
+    """Register the coroutine that refreshes a platform's cache entry for record()'s args."""
+    _refreshers[platform] = refresher
+
+
+def record(platform: str, url: str, *args) -> None:
+    """Count one request. url and args are what the platform's refresher will be called with."""
+    if not url:
+        return
+    from app.utils.media_key import canonical_id  # media_key imports the services
+
+    _maybe_decay()
+    identity = (platform, canonical_id(url) or url, *args)
+    item = _counts.get(identity)
+    if item is None:
+        if len(_counts) >= TOP_K:
+            # Space-saving: the newcomer replaces the minimum and inherits its count as error
+            victim_id, victim = min(_counts.items(), key=lambda kv: kv[1]["count"])
+            del _counts[victim_id]
+            item = {"count": victim["count"], "error": victim["count"], "refreshed_at": None}
+        else:
+            item = {"count": 0, "error": 0, "refreshed_at": None}
+        _counts[identity] = item
+    item["count"] += 1
+    item["platform"] = platform
+    item["args"] = (url, *args)
+    item["last_seen"] = time.time()
+
+
+def _maybe_decay() -> None:
+    global _last_decay
+    now = time.time()
+    if now - _last_decay < DECAY_INTERVAL:
+        return
+    _last_decay = now
+    for identity in list(_counts):
+        item = _counts[identity]
+        item["count"] //= 2
+        item["error"] //= 2
+        if item["count"] == 0:
+            del _counts[identity]
+
+
+def top(n: int = 10) -> list[dict]:
+    items = sorted(_counts.values(), key=lambda i: i["count"], reverse=True)[:n]
+    return [{
+        "platform": i["platform"],
+        "url": i["args"][0],
+        "region": i["args"][1] if len(i["args"]) > 1 else None,
+        "count": i["count"],
+        "error": i["error"],
+        "refreshed_at": i["refreshed_at"],
+    } for i in items]
+
+
+def _budget_left() -> bool:
+    global _budget_hour, _budget_bytes
+    hour = int(time.time() // 3600)
+    if hour != _budget_hour:
+        _budget_hour, _budget_bytes = hour, 0
+    return _budget_bytes < REFRESH_BUDGET_MB * 1024 * 1024
+
+
+async def _refresh_item(item: dict) -> bool:
+    """Run one refresh billed to its own monitor request id, so its proxy bytes count against the budget."""
+    global _budget_bytes, _refreshes
+    refresher = _refreshers.get(item["platform"])
+    if refresher is None:
+        return False
+    req_id = -next(_refresh_ids)  # negative ids never collide with id(request)
+    monitor._set_request_id(req_id)
+    log.bind_request(f"refresh-{-req_id}")
+    try:
+        refreshed = await refresher(*item["args"], window=REFRESH_AHEAD)
+    finally:
+        _budget_bytes += monitor._get_and_reset_proxy_bytes(req_id)
+    if refreshed:
+        _refreshes += 1
+        item["refreshed_at"] = time.time()
+    return refreshed
+
+
+async def _refresh_loop() -> None:
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        items = sorted(_counts.values(), key=lambda i: i["count"], reverse=True)[:REFRESH_TOP_N]
+        for item in items:
+            if not _budget_left():
+                break
+            try:
+                # Fresh context per item: each refresh gets its own req_id
+                await asyncio.create_task(_refresh_item(item), context=contextvars.Context())
+            except Exception as e:
+                _log.warning("Refresh failed for %s %s: %s", item["platform"], item["args"][0], e)
+
+
+def start_refresher() -> None:
+    asyncio.create_task(_refresh_loop())
+
+
+def snapshot() -> dict:
+    _budget_left()
+    return {
+        "top": top(10),
+        "tracked": len(_counts),
+        "refreshes": _refreshes,
+        "budget_used_mb": round(_budget_bytes / (1024 * 1024), 1),
+        "budget_mb": REFRESH_BUDGET_MB,
+    }
@@ -0,0 +1,168 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import secrets
+import sys
+import time
+import zlib
+from contextvars import ContextVar
+from app.config import settings
+
+# Structured logging, off the event loop.
+#
+# get_logger("cache") returns the "app.cache" logger. Level checks, sampling
+# and request-id stamping happen on the calling thread; the record is then
+# put on a bounded queue and a QueueListener thread formats it and writes
+# stdout, so a slow journald pipe never blocks a request. When the queue is
+# full the record is dropped and counted (log_records_dropped) rather than
+# waited on.
+#
+# LOG_LEVEL is the default level and LOG_LEVELS overrides it per subsystem
+# ("cache=WARNING,plagiarism=DEBUG"). LOG_SAMPLE keeps a fraction of a
+# subsystem's INFO/DEBUG lines ("request=0.1"); the decision is made per
+# request id, so a kept request keeps all of its lines. Warnings and errors
+# are never sampled. Structured fields go in `extra=`.
+
+ROOT = "app"
+
+# Attributes every LogRecord has — anything else on a record came from extra=
+_RECORD_ATTRS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id"}
+
+# Set per request by monitor.request_started(); inherited by tasks and
+# executors.run() calls like monitor._req_id_var.
+_request_id_var: ContextVar[str] = ContextVar("log_request_id", default="")
+
+_handler: logging.Handler | None = None
+_listener: logging.handlers.QueueListener | None = None
+_dropped = 0
+
+
+def _parse(spec: str) -> dict[str, str]:
+    """"a=1,b=2" -> {"a": "1", "b": "2"}"""
+    pairs = (item.split("=", 1) for item in spec.split(",") if "=" in item)
+    return {k.strip(): v.strip() for k, v in pairs}
+
+
+def _subsystem(record: logging.LogRecord) -> str:
+    return record.name[len(ROOT) + 1:] or ROOT
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRS}
+
+
+def bind_request(request_id: str = None) -> str:
+    """Tag records logged from the current context with `request_id` (a fresh one if omitted)."""
+    request_id = request_id or secrets.token_hex(4)
+    _request_id_var.set(request_id)
+    return request_id
+
+
+def dropped_records() -> int:
+    return _dropped
+
+
+class _ContextFilter(logging.Filter):
+    def __init__(self, sample_rates: dict[str, float]):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id_var.get()
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.sample_rates.get(_subsystem(record).split(".")[0])
+        if rate is None or rate >= 1:
+            return True
+        if record.request_id:
+            return zlib.crc32(record.request_id.encode()) % 10000 < rate * 10000
+        return random.random() < rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render message and traceback on the caller: args and exc_info may not survive the hop
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _timestamp(record: logging.LogRecord) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + ".%03dZ" % record.msecs
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "ts": _timestamp(record),
+            "level": record.levelname,
+            "subsystem": _subsystem(record),
+            "msg": record.msg,
+        }
+        if getattr(record, "request_id", ""):
+            line["request_id"] = record.request_id
+        line.update(_fields(record))
+        if record.exc_text:
+            line["exc"] = record.exc_text
+        return json.dumps(line, default=str, ensure_ascii=False)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        parts = [_timestamp(record), record.levelname, f"[{_subsystem(record)}]", str(record.msg)]
+        parts += [f"{k}={v}" for k, v in _fields(record).items()]
+        if getattr(record, "request_id", ""):
+            parts.append(f"request_id={record.request_id}")
+        line = " ".join(parts)
+        return line + "\n" + record.exc_text if record.exc_text else line
+
+
+def setup() -> None:
+    """Attach the queue handler to the "app" logger and start the writer thread. Idempotent."""
+    global _handler, _listener
+    if _handler is not None:
+        return
+    root = logging.getLogger(ROOT)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    root.propagate = False
+    for name, level in _parse(settings.LOG_LEVELS).items():
+        logging.getLogger(f"{ROOT}.{name}").setLevel(level.upper())
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(_TextFormatter() if settings.LOG_FORMAT == "text" else _JsonFormatter())
+    _handler = _QueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_MAX))
+    _handler.addFilter(_ContextFilter({k: float(v) for k, v in _parse(settings.LOG_SAMPLE).items()}))
+    root.addHandler(_handler)
+    _listener = logging.handlers.QueueListener(_handler.queue, stream)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Write out whatever is queued and stop the writer thread."""
+    global _handler, _listener
+    if _listener is None:
+        return
+    logging.getLogger(ROOT).removeHandler(_handler)
+    _listener.stop()
+    _handler = _listener = None
+
+
+def get_logger(subsystem: str) -> logging.Logger:
+    setup()
+    return logging.getLogger(f"{ROOT}.{subsystem}")
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+from app.utils import histogram, metrics, log
+
+# Event-loop lag detector.
+#
+# A heartbeat task sleeps HEARTBEAT_INTERVAL and records how late it woke
+# up — the time the loop spent running something else — in rolling
+# histograms (1m / 1h, same slot scheme as the monitor's latency windows,
+# but per worker and in memory). A watchdog thread checks the heartbeat
+# every WATCHDOG_INTERVAL; while it is more than STALL_THRESHOLD overdue the
+# loop thread is stuck, so the watchdog samples that thread's stack with
+# sys._current_frames() and charges the sample to the innermost app frame
+# (the call site) and the innermost frame overall (what it blocked in).
+# Sites are ranked by samples, i.e. roughly by time spent stalling.
+
+HEARTBEAT_INTERVAL = 0.1    # seconds between heartbeats
+WATCHDOG_INTERVAL = 0.05    # seconds between watchdog checks (stack sample rate)
+STALL_THRESHOLD = 0.1       # seconds overdue before the loop counts as blocked
+WINDOWS = {"1m": 10, "1h": 600}  # window -> slot seconds
+SLOTS = 6
+SITES_MAX = 200             # distinct call sites kept
+TOP_SITES = 10
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_SELF = os.path.abspath(__file__)
+
+# window -> slot number -> {"buckets": {bucket: count}, "max": ms}
+_slots: dict[str, dict[int, dict]] = {name: {} for name in WINDOWS}
+_sites: dict[tuple, dict] = {}
+_sites_lock = threading.Lock()
+_stalls = 0
+_last_beat = 0.0
+_loop_thread_id: int | None = None
+_task: asyncio.Task | None = None
+_log = log.get_logger("loop_lag")
+
+metrics.event_loop_stalls.set_collector(lambda: {(): _stalls})
+
+
+def _record_lag(lag_ms: float) -> None:
+    now = time.time()
+    bucket = histogram.bucket_index(lag_ms)
+    for name, slot_seconds in WINDOWS.items():
+        slot_no = int(now // slot_seconds)
+        slots = _slots[name]
+        slot = slots.get(slot_no)
+        if slot is None:
+            slot = slots[slot_no] = {"buckets": defaultdict(int), "max": 0}
+            for old in [n for n in slots if n <= slot_no - SLOTS]:
+                del slots[old]
+        slot["buckets"][bucket] += 1
+        slot["max"] = max(slot["max"], lag_ms)
+    metrics.event_loop_lag.observe(lag_ms / 1000)
+
+
+async def _heartbeat() -> None:
+    global _last_beat
+    while True:
+        started = time.perf_counter()
+        _last_beat = started
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        _record_lag(max(0.0, (time.perf_counter() - started - HEARTBEAT_INTERVAL) * 1000))
+
+
+def _frame_label(frame: traceback.FrameSummary) -> str:
+    path = frame.filename
+    if path.startswith(_APP_ROOT + os.sep):
+        path = os.path.relpath(path, _APP_ROOT)
+    else:
+        path = os.path.basename(path)
+    return f"{path}:{frame.lineno} {frame.name}"
+
+
+def _is_app_frame(frame: traceback.FrameSummary) -> bool:
+    path = os.path.abspath(frame.filename)
+    return (
+        path.startswith(_APP_ROOT + os.sep)
+        and path != _SELF
+        and "site-packages" not in path
+        and os.sep + "." not in path[len(_APP_ROOT):]  # .venv and friends
+    )
+
+
+def _sample_stack(stalled_ms: float) -> tuple | None:
+    frame = sys._current_frames().get(_loop_thread_id)
+    if frame is None:
+        return None
+    stack = traceback.extract_stack(frame)
+    if not stack:
+        return None
+    app_frames = [f for f in stack if _is_app_frame(f)]
+    key = (
+        _frame_label(app_frames[-1]) if app_frames else "-",
+        _frame_label(stack[-1]),
+    )
+    with _sites_lock:
+        site = _sites.get(key)
+        if site is None:
+            if len(_sites) >= SITES_MAX:
+                del _sites[min(_sites, key=lambda k: _sites[k]["samples"])]
+            site = _sites[key] = {"samples": 0, "max_stall_ms": 0, "last_seen": 0}
+        site["samples"] += 1
+        site["max_stall_ms"] = max(site["max_stall_ms"], round(stalled_ms))
+        site["last_seen"] = time.time()
+    return key
+
+
+def _watchdog() -> None:
+    global _stalls
+    stall_site = None
+    stall_ms = 0.0
+    while True:
+        time.sleep(WATCHDOG_INTERVAL)
+        overdue = time.perf_counter() - _last_beat - HEARTBEAT_INTERVAL
+        if overdue > STALL_THRESHOLD:
+            if stall_site is None:
+                _stalls += 1
+            stall_ms = overdue * 1000
+            try:
+                stall_site = _sample_stack(stall_ms) or stall_site or ("-", "-")
+            except Exception as e:
+                _log.warning("Stack sample failed: %s", e)
+                stall_site = stall_site or ("-", "-")
+        elif stall_site is not None:
+            _log.warning(
+                "Event loop blocked for %d ms", stall_ms,
+                extra={"site": stall_site[0], "blocking": stall_site[1]},
+            )
+            stall_site = None
+
+
+def start() -> None:
+    """Start the heartbeat on the running loop and the watchdog thread. Call once from lifespan."""
+    global _task, _loop_thread_id, _last_beat
+    if _task is not None:
+        return
+    _loop_thread_id = threading.get_ident()
+    _last_beat = time.perf_counter()
+    _task = asyncio.create_task(_heartbeat())
+    threading.Thread(target=_watchdog, name="loop-lag-watchdog", daemon=True).start()
+
+
+def snapshot() -> dict:
+    """Lag percentiles per window and the top stalling call sites for this worker."""
+    current = {name: int(time.time() // slot_seconds) for name, slot_seconds in WINDOWS.items()}
+    windows = {}
+    for name, slots in _slots.items():
+        merged = defaultdict(int)
+        worst = 0
+        for slot_no, slot in list(slots.items()):
+            if slot_no > current[name] - SLOTS:
+                for bucket, n in slot["buckets"].items():
+                    merged[bucket] += n
+                worst = max(worst, slot["max"])
+        windows[name] = {**histogram.percentiles(merged), "max": round(worst)}
+    with _sites_lock:
+        top = sorted(_sites.items(), key=lambda kv: kv[1]["samples"], reverse=True)[:TOP_SITES]
+    return {
+        "threshold_ms": round(STALL_THRESHOLD * 1000),
+        "stalls": _stalls,
+        "windows": windows,
+        "sites": [
+            {
+                "site": site,
+                "blocking": blocking,
+                "samples": s["samples"],
+                "stalled_ms": round(s["samples"] * WATCHDOG_INTERVAL * 1000),
+                "max_stall_ms": s["max_stall_ms"],
+                "last_seen": s["last_seen"],
+            }
+            for (site, blocking), s in top
+        ],
+    }
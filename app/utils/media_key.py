@@ -0,0 +1,109 @@
+import re
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+from app.utils.cache import cache
+from app.utils import proxy_meter, log
+
+_log = log.get_logger("media_key")
+
+# Cache keys are built from (platform, media_id) instead of the raw URL, so
+# youtu.be/X, youtube.com/watch?v=X&t=30 and youtube.com/shorts/X — or x.com
+# and twitter.com, or a vm.tiktok.com short link and the video it points to —
+# all share one cache entry and one single-flight extraction.
+
+# Hosts whose links are redirects to the real media URL
+SHORT_LINK_HOSTS = {"vm.tiktok.com", "vt.tiktok.com", "fb.watch"}
+
+_X_STATUS_RE = re.compile(r'(?:^|\.)(?:twitter|x)\.com$')
+_STATUS_ID_RE = re.compile(r'/status(?:es)?/(\d+)')
+_FACEBOOK_ID_RE = re.compile(r'/(?:videos|reel)/(?:[^/]+/)?(\d+)')
+_VK_ID_RE = re.compile(r'video(-?\d+_\d+)')
+
+
+def _host(url: str) -> str:
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def is_short_link(url: str) -> bool:
+    host = _host(url)
+    if host in SHORT_LINK_HOSTS:
+        return True
+    path = urlparse(url).path
+    # tiktok.com/t/<code> and facebook.com/share/{v,r}/<code> are short links too
+    return (host.endswith("tiktok.com") and path.startswith("/t/")) or \
+        (host.endswith("facebook.com") and path.startswith("/share/"))
+
+
+async def resolve_short_link(url: str, proxy: str = None, headers: dict = None) -> str:
+    """Follow a short link's redirects to the final URL. Cached and single-flighted."""
+    async def _resolve():
+        kwargs = {"follow_redirects": True, "timeout": 15}
+        if headers:
+            kwargs["headers"] = headers
+        async with proxy_meter.async_client(proxy=proxy, **kwargs) as client:
+            r = await client.head(url)
+        return str(r.url)
+
+    return await cache.get_or_compute(cache.make_key("short_link", url), _resolve)
+
+
+def canonical_id(url: str) -> Optional[tuple[str, str]]:
+    """(platform, media_id) for a supported URL, or None. Never does network I/O."""
+    # Imported here: the services import this module to build their cache keys
+    from app.services.tools.socials import youtube_service, tiktok_service, instagram_service
+
+    host = _host(url)
+    parsed = urlparse(url)
+
+    if host == "youtu.be" or host.endswith("youtube.com"):
+        video_id = youtube_service.extract_youtube_video_id(url) or parse_qs(parsed.query).get("v", [None])[0]
+        return ("youtube", video_id) if video_id else None
+
+    if host.endswith("tiktok.com"):
+        video_id = tiktok_service._extract_video_id(url)
+        return ("tiktok", video_id) if video_id else None
+
+    if host.endswith("instagram.com") or host == "instagr.am":
+        shortcode = instagram_service.extract_reel_id(url)
+        return ("instagram", shortcode) if shortcode else None
+
+    if _X_STATUS_RE.search(host):
+        match = _STATUS_ID_RE.search(parsed.path)
+        return ("x", match.group(1)) if match else None
+
+    if host.endswith("facebook.com"):
+        video_id = parse_qs(parsed.query).get("v", [None])[0]
+        if not video_id:
+            match = _FACEBOOK_ID_RE.search(parsed.path)
+            video_id = match.group(1) if match else None
+        return ("facebook", video_id) if video_id else None
+
+    if host.endswith(("vk.com", "vkvideo.ru")):
+        match = _VK_ID_RE.search(parsed.path)
+        return ("vk", match.group(1)) if match else None
+
+    return None
+
+
+async def canonicalize(url: str, proxy: str = None, headers: dict = None) -> Optional[tuple[str, str]]:
+    """Like canonical_id(), but resolves short links first. Resolution errors mean None."""
+    if url and is_short_link(url):
+        try:
+            url = await resolve_short_link(url, proxy=proxy, headers=headers)
+        except Exception as e:
+            _log.warning("Could not resolve short link %s: %s", url, e)
+            return None
+    return canonical_id(url) if url else None
+
+
+async def make_key(namespace: str, url: str, *extra, proxy: str = None, headers: dict = None) -> str:
+    """
+    cache.make_key() over the canonical (platform, media_id) of url.
+
+    Falls back to the raw URL for anything that cannot be canonicalised,
+    which keeps the old per-URL behaviour for unknown URL shapes.
+    """
+    media = await canonicalize(url, proxy=proxy, headers=headers)
+    identity = f"{media[0]}:{media[1]}" if media else url
+    return cache.make_key(namespace, identity, *extra)
@@ -0,0 +1,188 @@
+import threading
+from typing import Callable
+from app.utils import log
+
+# In-process OpenMetrics registry, served at /metrics.
+#
+# Updating a metric is a dict write under a lock — no I/O. Values that
+# already live elsewhere (cache counters, queue sizes) are read by
+# collector callbacks at scrape time instead of being mirrored on every
+# change, so a scrape never touches Redis. Each worker process exposes its
+# own values; sum across instances in the query.
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Seconds — request and extraction latency spans ms to minutes
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+JOB_BUCKETS = (1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+_registry: list["Metric"] = []
+_log = log.get_logger("metrics")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "unknown"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._collectors: list[Callable[[], dict]] = []
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def set_collector(self, collect: Callable[[], dict]) -> None:
+        """Add a callback returning {label values tuple: value}, read at scrape time."""
+        self._collectors.append(collect)
+
+    def _samples(self) -> dict[tuple, float]:
+        with self._lock:
+            samples = dict(self._values)
+        for collect in self._collectors:
+            try:
+                samples.update(collect())
+            except Exception as e:
+                _log.warning("Collector for %s failed: %s", self.name, e)
+        return samples
+
+    def _header(self) -> list[str]:
+        return [f"# TYPE {self.name} {self.kind}", f"# HELP {self.name} {self.documentation}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list[str]:
+        return self._header() + [
+            f"{self.name}_total{_labels(self.labelnames, values)} {_number(v)}"
+            for values, v in sorted(self._samples().items())
+        ]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labelvalues) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def render(self) -> list[str]:
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, values)} {_number(v)}"
+            for values, v in sorted(self._samples().items())
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labelvalues) -> None:
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        with self._lock:
+            series_items = sorted((k, list(v)) for k, v in self._series.items())
+        for values, series in series_items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += n
+                le = 'le="%s"' % (bound if bound == "+Inf" else _number(float(bound)))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_number(series[-1])}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+# ── Catalogue ────────────────────────────────────────────────────────────────
+
+http_requests = Counter("http_requests", "Tracked requests by path and status.", ("path", "status"))
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Tracked request latency by path and status.", ("path", "status"),
+)
+request_stage_duration = Histogram(
+    "request_stage_duration_seconds", "Time per pipeline stage within tracked requests.", ("stage",),
+)
+
+download_slots_active = Gauge("download_slots_active", "Extractions holding a download slot, by pool.", ("pool",))
+download_slots_queued = Gauge("download_slots_queued", "Extractions waiting for a download slot, by pool.", ("pool",))
+download_slot_wait = Histogram("download_slot_wait_seconds", "Time spent waiting for a download slot.", ("pool",))
+download_pool_limit = Gauge("download_pool_limit", "Adaptive slot limit of a download pool.", ("pool",))
+download_slots_shed = Counter(
+    "download_slots_shed", "Requests turned away by a pool before extraction, by reason.", ("pool", "reason"),
+)
+download_slots_borrowed = Counter(
+    "download_slots_borrowed", "Slots a pool borrowed from another pool.", ("pool", "lender"),
+)
+
+media_queue_depth = Gauge("media_queue_depth", "Jobs waiting in a media worker queue.", ("service",))
+media_job_duration = Histogram(
+    "media_job_duration_seconds", "Media job processing time.", ("service", "outcome"), buckets=JOB_BUCKETS,
+)
+
+cache_hits = Counter("cache_hits", "Extractor cache hits by namespace and tier.", ("namespace", "tier"))
+cache_misses = Counter("cache_misses", "Extractor cache misses (L1 and L2) by namespace.", ("namespace",))
+
+proxy_bytes = Counter("proxy_bytes", "Proxy wire traffic (requests and responses) by region.", ("region",))
+
+redis_errors = Counter("redis_errors", "Failed Redis operations by component.", ("component",))
+
+executor_threads = Gauge("executor_threads", "Threads in a named executor pool.", ("pool",))
+executor_busy = Gauge("executor_busy", "Executor threads currently running a call.", ("pool",))
+executor_queued = Gauge("executor_queued", "Calls waiting for an executor thread.", ("pool",))
+executor_busy_seconds = Counter(
+    "executor_busy_seconds", "Thread time spent running calls; rate / executor_threads is utilisation.", ("pool",),
+)
+executor_wait = Histogram(
+    "executor_wait_seconds", "Time a call waited for an executor thread.", ("pool",), buckets=LAG_BUCKETS,
+)
+
+event_loop_lag = Histogram("event_loop_lag_seconds", "Event-loop heartbeat delay.", buckets=LAG_BUCKETS)
+event_loop_stalls = Counter("event_loop_stalls", "Times the event loop was blocked past the stall threshold.")
+
+log_records_dropped = Counter("log_records_dropped", "Log records dropped because the log queue was full.")
+log_records_dropped.set_collector(lambda: {(): log.dropped_records()})
@@ -1,7 +1,11 @@
+import asyncio
 import time
 import json
+from collections import defaultdict, deque
 from contextvars import ContextVar
-from app.config import redis_client as _r
+from app.config import async_redis_client as _ar
+from app.utils.cache import cache, negative_cache
+from app.utils import hot_urls, histogram, metrics, spans, log, loop_lag
 
 # Middleware sets _req_id in parent task → child task inherits it (read-only inheritance works).
 # Services write bytes to global dict using the inherited req_id.
@@ -28,25 +32,72 @@ STATS_KEY = "monitor:stats"
 RECENT_KEY = "monitor:recent"
 FAILED_KEY = "monitor:failed"
 ACTIVE_KEY = "monitor:active"
-PATH_PREFIX = "monitor:path:"
+PATHS_KEY = "monitor:paths"                # ZSET route template -> total requests
+PATHS_FAILED_KEY = "monitor:paths_failed"  # HASH route template -> failed requests
 
 RECENT_MAX = 100
+TOP_PATHS = 8
 FAILED_MAX = 50
+UNMATCHED_ROUTE = "unmatched"  # path label (metrics, latency series) for requests no route matched
+STATS_WINDOW = 172800       # seconds — stats reset automatically after 2 days
+FLUSH_INTERVAL = 1.0        # seconds between batched Redis writes
+FLUSH_TIMEOUT = 2.0         # give up on a flush rather than let it pile up
+
+# Latency histograms (see app/utils/histogram.py) are kept per series in
+# fixed time slots: the 1m window is LATENCY_SLOTS x 10s slots and the 1h
+# window LATENCY_SLOTS x 10min slots. Each slot is one Redis hash of
+# "series|bucket" -> count shared by all workers; a window is the merge of
+# its last LATENCY_SLOTS slots, so it covers between 5/6 and all of its span.
+LATENCY_PREFIX = "monitor:latency:"
+LATENCY_WINDOWS = {"1m": 10, "1h": 600}  # window -> slot seconds
+LATENCY_SLOTS = 6
+LATENCY_SERIES_MAX = 20  # per kind on the dashboard
+
+_log = log.get_logger("monitor")
+
+
+def _new_batch() -> dict:
+    return {
+        "active": 0,
+        "stats": defaultdict(int),
+        "paths": defaultdict(lambda: defaultdict(int)),
+        "latency": defaultdict(lambda: defaultdict(int)),  # series -> bucket -> count
+        "recent": deque(maxlen=RECENT_MAX),
+        "failed": deque(maxlen=FAILED_MAX),
+    }
+
+
+# Events are aggregated here and written by _flush_loop in one pipeline, so
+# request_started/request_finished never touch Redis on the request path.
+_pending = _new_batch()
+
+
+def region_label(region: str | None) -> str:
+    """Region as a metric label — it is user input, so anything but a 2-letter code becomes "-"."""
+    region = (region or "-").lower()
+    return region if len(region) == 2 and region.isalpha() else "-"
+
+
+def _latency_series(entry: dict, route: str) -> list[str]:
+    """Series a request's latency is recorded under: its route template, and platform/region for social downloads.
+
+    Per-stage timings go into "stage:<name>" series in request_finished.
+    """
+    series = ["path:" + route]
+    parts = route.split("/")
+    if route.startswith("/tools/social/") and len(parts) > 3:
+        platform = parts[3].split("-")[0]  # x-twitter -> x
+        series.append(f"platform:{platform}/{region_label(entry.get('region'))}")
+    return series
 
 
 def request_started(path: str, method: str, region: str, video_url: str, req_id: int, payload: dict = None, ip: str = None) -> dict:
-    try:
-        _r.incr(ACTIVE_KEY)
-        _r.hincrby(STATS_KEY, "total", 1)
-        if _r.hsetnx(STATS_KEY, "start_time", time.time()):
-            # New stats window — expire the whole key after 2 days so it resets automatically
-            _r.expire(STATS_KEY, 172800)
-            for pk in _r.keys(PATH_PREFIX + "*"):
-                _r.expire(pk, 172800)
-    except Exception as e:
-        print(f"[monitor] Redis error: {e}")
+    _pending["active"] += 1
+    _pending["stats"]["total"] += 1
     _set_request_id(req_id)
     return {
+        "spans": spans.start(),
+        "request_id": log.bind_request(),  # correlates log lines with this entry
         "path": path,
         "method": method,
         "region": region or "-",
@@ -58,72 +109,190 @@ def request_started(path: str, method: str, region: str, video_url: str, req_id:
     }
 
 
-def request_finished(entry: dict, status_code: int, error_body: str = None):
-    try:
-        if int(_r.get(ACTIVE_KEY) or 0) > 0:
-            _r.decr(ACTIVE_KEY)
-
-        if status_code < 400:
-            _r.hincrby(STATS_KEY, "success", 1)
-        else:
-            _r.hincrby(STATS_KEY, "failed", 1)
-
-        duration_ms = round((time.time() - entry["started_at"]) * 1000)
-        path_key = PATH_PREFIX + entry["path"]
-        _r.hincrby(path_key, "total", 1)
-        if status_code >= 400:
-            _r.hincrby(path_key, "failed", 1)
-
-        proxy_bytes = _get_and_reset_proxy_bytes(entry.get("req_id", 0))
-        record = {
-            "path": entry["path"],
-            "method": entry["method"],
-            "region": entry["region"],
-            "url": entry["url"],
-            "ip": entry.get("ip", "-"),
-            "status": status_code,
-            "duration_ms": duration_ms,
-            "started_at": entry["started_at"],
-            "proxy_kb": round(proxy_bytes / 1024, 1) if proxy_bytes else 0,
-        }
-        _r.lpush(RECENT_KEY, json.dumps(record))
-        _r.ltrim(RECENT_KEY, 0, RECENT_MAX - 1)
+def request_finished(entry: dict, status_code: int, error_body: str = None, route: str = None):
+    """`route` is the matched route template (/tools/media/job/{job_id}) — aggregates use it, so ids don't mint series."""
+    _pending["active"] -= 1
+    _pending["stats"]["success" if status_code < 400 else "failed"] += 1
+    route = route or UNMATCHED_ROUTE
 
-        if status_code >= 400:
-            failed_record = {**record, "payload": entry.get("payload"), "error": error_body}
-            _r.lpush(FAILED_KEY, json.dumps(failed_record))
-            _r.ltrim(FAILED_KEY, 0, FAILED_MAX - 1)
+    duration_ms = round((time.time() - entry["started_at"]) * 1000)
+    path_counts = _pending["paths"][route]
+    path_counts["total"] += 1
+    if status_code >= 400:
+        path_counts["failed"] += 1
+    bucket = histogram.bucket_index(duration_ms)
+    for series in _latency_series(entry, route):
+        _pending["latency"][series][bucket] += 1
 
+    proxy_bytes = _get_and_reset_proxy_bytes(entry.get("req_id", 0))
+    metrics.http_requests.inc(route, str(status_code))
+    metrics.http_request_duration.observe(duration_ms / 1000, route, str(status_code))
+    record = {
+        "path": entry["path"],
+        "method": entry["method"],
+        "region": entry["region"],
+        "url": entry["url"],
+        "ip": entry.get("ip", "-"),
+        "status": status_code,
+        "duration_ms": duration_ms,
+        "started_at": entry["started_at"],
+        "proxy_kb": round(proxy_bytes / 1024, 1) if proxy_bytes else 0,
+        "stages": {stage: round(ms, 1) for stage, ms in entry["spans"].items()},
+        "request_id": entry["request_id"],
+    }
+    for stage, ms in entry["spans"].items():
+        _pending["latency"]["stage:" + stage][histogram.bucket_index(ms)] += 1
+        metrics.request_stage_duration.observe(ms / 1000, stage)
+    _pending["recent"].append(record)
+    if status_code >= 400:
+        _pending["failed"].append({**record, "payload": entry.get("payload"), "error": error_body})
+
+
+def _drain() -> dict:
+    """Swap out the pending batch — no await between read and reset, so nothing is lost."""
+    global _pending
+    batch = _pending
+    _pending = _new_batch()
+    return batch
+
+
+def _merge_back(batch: dict) -> None:
+    """Return a batch that failed to flush; records past the caps are dropped."""
+    _pending["active"] += batch["active"]
+    for field, n in batch["stats"].items():
+        _pending["stats"][field] += n
+    for name in ("paths", "latency"):
+        for key, counts in batch[name].items():
+            for field, n in counts.items():
+                _pending[name][key][field] += n
+    for name in ("recent", "failed"):
+        merged = deque(batch[name], maxlen=_pending[name].maxlen)
+        merged.extend(_pending[name])
+        _pending[name] = merged
+
+
+async def flush() -> None:
+    """Write everything aggregated since the last flush in one pipeline."""
+    batch = _drain()
+    if not (batch["active"] or batch["stats"] or batch["recent"]):
+        return
+    try:
+        async with asyncio.timeout(FLUSH_TIMEOUT):
+            async with _ar.pipeline(transaction=False) as pipe:
+                pipe.hsetnx(STATS_KEY, "start_time", time.time())
+                if batch["active"]:
+                    pipe.incrby(ACTIVE_KEY, batch["active"])
+                for field, n in batch["stats"].items():
+                    pipe.hincrby(STATS_KEY, field, n)
+                for path, counts in batch["paths"].items():
+                    if counts["total"]:
+                        pipe.zincrby(PATHS_KEY, counts["total"], path)
+                    if counts["failed"]:
+                        pipe.hincrby(PATHS_FAILED_KEY, path, counts["failed"])
+                if batch["recent"]:
+                    pipe.lpush(RECENT_KEY, *(json.dumps(r) for r in batch["recent"]))
+                    pipe.ltrim(RECENT_KEY, 0, RECENT_MAX - 1)
+                if batch["failed"]:
+                    pipe.lpush(FAILED_KEY, *(json.dumps(r, default=str) for r in batch["failed"]))
+                    pipe.ltrim(FAILED_KEY, 0, FAILED_MAX - 1)
+                if batch["latency"]:
+                    now = time.time()
+                    for window, slot_seconds in LATENCY_WINDOWS.items():
+                        key = f"{LATENCY_PREFIX}{window}:{int(now // slot_seconds)}"
+                        for series, counts in batch["latency"].items():
+                            for bucket, n in counts.items():
+                                pipe.hincrby(key, f"{series}|{bucket}", n)
+                        pipe.expire(key, slot_seconds * (LATENCY_SLOTS + 1))
+                window_keys = (STATS_KEY, PATHS_KEY, PATHS_FAILED_KEY)
+                for key in window_keys:
+                    pipe.ttl(key)
+                ttls = (await pipe.execute())[-len(window_keys):]
+            # Any stats key this flush created (the path keys usually appear after
+            # start_time) gets the 2-day expiry, so all three reset automatically
+            missing = [key for key, ttl in zip(window_keys, ttls) if ttl == -1]
+            if missing:
+                async with _ar.pipeline(transaction=False) as pipe:
+                    for key in missing:
+                        pipe.expire(key, STATS_WINDOW)
+                    await pipe.execute()
     except Exception as e:
-        print(f"[monitor] Redis error in request_finished: {e}")
+        _merge_back(batch)
+        metrics.redis_errors.inc("monitor")
+        _log.warning("Redis flush error: %s", e)
+
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await flush()
+
+
+def start_flusher() -> None:
+    asyncio.create_task(_flush_loop())
+
+
+def _latency_snapshot(latency_slots: list[dict]) -> dict:
+    """Merge slot hashes into per-series percentiles: {"path": [...], "platform": [...], "stage": [...]}."""
+    merged = {window: defaultdict(dict) for window in LATENCY_WINDOWS}
+    for i, slot in enumerate(latency_slots):
+        window = list(LATENCY_WINDOWS)[i // LATENCY_SLOTS]
+        for field, n in slot.items():
+            series, bucket = field.decode().rsplit("|", 1)
+            counts = merged[window][series]
+            counts[int(bucket)] = counts.get(int(bucket), 0) + int(n)
+
+    result = {"path": [], "platform": [], "stage": []}
+    for series in set().union(*(merged[w] for w in LATENCY_WINDOWS)):
+        kind, name = series.split(":", 1)
+        row = {"name": name}
+        for window in LATENCY_WINDOWS:
+            row[window] = histogram.percentiles(merged[window].get(series, {}))
+        result.setdefault(kind, []).append(row)
+    for kind, rows in result.items():
+        rows.sort(key=lambda r: r["1h"]["count"], reverse=True)
+        result[kind] = rows[:LATENCY_SERIES_MAX]
+    return result
+
+
+def _cache_snapshot() -> dict:
+    """In-process cache occupancy — per worker, no Redis involved."""
+    return {"extractor": cache.stats(), "negative": negative_cache.stats()}
 
 
-def get_snapshot(downloads_active: int, downloads_queued: int) -> dict:
+async def get_snapshot(downloads: dict) -> dict:
+    cache_stats = _cache_snapshot()
     try:
-        stats = _r.hgetall(STATS_KEY)
+        async with _ar.pipeline(transaction=False) as pipe:
+            pipe.hgetall(STATS_KEY)
+            pipe.get(ACTIVE_KEY)
+            pipe.lrange(RECENT_KEY, 0, 29)
+            pipe.lrange(FAILED_KEY, 0, 19)
+            pipe.zrevrange(PATHS_KEY, 0, TOP_PATHS - 1, withscores=True)
+            pipe.hgetall(PATHS_FAILED_KEY)
+            now = time.time()
+            for window, slot_seconds in LATENCY_WINDOWS.items():
+                current = int(now // slot_seconds)
+                for slot in range(current - LATENCY_SLOTS + 1, current + 1):
+                    pipe.hgetall(f"{LATENCY_PREFIX}{window}:{slot}")
+            stats, active, recent_raw, failed_raw, path_totals, path_failed, *latency_slots = await pipe.execute()
         total = int(stats.get(b"total", 0))
         success = int(stats.get(b"success", 0))
         failed_count = int(stats.get(b"failed", 0))
         start_time = float(stats.get(b"start_time", time.time()))
-        active = int(_r.get(ACTIVE_KEY) or 0)
+        active = max(0, int(active or 0) + _pending["active"])
 
         uptime = int(time.time() - start_time)
         hours, rem = divmod(uptime, 3600)
         minutes, seconds = divmod(rem, 60)
 
-        path_keys = _r.keys(PATH_PREFIX + "*")
-        top_paths = []
-        for pk in path_keys:
-            ph = _r.hgetall(pk)
-            top_paths.append({
-                "path": pk.decode().replace(PATH_PREFIX, ""),
-                "total": int(ph.get(b"total", 0)),
-                "failed": int(ph.get(b"failed", 0)),
-            })
-        top_paths.sort(key=lambda x: x["total"], reverse=True)
+        top_paths = [{
+            "path": path.decode(),
+            "total": int(total),
+            "failed": int(path_failed.get(path, 0)),
+        } for path, total in path_totals]
 
-        recent = [json.loads(x) for x in _r.lrange(RECENT_KEY, 0, 29)]
-        failed_list = [json.loads(x) for x in _r.lrange(FAILED_KEY, 0, 19)]
+        recent = [json.loads(x) for x in recent_raw]
+        failed_list = [json.loads(x) for x in failed_raw]
 
         return {
             "uptime": f"{hours}h {minutes}m {seconds}s",
@@ -131,21 +300,30 @@ def get_snapshot(downloads_active: int, downloads_queued: int) -> dict:
             "total_requests": total,
             "success_requests": success,
             "failed_requests": failed_count,
-            "downloads": {"active": downloads_active, "queued": downloads_queued, "max": 4},
-            "top_paths": top_paths[:8],
+            "downloads": downloads,
+            "top_paths": top_paths,
             "recent": recent,
             "failed_list": failed_list,
+            "latency": _latency_snapshot(latency_slots),
+            "cache": cache_stats,
+            "hot_urls": hot_urls.snapshot(),
+            "loop_lag": loop_lag.snapshot(),
         }
     except Exception as e:
-        print(f"[monitor] Redis snapshot error: {e}")
+        metrics.redis_errors.inc("monitor")
+        _log.warning("Redis snapshot error: %s", e)
         return {
             "uptime": "unknown",
             "active_requests": 0,
             "total_requests": 0,
             "success_requests": 0,
             "failed_requests": 0,
-            "downloads": {"active": downloads_active, "queued": downloads_queued, "max": 4},
+            "downloads": downloads,
             "top_paths": [],
             "recent": [],
             "failed_list": [],
+            "latency": {},
+            "cache": cache_stats,
+            "hot_urls": hot_urls.snapshot(),
+            "loop_lag": loop_lag.snapshot(),
         }
\ No newline at end of file
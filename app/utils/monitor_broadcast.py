@@ -0,0 +1,106 @@
+import asyncio
+import json
+from app.utils import monitor, concurrency, log
+
+# One task computes the monitor snapshot per interval and fans it out to
+# every /ws/monitor subscriber, instead of a get_snapshot() loop per viewer.
+#
+# A subscriber's first frame is {"type": "full", "data": snapshot}; after
+# that it gets {"type": "delta", "set": {...}, "prepend": {...}} frames with
+# only the top-level fields that changed, and for the recent/failed lists
+# only the entries that are new since the previous tick.
+#
+# Each subscriber has a small bounded queue. A client that falls behind has
+# its backlog discarded and is resynced with one full frame, so a slow
+# viewer is down-sampled rather than buffering frames or stalling others.
+
+BROADCAST_INTERVAL = 1.0    # seconds
+SUBSCRIBER_QUEUE_MAX = 4    # frames — roughly seconds a viewer may lag
+SEND_TIMEOUT = 5.0          # seconds before a stuck viewer is dropped
+PREPEND_FIELDS = ("recent", "failed_list")
+
+_log = log.get_logger("monitor")
+
+# subscriber queue -> True until it has been sent a full frame
+_subscribers: dict[asyncio.Queue, bool] = {}
+_task: asyncio.Task | None = None
+
+
+def subscribe() -> asyncio.Queue:
+    global _task
+    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_MAX)
+    _subscribers[queue] = True
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_broadcast_loop())
+    return queue
+
+
+def unsubscribe(queue: asyncio.Queue) -> None:
+    _subscribers.pop(queue, None)
+
+
+def _new_entries(previous: list, current: list) -> list | None:
+    """Entries at the head of current that weren't in previous, or None if they can't be lined up."""
+    if not previous:
+        return list(current)
+    try:
+        return current[:current.index(previous[0])]
+    except ValueError:
+        return None
+
+
+def _delta(previous: dict, current: dict) -> dict:
+    changed, prepend = {}, {}
+    for field, value in current.items():
+        if value == previous.get(field):
+            continue
+        if field in PREPEND_FIELDS:
+            entries = _new_entries(previous.get(field) or [], value)
+            if entries is not None:
+                prepend[field] = entries
+                continue
+        changed[field] = value
+    frame = {"type": "delta"}
+    if changed:
+        frame["set"] = changed
+    if prepend:
+        frame["prepend"] = prepend
+    return frame
+
+
+def _offer(queue: asyncio.Queue, frame: str) -> None:
+    if queue.full():
+        # Behind by SUBSCRIBER_QUEUE_MAX frames — drop the backlog and resync
+        while not queue.empty():
+            queue.get_nowait()
+        _subscribers[queue] = True
+        return
+    queue.put_nowait(frame)
+
+
+async def _broadcast_loop() -> None:
+    previous = None
+    while _subscribers:
+        try:
+            snapshot = await monitor.get_snapshot(concurrency.snapshot())
+            full_frame = None
+            delta_frame = None
+            if previous is not None:
+                delta = _delta(previous, snapshot)
+                if len(delta) > 1:
+                    delta_frame = json.dumps(delta)
+            previous = snapshot
+
+            for queue, needs_full in list(_subscribers.items()):
+                if needs_full:
+                    if full_frame is None:
+                        full_frame = json.dumps({"type": "full", "data": snapshot})
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(full_frame)
+                    _subscribers[queue] = False
+                elif delta_frame is not None:
+                    _offer(queue, delta_frame)
+        except Exception as e:
+            _log.warning("Broadcast error: %s", e)
+        await asyncio.sleep(BROADCAST_INTERVAL)
@@ -0,0 +1,116 @@
+import urllib.request
+import httpx
+import yt_dlp
+from app.utils import monitor, metrics
+
+# Wire-level proxy traffic metering.
+#
+# Bytes are counted where they cross the transport — request line, headers
+# and body going out; headers and (still compressed) body coming back — and
+# reported both to the current request's monitor entry and to the
+# proxy_bytes metric under the proxy's region. Direct connections are not
+# counted. Traffic through an environment proxy (instagram_service sets
+# https_proxy for the process) is labelled "env".
+
+
+def _env_proxy() -> str | None:
+    return urllib.request.getproxies().get("https")
+
+
+def _label(region: str | None, proxy: str | None) -> str | None:
+    if proxy:
+        return monitor.region_label(region)
+    return "env" if _env_proxy() else None
+
+
+def _record(label: str, byte_count: int) -> None:
+    if byte_count:
+        monitor.add_request_proxy_bytes(byte_count)
+        metrics.proxy_bytes.inc(label, amount=byte_count)
+
+
+def _headers_size(headers) -> int:
+    return sum(len(k) + len(v) + 4 for k, v in headers.items())  # "k: v\r\n"
+
+
+# ── httpx ────────────────────────────────────────────────────────────────────
+
+class _MeteredStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, label: str):
+        self._stream = stream
+        self._label = label
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            _record(self._label, len(chunk))
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """Wraps a transport and meters each request and response body as it streams."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, label: str):
+        self._transport = transport
+        self._label = label
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        sent = len(request.method) + len(str(request.url)) + 11 + _headers_size(request.headers)
+        sent += int(request.headers.get("content-length") or 0)
+        _record(self._label, sent)
+        response = await self._transport.handle_async_request(request)
+        _record(self._label, 17 + _headers_size(response.headers))  # + status line
+        response.stream = _MeteredStream(response.stream, self._label)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def async_client(region: str | None = None, proxy: str | None = None, **kwargs) -> httpx.AsyncClient:
+    """httpx.AsyncClient(**kwargs) whose proxied traffic is metered under `region`.
+
+    httpx mounts proxy transports in front of a custom transport, so the proxy
+    (explicit, else the environment's) is set on the wrapped transport instead.
+    """
+    label = _label(region, proxy)
+    if label is None:
+        return httpx.AsyncClient(proxy=proxy, **kwargs)
+    transport = httpx.AsyncHTTPTransport(proxy=proxy or _env_proxy())
+    return httpx.AsyncClient(transport=MeteredTransport(transport, label), **kwargs)
+
+
+# ── yt-dlp ───────────────────────────────────────────────────────────────────
+
+class YoutubeDL(yt_dlp.YoutubeDL):
+    """yt_dlp.YoutubeDL that meters every request its extractors and downloaders make."""
+
+    def __init__(self, params: dict = None, *args, region: str | None = None, **kwargs):
+        super().__init__(params, *args, **kwargs)
+        self._meter_label = _label(region, (params or {}).get("proxy"))
+
+    def urlopen(self, req):
+        response = super().urlopen(req)
+        if self._meter_label is None:
+            return response
+        label = self._meter_label
+
+        if isinstance(req, str):
+            sent = len(req) + 16
+        else:
+            data = req.data if isinstance(req.data, bytes) else b""
+            url = getattr(req, "url", None) or req.full_url  # yt-dlp Request or urllib's
+            sent = len(req.method or "GET") + len(url) + 11 + _headers_size(req.headers) + len(data)
+        _record(label, sent + 17 + _headers_size(response.headers))
+
+        read = response.read
+
+        def metered_read(amt: int = None) -> bytes:
+            data = read(amt)
+            _record(label, len(data))
+            return data
+
+        response.read = metered_read
+        return response
@@ -0,0 +1,73 @@
+import json
+from fastapi import Request
+from starlette.types import Receive, Scope
+
+# RequestLogMiddleware peeks at small JSON bodies to log region/url; the parsed
+# payload is left on request.state so controllers don't parse it again.
+# Anything else (uploads, form posts, large bodies) is streamed through unread.
+
+JSON_PEEK_MAX_BYTES = 64 * 1024
+STATE_KEY = "json_payload"
+
+
+def _header(scope: Scope, name: bytes) -> bytes | None:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value
+    return None
+
+
+def _is_small_json(scope: Scope) -> bool:
+    content_type = _header(scope, b"content-type")
+    if not content_type or content_type.split(b";")[0].strip().lower() != b"application/json":
+        return False
+    length = _header(scope, b"content-length")
+    try:
+        return length is None or int(length) <= JSON_PEEK_MAX_BYTES
+    except ValueError:
+        return False
+
+
+async def peek_json(scope: Scope, receive: Receive):
+    """Parse a small JSON request body without consuming it.
+
+    Returns (payload, receive). payload is None when the body isn't JSON, is over
+    JSON_PEEK_MAX_BYTES or doesn't parse; the returned receive replays whatever was
+    read, so the app downstream sees the body untouched.
+    """
+    if not _is_small_json(scope):
+        return None, receive
+
+    buffered = []
+    size = 0
+    more_body = True
+    while more_body and size <= JSON_PEEK_MAX_BYTES:
+        message = await receive()
+        buffered.append(message)
+        if message["type"] != "http.request":
+            break  # client disconnected
+        size += len(message.get("body", b""))
+        more_body = message.get("more_body", False)
+
+    payload = None
+    if not more_body and buffered[-1]["type"] == "http.request":
+        try:
+            payload = json.loads(b"".join(m.get("body", b"") for m in buffered))
+            scope.setdefault("state", {})[STATE_KEY] = payload
+        except ValueError:
+            payload = None
+
+    async def replay():
+        if buffered:
+            return buffered.pop(0)
+        return await receive()
+
+    return payload, replay
+
+
+async def json_payload(request: Request):
+    """The request's JSON body — reuses the middleware's parse when there was one."""
+    state = request.scope.get("state") or {}
+    if STATE_KEY in state:
+        return state[STATE_KEY]
+    return await request.json()
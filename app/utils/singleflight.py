@@ -0,0 +1,170 @@
+import asyncio
+import contextvars
+import uuid
+from typing import Any, Awaitable, Callable
+from fastapi import HTTPException
+from app.config import async_redis_client as _ar
+from app.utils.cache import cache, negative_cache
+from app.utils import metrics, log, deadline
+
+_log = log.get_logger("singleflight")
+
+# Collapses concurrent identical work (e.g. the same viral URL) into one call.
+# Callers pass the cache key the work fills; everyone awaiting that key while
+# it is in flight shares the leader's result or exception.
+#
+# The work runs in the leader's context, so it is bound by the leader's
+# request deadline. When it fails only for lack of time (a 429 shed from the
+# slot queue or a 504, see _out_of_time) that says nothing about the others:
+# the followers don't get that error, one of them becomes the new leader.
+#
+# With distributed=True a Redis lock extends this across uvicorn workers:
+# a worker that loses the lock polls the cache until the winner fills it —
+# at most until its own deadline — and falls back to doing the work itself
+# if the winner gives up or dies.
+
+LOCK_PREFIX = "singleflight:"
+LOCK_TTL = 90           # seconds — upper bound on one extraction
+POLL_INTERVAL = 0.25    # seconds between cache polls while another worker holds the lock
+REFRESH_AHEAD = 120     # seconds — re-extract hot entries this long before they expire
+
+_inflight: dict[str, asyncio.Task] = {}
+_background: set[asyncio.Task] = set()
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+async def run(key: str, fn: Callable[[], Awaitable[Any]], distributed: bool = False) -> Any:
+    """
+    Await fn() once per key across all concurrent callers in this process.
+
+    The work runs in its own task, so a caller that is cancelled (client
+    disconnect, request timeout) does not cancel it for the others.
+    """
+    while True:
+        task = _inflight.get(key)
+        leader = task is None
+        if leader:
+            coro = _run_distributed(key, fn) if distributed else fn()
+            task = asyncio.ensure_future(coro)
+            _inflight[key] = task
+            task.add_done_callback(lambda t: _finished(key, t))
+        try:
+            return await asyncio.shield(task)
+        except HTTPException as e:
+            if leader or not _out_of_time(e):
+                raise
+            # The leader ran out of its own time budget; try again with ours
+            if _inflight.get(key) is task:
+                del _inflight[key]
+
+
+def _out_of_time(exc: HTTPException) -> bool:
+    """Whether the work was given up for the caller's deadline (slot queue shed or timeout), not for the URL."""
+    return exc.status_code in (429, 504)
+
+
+def refresh_ahead(key: str, fn: Callable[[], Awaitable[Any]], window: float = REFRESH_AHEAD) -> None:
+    """
+    Stale-while-revalidate: call on a cache hit. If the entry expires within
+    `window` seconds, fn() is run in the background to refill it while the
+    caller keeps serving the still-valid cached value.
+    """
+    if key in _inflight:
+        return
+    remaining = cache.ttl_remaining(key)
+    if remaining is None or remaining > window:
+        return
+    # Fresh context: the refresh must not be billed to the request that triggered it
+    task = asyncio.get_running_loop().create_task(_refresh(key, fn, window), context=contextvars.Context())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def refresh_if_expiring(key: str, fn: Callable[[], Awaitable[Any]], window: float = REFRESH_AHEAD) -> bool:
+    """
+    Await fn() if the cached entry is missing or expires within `window` seconds.
+
+    If another worker already refreshed the shared L2 copy, the stale L1 copy
+    is dropped instead, so the next read picks up the fresh one.
+
+    Returns:
+        True if fn() was run
+    """
+    if negative_cache.get(key) is not None:
+        return False
+    remaining = cache.ttl_remaining(key)
+    if remaining is not None and remaining > window:
+        return False
+    shared = await cache.attl_remaining(key)
+    if shared is not None and shared > window:
+        cache.l1.delete(key)
+        return False
+    await run(key, fn, distributed=True)
+    return True
+
+
+async def _refresh(key: str, fn: Callable[[], Awaitable[Any]], window: float) -> None:
+    try:
+        await refresh_if_expiring(key, fn, window)
+    except Exception as e:
+        _log.warning("Background refresh failed for %s: %s", key, e)
+
+
+def _finished(key: str, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()  # mark retrieved even if every caller went away
+
+
+async def _run_distributed(key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    lock_key = LOCK_PREFIX + key
+    token = uuid.uuid4().hex
+    try:
+        acquired = await _ar.set(lock_key, token, nx=True, ex=LOCK_TTL)
+    except Exception as e:
+        metrics.redis_errors.inc("singleflight")
+        _log.warning("Redis error: %s", e)
+        return await fn()
+
+    if not acquired:
+        result = await _wait_for_other_worker(key, lock_key)
+        if result is not None:
+            return result
+        return await fn()
+
+    try:
+        return await fn()
+    finally:
+        try:
+            await _ar.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+        except Exception as e:
+            metrics.redis_errors.inc("singleflight")
+            _log.warning("Redis error releasing lock: %s", e)
+
+
+async def _wait_for_other_worker(key: str, lock_key: str) -> Any:
+    """Poll the cache while another worker holds the lock. None means do it ourselves; raises the 504 if our time runs out first."""
+    loop = asyncio.get_running_loop()
+    budget = deadline.remaining()
+    give_up = loop.time() + (LOCK_TTL if budget is None else min(LOCK_TTL, budget))
+    while loop.time() + POLL_INTERVAL < give_up:
+        await asyncio.sleep(POLL_INTERVAL)
+        result = await cache.aget(key)
+        if result is not None:
+            return result
+        try:
+            if not await _ar.exists(lock_key):
+                # Lock released without a cached result — the other worker failed
+                return await cache.aget(key)
+        except Exception:
+            return None
+    if budget is not None and budget < LOCK_TTL:
+        raise deadline.exceeded()  # out of time here, not a dead winner — don't start the work now
+    return None
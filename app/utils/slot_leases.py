@@ -0,0 +1,203 @@
+import asyncio
+import time
+import uuid
+from typing import Callable
+from app.config import async_redis_client as _ar
+from app.utils import metrics, log
+
+_log = log.get_logger("slot_leases")
+
+# Host-wide download slots, shared by every uvicorn worker through Redis.
+#
+# Each pool is a FIFO of leases: a sorted set of tokens scored by a ticket
+# number (INCR), plus a sorted set of the same tokens scored by lease
+# expiry. A token holds a slot while fewer than `limit` tokens are ahead of
+# it, so slots are handed out in arrival order whichever worker the request
+# landed on — no worker can starve the others by polling harder. Holders
+# only ever leave the front, so ranks below the limit are always holders.
+#
+# Every worker runs one sync loop (start()) that renews its own leases and
+# reads the ranks of its waiting tokens and each pool's host-wide depth —
+# every SYNC_INTERVAL while something is waiting here, IDLE_SYNC_INTERVAL
+# otherwise, and straight away when this worker queues a request or frees a
+# slot (_wake). A worker that crashes stops renewing, and its tokens are
+# dropped LEASE_TTL later by whichever worker touches the pool next, so its
+# slots come back on their own.
+#
+# Errors surface as LeaseUnavailable; concurrency.download_slot() then falls
+# back to the worker's own pools instead of failing the request.
+
+PREFIX = "slots:"
+LEASE_TTL = 30.0            # seconds a lease survives without renewal
+SYNC_INTERVAL = 0.1         # seconds between syncs while a local request is waiting
+IDLE_SYNC_INTERVAL = 1.0    # seconds between syncs otherwise (renewals, host queue depth)
+
+# KEYS: owners, leases, ticket counter. ARGV: token, now, ttl. Returns {rank, tokens in pool}.
+_ENQUEUE_SCRIPT = """
+local expired = redis.call('zrangebyscore', KEYS[2], '-inf', ARGV[2])
+for _, token in ipairs(expired) do redis.call('zrem', KEYS[1], token) end
+redis.call('zremrangebyscore', KEYS[2], '-inf', ARGV[2])
+redis.call('zadd', KEYS[1], redis.call('incr', KEYS[3]), ARGV[1])
+redis.call('zadd', KEYS[2], tonumber(ARGV[2]) + tonumber(ARGV[3]), ARGV[1])
+return {redis.call('zrank', KEYS[1], ARGV[1]), redis.call('zcard', KEYS[1])}
+"""
+
+# KEYS: owners, leases. ARGV: now, ttl, tokens... Renews the live tokens and
+# returns {tokens in pool, rank of each token or -1 if its lease expired}.
+_SYNC_SCRIPT = """
+local expired = redis.call('zrangebyscore', KEYS[2], '-inf', ARGV[1])
+for _, token in ipairs(expired) do redis.call('zrem', KEYS[1], token) end
+redis.call('zremrangebyscore', KEYS[2], '-inf', ARGV[1])
+local result = {redis.call('zcard', KEYS[1])}
+for i = 3, #ARGV do
+    local rank = redis.call('zrank', KEYS[1], ARGV[i])
+    if rank then
+        redis.call('zadd', KEYS[2], tonumber(ARGV[1]) + tonumber(ARGV[2]), ARGV[i])
+        table.insert(result, rank)
+    else
+        table.insert(result, -1)
+    end
+end
+return result
+"""
+
+
+class LeaseUnavailable(Exception):
+    """Redis could not grant or keep a lease."""
+
+
+class _Lease:
+    def __init__(self, pool: str):
+        self.pool = pool
+        self.waiter: asyncio.Future | None = None  # set while queued
+
+
+_limits: dict[str, Callable[[], int]] = {}  # pool -> its current slot limit
+_leases: dict[str, _Lease] = {}      # token -> lease held or queued by this worker
+_host_tokens: dict[str, int] = {}    # pool -> leases held or queued on the whole host, as of the last sync
+_background: set[asyncio.Task] = set()
+_task: asyncio.Task | None = None
+_wake = asyncio.Event()  # set by acquire()/release() to run the next sync now
+
+
+def _keys(pool: str) -> tuple[str, str, str]:
+    return PREFIX + pool + ":owners", PREFIX + pool + ":leases", PREFIX + pool + ":ticket"
+
+
+def _error(what: str, e: Exception) -> None:
+    metrics.redis_errors.inc("slot_leases")
+    _log.warning("Redis error %s: %s", what, e)
+
+
+async def acquire(pool: str, max_wait: float | None) -> str:
+    """
+    Take a host-wide slot in `pool`, waiting in FIFO order behind every
+    worker's earlier requests. The pool's limit is read on every sync, so an
+    AIMD change applies to the next hand-over. Returns the lease token for
+    release(); raises TimeoutError after `max_wait` and LeaseUnavailable if
+    Redis fails.
+    """
+    token = uuid.uuid4().hex
+    owners, leases, ticket = _keys(pool)
+    try:
+        rank, count = await _ar.eval(_ENQUEUE_SCRIPT, 3, owners, leases, ticket, token, time.time(), LEASE_TTL)
+    except Exception as e:
+        _error("acquiring a slot", e)
+        raise LeaseUnavailable(str(e)) from e
+    lease = _leases[token] = _Lease(pool)
+    _host_tokens[pool] = count
+    if rank < _limits[pool]():
+        return token
+
+    lease.waiter = asyncio.get_running_loop().create_future()
+    _wake.set()
+    try:
+        async with asyncio.timeout(max_wait):
+            await lease.waiter
+        return token
+    except BaseException:
+        release(token)
+        raise
+
+
+def release(token: str) -> None:
+    """Give a lease back. The Redis delete runs in the background so a response is never held up by it."""
+    lease = _leases.pop(token, None)
+    if lease is None:
+        return
+    task = asyncio.ensure_future(_delete(lease.pool, token))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _delete(pool: str, token: str) -> None:
+    owners, leases, _ = _keys(pool)
+    try:
+        async with _ar.pipeline(transaction=True) as pipe:
+            await pipe.zrem(owners, token).zrem(leases, token).execute()
+    except Exception as e:
+        _error("releasing a slot", e)  # the lease expires on its own after LEASE_TTL
+    _wake.set()  # a freed slot may be ours to hand over
+
+
+async def _sync(pool: str, tokens: list[str]) -> None:
+    owners, leases, _ = _keys(pool)
+    count, *ranks = await _ar.eval(_SYNC_SCRIPT, 2, owners, leases, time.time(), LEASE_TTL, *tokens)
+    _host_tokens[pool] = count
+    limit = _limits[pool]()
+    for token, rank in zip(tokens, ranks):
+        lease = _leases.get(token)
+        if lease is None:
+            continue
+        waiting = lease.waiter is not None and not lease.waiter.done()
+        if rank < 0:
+            # Lost to expiry (the loop was blocked for LEASE_TTL, or Redis was flushed)
+            del _leases[token]
+            if waiting:
+                lease.waiter.set_exception(LeaseUnavailable("lease expired while queued"))
+            else:
+                _log.warning("Download slot lease expired while held", extra={"pool": pool})
+        elif waiting and rank < limit:
+            lease.waiter.set_result(None)
+
+
+async def _sync_loop() -> None:
+    while True:
+        by_pool: dict[str, list[str]] = {pool: [] for pool in _limits}
+        for token, lease in list(_leases.items()):
+            by_pool.setdefault(lease.pool, []).append(token)
+        for pool, tokens in by_pool.items():
+            try:
+                await _sync(pool, tokens)
+            except Exception as e:
+                _error("syncing slots", e)
+                for token in tokens:
+                    lease = _leases.get(token)
+                    if lease is not None and lease.waiter is not None and not lease.waiter.done():
+                        lease.waiter.set_exception(LeaseUnavailable(str(e)))
+        waiting = any(l.waiter is not None and not l.waiter.done() for l in _leases.values())
+        try:
+            await asyncio.wait_for(_wake.wait(), SYNC_INTERVAL if waiting else IDLE_SYNC_INTERVAL)
+        except TimeoutError:
+            pass
+        _wake.clear()
+
+
+def start(limits: dict[str, Callable[[], int]]) -> None:
+    """Register the pools (name -> current limit) and start the sync loop on the running loop."""
+    global _task
+    _limits.update(limits)
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_sync_loop())
+
+
+def host_queued(pool: str) -> int | None:
+    """Requests queued for `pool` across every worker, as of the last sync (None before the first)."""
+    if pool not in _host_tokens:
+        return None
+    return max(0, _host_tokens[pool] - _limits[pool]())
+
+
+def host_tokens(pool: str) -> int | None:
+    """Leases held or queued for `pool` across every worker, as of the last sync."""
+    return _host_tokens.get(pool)
@@ -0,0 +1,37 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Per-stage timings for a request, e.g. {"cache": 1.2, "slot_wait": 340.0}.
+#
+# Works like monitor._req_id_var: monitor.request_started() puts a fresh dict
+# in the context, and tasks and executors.run() calls spawned from the
+# request inherit a reference to that same dict, so stages timed anywhere
+# below the middleware land in it. Outside a request (background refreshes)
+# the var is unset and timing is a no-op.
+#
+# Stages: middleware, auth, cache, oembed, slot_wait, extract_info,
+# format_selection, download, serialization. Repeated stages add up.
+
+_spans_var: ContextVar[dict | None] = ContextVar("spans", default=None)
+
+
+def start() -> dict:
+    spans = {}
+    _spans_var.set(spans)
+    return spans
+
+
+def add(stage: str, ms: float) -> None:
+    spans = _spans_var.get()
+    if spans is not None:
+        spans[stage] = spans.get(stage, 0) + ms
+
+
+@contextmanager
+def span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(stage, (time.perf_counter() - started) * 1000)
@@ -1,6 +1,6 @@
 # Entry point of the app
 from contextlib import asynccontextmanager
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from app.routers import user_router, tools_router
 from app.services.tools.media import compress_service, audio_service, trim_service
 
@@ -12,73 +12,138 @@ from app.config import settings
 from asyncio import timeout
 import asyncio
 import os
-import json as _json
+import time
 from app import config
 from app.utils import monitor
 from app.utils import concurrency
+from app.utils import cache, hot_urls
+from app.utils import request_body
+from app.utils import monitor_broadcast
+from app.utils import metrics
+from app.utils import spans
+from app.utils import log
+from app.utils import loop_lag
+from app.utils import executors
+from app.utils import deadline
 
 
 REQUEST_TIMEOUT = int(settings.REQUEST_TIMEOUT)
 
-MAX_QUEUE_THRESHOLD = 6  # reject new tool requests when queue exceeds this
+ERROR_BODY_MAX = 1000  # bytes of a failed response kept for the monitor
 
-class RequestLogMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        if request.url.path.startswith("/tools/social") and concurrency.downloads_queued >= MAX_QUEUE_THRESHOLD:
-            return JSONResponse(
+_log = log.get_logger("lifespan")
+_request_log = log.get_logger("request")  # one line per tracked request — sample with LOG_SAMPLE
+
+
+def _route_template(scope: Scope) -> str | None:
+    """Path template of the route the router matched (FastAPI leaves it in scope["route"]), if any."""
+    route = scope.get("route")
+    return getattr(route, "path", None)
+
+
+class RequestLogMiddleware:
+    """Pure ASGI — request and response bodies stream through; only small JSON bodies are peeked."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        request = Request(scope)
+        path = scope["path"]
+        pool = concurrency.pool_for_path(path)
+        queued = concurrency.queued(pool)
+        if path.startswith("/tools/social") and queued >= concurrency.queue_limit(pool):
+            response = JSONResponse(
                 status_code=429,
-                content={"detail": "Server is busy. Please try again in a moment.", "queued": concurrency.downloads_queued}
+                content={"detail": "Server is busy. Please try again in a moment.", "queued": queued},
+                headers={"Retry-After": str(concurrency.retry_after(pool))},
             )
+            return await response(scope, receive, send)
 
         region = request.query_params.get("region")
         video_url = None
         data = None
-        if request.method in ("POST", "PUT", "PATCH"):
-            try:
-                body = await request.body()
-                data = _json.loads(body)
+        if scope["method"] in ("POST", "PUT", "PATCH"):
+            data, receive = await request_body.peek_json(scope, receive)
+            if isinstance(data, dict):
                 region = region or data.get("region")
                 video_url = data.get("url")
-            except Exception:
-                pass
-        track = request.url.path.startswith(("/tools/", "/users/"))
-        entry = None
-        if track:
-            client_ip = request.headers.get("X-Forwarded-For", "").split(",")[0].strip() or (request.client.host if request.client else "-")
-            print(f"[request] {request.method} {request.url.path} | region={region or '-'} | url={video_url or '-'} | ip={client_ip}")
-            entry = monitor.request_started(request.url.path, request.method, region, video_url, req_id=id(request), payload=data, ip=client_ip)
+        if not path.startswith(("/tools/", "/users/")):
+            return await self.app(scope, receive, send)
+
+        client_ip = request.headers.get("X-Forwarded-For", "").split(",")[0].strip() or (request.client.host if request.client else "-")
+        entry = monitor.request_started(path, scope["method"], region, video_url, req_id=id(scope), payload=data, ip=client_ip)
+        _request_log.info(
+            "%s %s", scope["method"], path,
+            extra={"region": region or "-", "url": video_url or "-", "ip": client_ip},
+        )
+        spans.add("middleware", (time.perf_counter() - started) * 1000)
+
+        status_code = 500
+        error_chunks = []
+        error_len = 0
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, error_len
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body" and status_code >= 400 and error_len < ERROR_BODY_MAX:
+                chunk = message.get("body", b"")
+                error_chunks.append(chunk)
+                error_len += len(chunk)
+            await send(message)
+
         try:
-            response = await call_next(request)
-            if track:
-                error_body = None
-                if response.status_code >= 400:
-                    chunks = []
-                    async for chunk in response.body_iterator:
-                        chunks.append(chunk)
-                    raw = b"".join(chunks)
-                    error_body = raw.decode("utf-8", errors="ignore")[:1000]
-                    response = Response(
-                        content=raw,
-                        status_code=response.status_code,
-                        headers=dict(response.headers),
-                        media_type=response.media_type,
-                    )
-                monitor.request_finished(entry, response.status_code, error_body)
-            return response
-        except Exception as exc:
-            if track and entry:
-                monitor.request_finished(entry, 500)
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            monitor.request_finished(entry, 500, route=_route_template(scope))
             raise
+        finished = time.perf_counter()
+        error_body = None
+        if status_code >= 400:
+            error_body = b"".join(error_chunks).decode("utf-8", errors="ignore")[:ERROR_BODY_MAX]
+        spans.add("middleware", (time.perf_counter() - finished) * 1000)
+        monitor.request_finished(entry, status_code, error_body, route=_route_template(scope))
 
 
-class TimeoutMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class TimedJSONResponse(JSONResponse):
+    """Default response class — times rendering handler results as the "serialization" stage."""
+
+    def render(self, content) -> bytes:
+        with spans.span("serialization"):
+            return super().render(content)
+
+
+class TimeoutMiddleware:
+    """Pure ASGI — the timeout covers the handler up to the response start, not body streaming."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        response_started = False
+        deadline.start(REQUEST_TIMEOUT)
         try:
-            async with timeout(REQUEST_TIMEOUT):
-                response = await call_next(request)
-                return response
+            async with timeout(REQUEST_TIMEOUT) as timer:
+                async def send_wrapper(message: Message):
+                    nonlocal response_started
+                    if message["type"] == "http.response.start":
+                        response_started = True
+                        timer.reschedule(None)
+                    await send(message)
+
+                await self.app(scope, receive, send_wrapper)
         except asyncio.TimeoutError:
-            return JSONResponse(
+            if response_started:
+                raise
+            response = JSONResponse(
                 status_code=504,
                 content={
                     "error": "Request timeout",
@@ -86,31 +151,54 @@ class TimeoutMiddleware(BaseHTTPMiddleware):
                     "timeout": REQUEST_TIMEOUT
                 }
             )
+            await response(scope, receive, send)
         except Exception as e:
-            return JSONResponse(
+            if response_started:
+                raise
+            response = JSONResponse(
                 status_code=500,
                 content={
                     "error": "Internal server error",
                     "message": str(e)
                 }
             )
+            await response(scope, receive, send)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    executors.start()
     compress_service.start_workers()
     audio_service.start_workers()
     trim_service.start_workers()
     try:
         config.redis_client.ping()
         config.redis_client.set("monitor:active", 0)
-        print("[startup] Redis connected ✓")
+        _log.info("Redis connected")
     except Exception as e:
         raise RuntimeError(f"[startup] Redis unavailable — cannot start.")
+    try:
+        loaded = await executors.run("blocking_io", cache.load_snapshot)
+        _log.info("Cache warmed with %d entries", loaded)
+    except Exception as e:
+        _log.warning("Cache snapshot not loaded: %s", e)
+    cache.start_snapshots()
+    hot_urls.start_refresher()
+    monitor.start_flusher()
+    loop_lag.start()
+    concurrency.start()
     yield
+    await monitor.flush()
+    try:
+        saved = await executors.run("blocking_io", cache.save_snapshot)
+        _log.info("Cache snapshot saved (%d entries)", saved)
+    except Exception as e:
+        _log.warning("Cache snapshot failed: %s", e)
+    executors.shutdown()
+    log.shutdown()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=TimedJSONResponse)
 
 # Add timeout middleware
 app.add_middleware(TimeoutMiddleware)
@@ -134,18 +222,22 @@ async def root():
 @app.websocket("/ws/monitor")
 async def ws_monitor(websocket: WebSocket):
     await websocket.accept()
+    queue = monitor_broadcast.subscribe()
     try:
         while True:
-            snapshot = monitor.get_snapshot(
-                concurrency.downloads_active,
-                concurrency.downloads_queued,
-            )
-            await websocket.send_text(_json.dumps(snapshot))
-            await asyncio.sleep(1)
+            frame = await queue.get()
+            await asyncio.wait_for(websocket.send_text(frame), monitor_broadcast.SEND_TIMEOUT)
     except WebSocketDisconnect:
         pass
     except Exception:
         pass
+    finally:
+        monitor_broadcast.unsubscribe(queue)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/monitor", response_class=HTMLResponse)
@@ -216,7 +308,7 @@ MONITOR_HTML = """<!DOCTYPE html>
 
   <div class="grid grid-2" style="margin-bottom:20px;">
     <div class="card">
-      <h2>Download Slots</h2>
+      <h2>Download Slots <span class="mono" id="dl-scope" style="margin-left:6px;color:#64748b;"></span></h2>
       <div class="dl-bar" style="margin-top:10px;">
         <span class="dl-label">Active (<span id="dl-active">0</span>/<span id="dl-max">3</span>)</span>
         <div class="bar-wrap"><div class="bar-fill" id="dl-active-bar" style="width:0%"></div></div>
@@ -225,6 +317,10 @@ MONITOR_HTML = """<!DOCTYPE html>
         <span class="dl-label">Queued (<span id="dl-queued">0</span>)</span>
         <div class="bar-wrap"><div class="bar-fill warn" id="dl-queued-bar" style="width:0%"></div></div>
       </div>
+      <table style="margin-top:10px;">
+        <thead><tr><th>Pool</th><th>Active</th><th>Limit</th><th>30m</th><th>Borrowed</th><th>Queued</th><th>Lent</th></tr></thead>
+        <tbody id="dl-pools-body"></tbody>
+      </table>
     </div>
     <div class="card">
       <h2>Success Rate</h2>
@@ -252,6 +348,46 @@ MONITOR_HTML = """<!DOCTYPE html>
     </div>
   </div>
 
+  <div class="card" style="margin-top:16px;">
+    <h2>Latency <span class="mono" style="margin-left:6px;color:#64748b;">all workers · rolling 1m / 1h</span></h2>
+    <table style="margin-top:10px;">
+      <thead><tr><th>Series</th><th>1m n</th><th>p50</th><th>p95</th><th>p99</th><th>1h n</th><th>p50</th><th>p95</th><th>p99</th></tr></thead>
+      <tbody id="latency-body"><tr><td colspan="9" style="color:#64748b;text-align:center;padding:20px;">Waiting for data…</td></tr></tbody>
+    </table>
+  </div>
+
+  <div class="card" style="margin-top:16px;">
+    <h2>Event Loop <span class="mono" id="loop-summary" style="margin-left:6px;color:#64748b;"></span></h2>
+    <table style="margin-top:10px;">
+      <thead><tr><th>Lag</th><th>n</th><th>p50</th><th>p95</th><th>p99</th><th>max</th></tr></thead>
+      <tbody id="loop-lag-body"><tr><td colspan="6" style="color:#64748b;text-align:center;padding:20px;">Waiting for data…</td></tr></tbody>
+    </table>
+    <table style="margin-top:10px;">
+      <thead><tr><th>Call site</th><th>Blocked in</th><th>Stalled</th><th>Worst</th><th>Last seen</th></tr></thead>
+      <tbody id="loop-sites-body"><tr><td colspan="5" style="color:#64748b;text-align:center;padding:20px;">No stalls recorded.</td></tr></tbody>
+    </table>
+  </div>
+
+  <div class="card" style="margin-top:16px;">
+    <h2>Cache <span class="mono" id="cache-occupancy" style="margin-left:6px;"></span></h2>
+    <div class="dl-bar" style="margin-top:10px;">
+      <span class="dl-label">Memory</span>
+      <div class="bar-wrap"><div class="bar-fill" id="cache-bar" style="width:0%"></div></div>
+    </div>
+    <table style="margin-top:10px;">
+      <thead><tr><th>Namespace</th><th>Hits</th><th>L2 Hits</th><th>Misses</th><th>Hit Rate</th><th>Entries</th><th>Size</th><th>Evicted</th><th>Rejected</th></tr></thead>
+      <tbody id="cache-body"><tr><td colspan="9" style="color:#64748b;text-align:center;padding:20px;">Waiting for data…</td></tr></tbody>
+    </table>
+  </div>
+
+  <div class="card" style="margin-top:16px;">
+    <h2>Hot URLs <span class="mono" id="hot-summary" style="margin-left:6px;"></span></h2>
+    <table style="margin-top:10px;">
+      <thead><tr><th>Platform</th><th>URL</th><th>Region</th><th>Requests</th><th>Refreshed</th></tr></thead>
+      <tbody id="hot-body"><tr><td colspan="5" style="color:#64748b;text-align:center;padding:20px;">Waiting for data…</td></tr></tbody>
+    </table>
+  </div>
+
   <div class="card" style="margin-top:16px;">
     <h2>Failed Requests <span id="failed-count" style="color:#f87171;margin-left:6px;"></span></h2>
     <div id="failed-list" style="margin-top:10px;display:flex;flex-direction:column;gap:10px;">
@@ -266,13 +402,30 @@ MONITOR_HTML = """<!DOCTYPE html>
   const statusEl = document.getElementById('status');
 
   // Previous serialized snapshots for change detection
-  let _prevPaths = '', _prevRecent = '', _prevFailed = '', _prevFailedCount = -1;
+  let _prevPaths = '', _prevRecent = '', _prevFailed = '', _prevFailedCount = -1, _prevCache = '', _prevHot = '', _prevLatency = '', _prevLoop = '', _prevPools = '';
 
   ws.onopen = () => { statusEl.textContent = 'Live'; statusEl.className = ''; };
   ws.onclose = () => { statusEl.textContent = 'Disconnected'; statusEl.className = 'disconnected'; setTimeout(() => location.reload(), 3000); };
 
+  // Current snapshot: a "full" frame replaces it, "delta" frames patch it
+  let state = null;
+  const LIST_MAX = {recent: 30, failed_list: 20};  // lengths get_snapshot returns
+
   ws.onmessage = e => {
-    const d = JSON.parse(e.data);
+    const msg = JSON.parse(e.data);
+    if (msg.type === 'full') {
+      state = msg.data;
+    } else {
+      if (!state) return;
+      Object.assign(state, msg.set || {});
+      for (const [field, items] of Object.entries(msg.prepend || {})) {
+        state[field] = items.concat(state[field] || []).slice(0, LIST_MAX[field]);
+      }
+    }
+    render(state);
+  }
+
+  function render(d) {
 
     // Stat numbers — textContent only, never interrupts selection
     document.getElementById('uptime').textContent = 'Up ' + d.uptime;
@@ -287,6 +440,21 @@ MONITOR_HTML = """<!DOCTYPE html>
     document.getElementById('dl-queued').textContent = d.downloads.queued;
     document.getElementById('dl-active-bar').style.width = Math.min(100, (d.downloads.active / dlMax) * 100) + '%';
     document.getElementById('dl-queued-bar').style.width = Math.min(100, (d.downloads.queued / dlMax) * 100) + '%';
+    document.getElementById('dl-scope').textContent = d.downloads.distributed ? 'queues host-wide' : '';
+    if (d.downloads.pools) {
+      const poolsSig = JSON.stringify(d.downloads.pools);
+      if (poolsSig !== _prevPools) {
+        _prevPools = poolsSig;
+        document.getElementById('dl-pools-body').innerHTML = d.downloads.pools.map(p => {
+          const lent = p.held - (p.active - p.borrowed);
+          const q = p.host_queued != null ? p.host_queued : p.queued;
+          const tip = 'bounds ' + p.min + '–' + p.max + ' · usual ' + (p.latency_ms != null ? fmtMs(p.latency_ms) : '-') + ' · errors ' + Math.round(p.error_rate * 100) + '%';
+          return '<tr><td class="mono">' + esc(p.name) + '</td><td>' + p.active + '/' + p.size + '</td><td class="mono" title="' + tip + '">' + p.limit +
+            '</td><td>' + sparkline(p.history, p.min, p.max) + '</td><td>' + (p.borrowed || '-') +
+            '</td><td' + (q ? ' style="color:#fbbf24;"' : '') + (p.host_queued != null ? ' title="' + p.queued + ' on this worker"' : '') + '>' + q + '/' + p.queue_limit + '</td><td>' + (lent || '-') + '</td></tr>';
+        }).join('');
+      }
+    }
 
     const total = d.total_requests || 0;
     const rate = total ? Math.round((d.success_requests / total) * 100) : 100;
@@ -317,7 +485,7 @@ MONITOR_HTML = """<!DOCTYPE html>
             '<td><span class="badge method">' + esc(r.method) + '</span></td>' +
             '<td class="mono truncate" style="max-width:180px">' + esc(r.path) + '</td>' +
             '<td><span class="badge ' + (ok ? 'ok' : 'err') + '">' + (r.status || '…') + '</span></td>' +
-            '<td class="mono">' + (r.duration_ms != null ? (r.duration_ms >= 1000 ? (r.duration_ms/1000).toFixed(1)+'s' : r.duration_ms+'ms') : '…') + '</td>' +
+            '<td class="mono" title="' + esc(fmtStages(r.stages)) + '">' + (r.duration_ms != null ? (r.duration_ms >= 1000 ? (r.duration_ms/1000).toFixed(1)+'s' : r.duration_ms+'ms') : '…') + '</td>' +
             '<td class="mono">' + esc(r.region || '-') + '</td>' +
             '<td class="mono" style="color:#94a3b8;">' + esc(r.ip || '-') + '</td>' +
             '<td class="mono" style="color:#a78bfa;">' + (r.proxy_kb ? (r.proxy_kb >= 1024 ? (r.proxy_kb/1024).toFixed(1)+'MB' : r.proxy_kb+'KB') : '-') + '</td>' +
@@ -326,6 +494,78 @@ MONITOR_HTML = """<!DOCTYPE html>
       }
     }
 
+    // Latency — percentiles from the shared histograms, per path then per platform/region
+    if (d.latency) {
+      const latSig = JSON.stringify(d.latency);
+      if (latSig !== _prevLatency) {
+        _prevLatency = latSig;
+        const cells = w => '<td>' + (w.count || 0) + '</td>' + ['p50', 'p95', 'p99'].map(p => '<td class="mono">' + (w[p] != null ? fmtMs(w[p]) : '-') + '</td>').join('');
+        const section = (title, rows) => rows && rows.length
+          ? '<tr><td colspan="9" style="color:#64748b;font-size:11px;text-transform:uppercase;letter-spacing:.06em;">' + title + '</td></tr>' +
+            rows.map(r => '<tr><td class="mono truncate" style="max-width:220px">' + esc(r.name) + '</td>' + cells(r['1m']) + cells(r['1h']) + '</tr>').join('')
+          : '';
+        const html = section('Path', d.latency.path) + section('Platform / region', d.latency.platform) + section('Stage', d.latency.stage);
+        document.getElementById('latency-body').innerHTML = html || '<tr><td colspan="9" style="color:#64748b;text-align:center;padding:20px;">No requests in the last hour.</td></tr>';
+      }
+    }
+
+    // Event loop — per-worker heartbeat lag and the call sites sampled while it was blocked
+    if (d.loop_lag) {
+      const l = d.loop_lag;
+      const loopSig = JSON.stringify(l);
+      if (loopSig !== _prevLoop) {
+        _prevLoop = loopSig;
+        document.getElementById('loop-summary').textContent = 'this worker · ' + l.stalls + ' stalls over ' + l.threshold_ms + 'ms';
+        document.getElementById('loop-lag-body').innerHTML = Object.entries(l.windows).map(([name, w]) =>
+          '<tr><td class="mono">' + name + '</td><td>' + (w.count || 0) + '</td>' +
+          ['p50', 'p95', 'p99', 'max'].map(p => '<td class="mono">' + (w[p] != null ? fmtMs(w[p]) : '-') + '</td>').join('') + '</tr>'
+        ).join('');
+        document.getElementById('loop-sites-body').innerHTML = l.sites.length ? l.sites.map(s =>
+          '<tr><td class="mono truncate" style="max-width:260px" title="' + esc(s.site) + '">' + esc(s.site) +
+          '</td><td class="mono truncate" style="max-width:220px" title="' + esc(s.blocking) + '">' + esc(s.blocking) +
+          '</td><td class="mono">' + fmtMs(s.stalled_ms) + '</td><td class="mono">' + fmtMs(s.max_stall_ms) +
+          '</td><td class="mono">' + new Date(s.last_seen * 1000).toLocaleTimeString() + '</td></tr>'
+        ).join('') : '<tr><td colspan="5" style="color:#64748b;text-align:center;padding:20px;">No stalls recorded.</td></tr>';
+      }
+    }
+
+    // Cache — per-worker occupancy and per-namespace counters
+    if (d.cache) {
+      const c = d.cache.extractor;
+      const cacheSig = JSON.stringify(c);
+      if (cacheSig !== _prevCache) {
+        _prevCache = cacheSig;
+        document.getElementById('cache-occupancy').textContent =
+          c.entries + ' entries · ' + fmtBytes(c.bytes) + (c.max_bytes ? ' / ' + fmtBytes(c.max_bytes) : '');
+        document.getElementById('cache-bar').style.width = (c.max_bytes ? Math.min(100, (c.bytes / c.max_bytes) * 100) : 0) + '%';
+        const rows = Object.entries(c.namespaces).sort((a, b) => b[1].bytes - a[1].bytes);
+        document.getElementById('cache-body').innerHTML = rows.length ? rows.map(([ns, s]) => {
+          const lookups = s.hits + s.misses;
+          const rate = lookups ? Math.round(((s.hits + (s.l2_hits || 0)) / lookups) * 100) + '%' : '-';
+          return '<tr><td class="mono">' + esc(ns) + '</td><td>' + s.hits + '</td><td>' + (s.l2_hits || 0) + '</td><td>' + s.misses +
+            '</td><td>' + rate + '</td><td>' + s.entries + '</td><td class="mono">' + fmtBytes(s.bytes) +
+            '</td><td>' + s.evictions + '</td><td>' + s.rejected + '</td></tr>';
+        }).join('') : '<tr><td colspan="9" style="color:#64748b;text-align:center;padding:20px;">Cache is empty.</td></tr>';
+      }
+    }
+
+    // Hot URLs — per-worker heavy hitters and proactive refreshes
+    if (d.hot_urls) {
+      const h = d.hot_urls;
+      const hotSig = JSON.stringify(h);
+      if (hotSig !== _prevHot) {
+        _prevHot = hotSig;
+        document.getElementById('hot-summary').textContent =
+          h.tracked + ' tracked · ' + h.refreshes + ' refreshes · ' + h.budget_used_mb + ' / ' + h.budget_mb + 'MB proxy this hour';
+        document.getElementById('hot-body').innerHTML = h.top.length ? h.top.map(i => {
+          const count = i.error ? i.count + ' <span style="color:#64748b;">(±' + i.error + ')</span>' : i.count;
+          const refreshed = i.refreshed_at ? new Date(i.refreshed_at * 1000).toLocaleTimeString() : '-';
+          return '<tr><td class="mono">' + esc(i.platform) + '</td><td class="mono truncate" style="max-width:260px">' + esc(i.url) +
+            '</td><td class="mono">' + esc(i.region || '-') + '</td><td>' + count + '</td><td class="mono">' + refreshed + '</td></tr>';
+        }).join('') : '<tr><td colspan="5" style="color:#64748b;text-align:center;padding:20px;">No requests yet.</td></tr>';
+      }
+    }
+
     // Failed list — only rebuild when count changes (preserves open <details> and selected text)
     const failedCount = d.failed_list ? d.failed_list.length : 0;
     document.getElementById('failed-count').textContent = failedCount ? '(' + failedCount + ')' : '';
@@ -345,6 +585,8 @@ MONITOR_HTML = """<!DOCTYPE html>
               '<span class="mono" style="color:#64748b;margin-left:auto;">' + ts + ' &bull; ' + esc(f.region || '-') + ' &bull; ' + esc(f.ip || '-') + (f.proxy_kb ? ' &bull; <span style=\"color:#a78bfa;\">' + (f.proxy_kb >= 1024 ? (f.proxy_kb/1024).toFixed(1)+'MB' : f.proxy_kb+'KB') + '</span>' : '') + ' &bull; ' + (f.duration_ms != null ? (f.duration_ms >= 1000 ? (f.duration_ms/1000).toFixed(1)+'s' : f.duration_ms+'ms') : '') + '</span>' +
             '</div>' +
             (f.url && f.url !== '-' ? '<div style="font-size:12px;color:#94a3b8;margin-bottom:6px;">URL: <span class="mono">' + esc(f.url) + '</span></div>' : '') +
+            (f.request_id ? '<div style="font-size:12px;color:#94a3b8;margin-bottom:6px;">Request ID: <span class="mono">' + esc(f.request_id) + '</span></div>' : '') +
+            (f.stages && Object.keys(f.stages).length ? '<div style="font-size:12px;color:#94a3b8;margin-bottom:6px;">Stages: <span class="mono">' + esc(fmtStages(f.stages)) + '</span></div>' : '') +
             (payload ? '<details style="margin-bottom:6px;"><summary style="cursor:pointer;font-size:11px;color:#64748b;text-transform:uppercase;letter-spacing:.06em;">Payload</summary><pre style="margin-top:6px;background:#0f1117;border-radius:6px;padding:10px;font-size:11px;overflow-x:auto;color:#a78bfa;">' + esc(payload) + '</pre></details>' : '') +
             (error ? '<details open><summary style="cursor:pointer;font-size:11px;color:#64748b;text-transform:uppercase;letter-spacing:.06em;">Error</summary><pre style="margin-top:6px;background:#0f1117;border-radius:6px;padding:10px;font-size:11px;overflow-x:auto;color:#f87171;">' + esc(error) + '</pre></details>' : '') +
             '</div>';
@@ -355,6 +597,32 @@ MONITOR_HTML = """<!DOCTYPE html>
     }
   };
 
+  // "slot_wait 1.2s · extract_info 830ms", slowest stage first
+  function fmtStages(stages) {
+    return Object.entries(stages || {}).sort((a, b) => b[1] - a[1]).map(([s, ms]) => s + ' ' + fmtMs(Math.round(ms))).join(' · ');
+  }
+
+  // Step line of [ts, value] points scaled between lo and hi
+  function sparkline(points, lo, hi) {
+    if (!points || !points.length) return '';
+    const w = 80, h = 16, t0 = points[0][0], span = Math.max(1, points[points.length - 1][0] - t0), range = Math.max(1, hi - lo);
+    const y = v => (h - 1 - ((v - lo) / range) * (h - 2)).toFixed(1);
+    let d = 'M0,' + y(points[0][1]);
+    points.forEach(([t, v]) => { d += ' H' + (((t - t0) / span) * w).toFixed(1) + ' V' + y(v); });
+    d += ' H' + w;
+    return '<svg width="' + w + '" height="' + h + '"><path d="' + d + '" fill="none" stroke="#a78bfa" stroke-width="1.5"/></svg>';
+  }
+
+  function fmtMs(ms) {
+    return ms >= 1000 ? (ms / 1000).toFixed(1) + 's' : ms + 'ms';
+  }
+
+  function fmtBytes(b) {
+    if (b >= 1048576) return (b / 1048576).toFixed(1) + 'MB';
+    if (b >= 1024) return (b / 1024).toFixed(1) + 'KB';
+    return b + 'B';
+  }
+
   function esc(s) {
     return String(s).replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;');
   }